@@ -1,19 +1,59 @@
 # vehicle_type
 from enum import Enum
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Callable, Tuple
 from abc import ABC, abstractmethod
+import heapq
+import threading
+from array import array
 
 class VehicleType(Enum):
     CAR = 1
     BIKE = 2
     TRUCK = 3
 
+# clock - everything that needs "now" asks the active clock, so simulations and
+# log replays can run the lot on virtual time
+class Clock:
+    _active: 'Clock' = None
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    @staticmethod
+    def use(clock: 'Clock'):
+        Clock._active = clock
+
+    @staticmethod
+    def get() -> 'Clock':
+        return Clock._active
+
+# virtual clock - time only moves when told to
+class VirtualClock(Clock):
+    def __init__(self, start: datetime = None):
+        self.current = start if start else datetime(2024, 1, 1)
+
+    def now(self) -> datetime:
+        return self.current
+
+    def advance(self, delta: timedelta):
+        self.current += delta
+
+    def set(self, moment: datetime):
+        self.current = moment
+
+Clock.use(Clock())
+
+def current_time() -> datetime:
+    return Clock._active.now()
+
 # Payment class
 class Payment:
+    __slots__ = ('amount', 'payment_date', 'is_completed')
+
     def __init__(self, amount: float, payment_date: datetime = None):
         self.amount = amount
-        self.payment_date = payment_date or datetime.now()
+        self.payment_date = payment_date or current_time()
         self.is_completed = False
     
     def complete_payment(self):
@@ -32,17 +72,73 @@ class PaymentStrategy(ABC):
     def calculate_payment(self, vehicle_type: VehicleType, duration_hours: float) -> float:
         pass
 
-# Standard payment strategy
+    # Fee for a stay from its entry/exit times. Flat strategies only need the
+    # duration; time-of-day tariffs override this.
+    def calculate_stay_payment(self, vehicle_type: VehicleType, entry_time: datetime, exit_time: datetime) -> float:
+        return self.calculate_payment(vehicle_type, (exit_time - entry_time).total_seconds() / 3600)
+
+# Standard payment strategy - flat hourly rate per vehicle type
 class StandardPaymentStrategy(PaymentStrategy):
+    RATES = {
+        VehicleType.BIKE: 1.0,  # $1 per hour
+        VehicleType.CAR: 2.0,   # $2 per hour
+        VehicleType.TRUCK: 3.0  # $3 per hour
+    }
+    DEFAULT_RATE = 2.0  # Default to car rate if type not found
+
+    def get_hourly_rate(self, vehicle_type: VehicleType) -> float:
+        return self.RATES.get(vehicle_type, self.DEFAULT_RATE)
+
     def calculate_payment(self, vehicle_type: VehicleType, duration_hours: float) -> float:
-        rates = {
-            VehicleType.BIKE: 1.0,  # $1 per hour
-            VehicleType.CAR: 2.0,   # $2 per hour
-            VehicleType.TRUCK: 3.0  # $3 per hour
-        }
-        
-        hourly_rate = rates.get(vehicle_type, 2.0)  # Default to car rate if type not found
-        return hourly_rate * duration_hours
+        return self.get_hourly_rate(vehicle_type) * duration_hours
+
+# Time-of-day tariff - hourly rates that vary over the week (peak, off-peak, overnight...).
+# Each vehicle type has 168 hourly rates starting Monday 00:00. A prefix sum over the
+# week gives the cumulative cost from a fixed Monday up to any instant, so the fee
+# for a stay of any length is cost(exit) - cost(entry): two lookups and a subtraction.
+# Times are naive local datetimes; DST shifts are not modelled.
+class TariffPaymentStrategy(PaymentStrategy):
+    HOURS_PER_WEEK = 168
+    ANCHOR = datetime(2024, 1, 1)  # a Monday 00:00
+
+    def __init__(self, weekly_rates: Dict[VehicleType, List[float]], default_type: VehicleType = VehicleType.CAR):
+        self.weekly_rates: Dict[VehicleType, List[float]] = {}
+        self.cumulative: Dict[VehicleType, List[float]] = {}
+        for vehicle_type, rates in weekly_rates.items():
+            if len(rates) != self.HOURS_PER_WEEK:
+                raise ValueError(f"Expected {self.HOURS_PER_WEEK} hourly rates for {vehicle_type}, got {len(rates)}")
+            cumulative = [0.0]
+            for rate in rates:
+                cumulative.append(cumulative[-1] + rate)
+            self.weekly_rates[vehicle_type] = list(rates)
+            self.cumulative[vehicle_type] = cumulative
+        self.default_type = default_type
+
+    # 168 hourly rates from one 24-hour pattern for weekdays and (optionally) another for weekends
+    @staticmethod
+    def weekly_calendar(weekday_hours: List[float], weekend_hours: List[float] = None) -> List[float]:
+        if len(weekday_hours) != 24 or (weekend_hours is not None and len(weekend_hours) != 24):
+            raise ValueError("Daily patterns need 24 hourly rates")
+        weekend_hours = weekend_hours if weekend_hours is not None else weekday_hours
+        return list(weekday_hours) * 5 + list(weekend_hours) * 2
+
+    # cumulative cost from ANCHOR up to moment
+    def cost_until(self, vehicle_type: VehicleType, moment: datetime) -> float:
+        if vehicle_type not in self.cumulative:
+            vehicle_type = self.default_type
+        cumulative = self.cumulative[vehicle_type]
+        weeks, hour_of_week = divmod((moment - self.ANCHOR).total_seconds() / 3600, self.HOURS_PER_WEEK)
+        hour = int(hour_of_week)
+        return (weeks * cumulative[-1] + cumulative[hour]
+                + (hour_of_week - hour) * self.weekly_rates[vehicle_type][hour])
+
+    def calculate_stay_payment(self, vehicle_type: VehicleType, entry_time: datetime, exit_time: datetime) -> float:
+        return self.cost_until(vehicle_type, exit_time) - self.cost_until(vehicle_type, entry_time)
+
+    # without entry/exit times, price the stay as ending now
+    def calculate_payment(self, vehicle_type: VehicleType, duration_hours: float) -> float:
+        now = current_time()
+        return self.calculate_stay_payment(vehicle_type, now - timedelta(hours=duration_hours), now)
 
 # factory vehicle
 class FactoryVehicle():
@@ -59,6 +155,8 @@ class FactoryVehicle():
 
 # vehicle
 class Vehicle(ABC):
+    __slots__ = ('license', 'vehicle_type')
+
     def __init__(self, license, vehicle_type):
         self.license = license
         self.vehicle_type = vehicle_type
@@ -71,35 +169,43 @@ class Vehicle(ABC):
 
 # car
 class Car(Vehicle):
+    __slots__ = ()
+
     def __init__(self, license, vehicle_type):
         super().__init__(license, vehicle_type)
     
 # bike
 class Bike(Vehicle):
+    __slots__ = ()
+
     def __init__(self, license, vehicle_type):
         super().__init__(license, vehicle_type)
 
 # truck
 class Truck(Vehicle):
+    __slots__ = ()
+
     def __init__(self, license, vehicle_type):
         super().__init__(license, vehicle_type)
 
 # parking record - to track parking duration for payment calculation
 class ParkingRecord:
+    __slots__ = ('vehicle', 'spot', 'entry_time', 'exit_time', 'payment')
+
     def __init__(self, vehicle: Vehicle, spot: 'ParkingSpot'):
         self.vehicle = vehicle
         self.spot = spot
-        self.entry_time = datetime.now()
+        self.entry_time = current_time()
         self.exit_time = None
         self.payment = None
     
     def exit(self):
-        self.exit_time = datetime.now()
+        self.exit_time = current_time()
     
     def get_duration_hours(self) -> float:
         if self.exit_time is None:
             # Still parked, calculate duration until now
-            duration = datetime.now() - self.entry_time
+            duration = current_time() - self.entry_time
         else:
             duration = self.exit_time - self.entry_time
             
@@ -113,11 +219,24 @@ class ParkingRecord:
     def is_payment_completed(self) -> bool:
         return self.payment is not None and self.payment.is_payment_completed()
 
+# spot observer - anything that has to stay in sync with a level's spots (e.g. free-spot indexes)
+class SpotObserver(ABC):
+    @abstractmethod
+    def on_spot_parked(self, spot: 'ParkingSpot'):
+        pass
+
+    @abstractmethod
+    def on_spot_unparked(self, spot: 'ParkingSpot'):
+        pass
+
 # parking spot
 class ParkingSpot:
-    def __init__(self, level_id, spot_id):
+    __slots__ = ('level_id', 'id', 'level', 'availability', 'vehicle', 'parking_record')
+
+    def __init__(self, level_id, spot_id, level: 'Level' = None):
         self.level_id = level_id
         self.id = spot_id
+        self.level = level
         self.availability = True
         self.vehicle = None
         self.parking_record = None
@@ -125,25 +244,45 @@ class ParkingSpot:
     def get_availability(self):
         return self.availability
 
+    # park/unpark are atomic per level, so two gates can't claim the same spot
     def park(self, vehicle: Vehicle) -> Optional[ParkingRecord]:
+        if self.level is None:
+            return self.claim(vehicle)
+        with self.level.lock:
+            return self.claim(vehicle)
+
+    def unpark(self) -> Optional[ParkingRecord]:
+        if self.level is None:
+            return self.release()
+        with self.level.lock:
+            return self.release()
+
+    # check-then-set part of park - caller holds the level lock
+    def claim(self, vehicle: Vehicle) -> Optional[ParkingRecord]:
         if self.availability:
             self.vehicle = vehicle
             self.availability = False
             # Create parking record
             self.parking_record = ParkingRecord(vehicle, self)
+            if self.level is not None:
+                self.level.notify_parked(self, vehicle)
             return self.parking_record
         return None
     
-    def unpark(self) -> Optional[ParkingRecord]:
+    # check-then-reset part of unpark - caller holds the level lock
+    def release(self) -> Optional[ParkingRecord]:
         if not self.availability and self.vehicle is not None and self.parking_record is not None:
             # Record exit time
             self.parking_record.exit()
             record = self.parking_record
+            vehicle = self.vehicle
             
             # Reset spot
             self.vehicle = None
             self.parking_record = None
             self.availability = True
+            if self.level is not None:
+                self.level.notify_unparked(self, vehicle)
             
             return record
         return None
@@ -155,118 +294,552 @@ class ParkingSpot:
 class Level:
     def __init__(self, id, num_of_spots):
         self.id = id
-        self.spots: List[ParkingSpot] = [ParkingSpot(id, i) for i in range(num_of_spots)]
+        self.spots: List[ParkingSpot] = [ParkingSpot(id, i, self) for i in range(num_of_spots)]
+        self.observers: List[SpotObserver] = []
+        # guards the spots and the observers' indexes; re-entrant so a strategy can
+        # hold it across picking a spot and parking in it
+        self.lock = threading.RLock()
+        self.init_counters(num_of_spots)
+
+    # Occupancy counters, kept up to date on every park/unpark so summaries are O(1).
+    # Only written under the lock, read without it.
+    def init_counters(self, num_of_spots):
+        self.free_count = num_of_spots
+        self.parked_by_type = [0] * (max(t.value for t in VehicleType) + 1)  # indexed by VehicleType.value
 
     def get_spot_count(self):
         return len(self.spots)
 
     def get_spots(self):
         return self.spots
+
+    def get_free_count(self):
+        return self.free_count
+
+    def get_parked_count(self, vehicle_type: VehicleType) -> int:
+        return self.parked_by_type[vehicle_type.value]
+
+    # Spots here take any vehicle type, so every free spot is free for every type
+    def availability_summary(self) -> Dict[str, object]:
+        return {
+            "level": self.id,
+            "spots": self.get_spot_count(),
+            "free": self.free_count,
+            "parked_by_type": {t: self.parked_by_type[t.value] for t in VehicleType},
+        }
+
+    def is_spot_free(self, spot_id: int) -> bool:
+        return self.spots[spot_id].availability
     
-    # Find a spot by ID
+    # Find a spot by ID - spot ids are the positions in the level
     def find_spot_by_id(self, spot_id: int) -> Optional[ParkingSpot]:
-        for spot in self.spots:
-            if spot.id == spot_id:
-                return spot
+        if 0 <= spot_id < len(self.spots):
+            return self.spots[spot_id]
         return None
 
+    def add_observer(self, observer: SpotObserver):
+        self.observers.append(observer)
+
+    def remove_observer(self, observer: SpotObserver):
+        self.observers.remove(observer)
+
+    def notify_parked(self, spot: ParkingSpot, vehicle: Vehicle):
+        self.free_count -= 1
+        self.parked_by_type[vehicle.get_vehicle_type().value] += 1
+        for observer in self.observers:
+            observer.on_spot_parked(spot)
+
+    def notify_unparked(self, spot: ParkingSpot, vehicle: Vehicle):
+        self.free_count += 1
+        self.parked_by_type[vehicle.get_vehicle_type().value] -= 1
+        for observer in self.observers:
+            observer.on_spot_unparked(spot)
+
+# spot view over a CompactLevel - no state of its own, every field reads/writes the level's arrays
+class CompactParkingSpot(ParkingSpot):
+    __slots__ = ()
+
+    def __init__(self, level: 'CompactLevel', spot_id: int):
+        self.level_id = level.id
+        self.id = spot_id
+        self.level = level
+
+    @property
+    def availability(self):
+        return not self.level.occupancy[self.id]
+
+    @availability.setter
+    def availability(self, available):
+        self.level.occupancy[self.id] = 0 if available else 1
+
+    @property
+    def vehicle(self):
+        record = self.parking_record
+        return record.vehicle if record is not None else None
+
+    @vehicle.setter
+    def vehicle(self, vehicle):
+        self.level.vehicle_types[self.id] = vehicle.get_vehicle_type().value if vehicle is not None else 0
+
+    @property
+    def parking_record(self):
+        slot = self.level.record_slots[self.id]
+        return self.level.records[slot] if slot >= 0 else None
+
+    @parking_record.setter
+    def parking_record(self, record):
+        self.level.set_record(self.id, record)
+
+# read-only sequence of spot views, so code written against Level.get_spots() keeps working
+class CompactSpotViews:
+    def __init__(self, level: 'CompactLevel'):
+        self.level = level
+
+    def __len__(self):
+        return self.level.spot_count
+
+    def __getitem__(self, spot_id: int) -> CompactParkingSpot:
+        if not 0 <= spot_id < self.level.spot_count:
+            raise IndexError(spot_id)
+        return CompactParkingSpot(self.level, spot_id)
+
+    def __iter__(self):
+        for spot_id in range(self.level.spot_count):
+            yield CompactParkingSpot(self.level, spot_id)
+
+# compact level - for very large deployments. Spot state lives in typed arrays
+# (about 6 bytes per spot) instead of one ParkingSpot object per spot; only open
+# sessions hold Python objects. ParkingSpot views are created on demand.
+class CompactLevel(Level):
+    def __init__(self, id, num_of_spots):
+        self.id = id
+        self.spot_count = num_of_spots
+        self.occupancy = bytearray(num_of_spots)  # 1 = occupied
+        self.vehicle_types = bytearray(num_of_spots)  # VehicleType.value of the parked vehicle, 0 = empty
+        self.record_slots = array('i', [-1]) * num_of_spots  # index into records, -1 = no record
+        self.records: List[Optional[ParkingRecord]] = []  # open records; slots are reused
+        self.free_slots: List[int] = []
+        self.observers: List[SpotObserver] = []
+        self.lock = threading.RLock()
+        self.init_counters(num_of_spots)
+
+    def get_spot_count(self):
+        return self.spot_count
+
+    def get_spots(self):
+        return CompactSpotViews(self)
+
+    def is_spot_free(self, spot_id: int) -> bool:
+        return not self.occupancy[spot_id]
+
+    def find_spot_by_id(self, spot_id: int) -> Optional[ParkingSpot]:
+        if 0 <= spot_id < self.spot_count:
+            return CompactParkingSpot(self, spot_id)
+        return None
+
+    def set_record(self, spot_id: int, record: Optional[ParkingRecord]):
+        slot = self.record_slots[spot_id]
+        if record is None:
+            if slot >= 0:
+                self.records[slot] = None
+                self.free_slots.append(slot)
+                self.record_slots[spot_id] = -1
+            return
+        if slot < 0:
+            if self.free_slots:
+                slot = self.free_slots.pop()
+            else:
+                slot = len(self.records)
+                self.records.append(None)
+            self.record_slots[spot_id] = slot
+        self.records[slot] = record
+
 # strategy to park
 class StrategyPark(ABC):
+    spots_examined = 0  # how many spots the strategy looked at - a cost measure for comparisons
+    # optional spot_filter(spot, vehicle) -> bool; walk-ins skip free spots it rejects
+    # (e.g. spots held for an upcoming reservation)
+    spot_filter: Optional[Callable[['ParkingSpot', 'Vehicle'], bool]] = None
+
     @abstractmethod
     def park(self, vehicle, levels):
         pass
 
+    def accepts(self, spot: 'ParkingSpot', vehicle) -> bool:
+        return self.spot_filter is None or self.spot_filter(spot, vehicle)
+
 # This strategy is to park floor wise from first available spot
 class StrategyParkFirst(StrategyPark):
     def park(self, vehicle, levels: List[Level]):
         for level in levels:
             for spot in level.get_spots():
-                if spot.get_availability():
+                self.spots_examined += 1
+                if spot.get_availability() and self.accepts(spot, vehicle):
                     record = spot.park(vehicle)
                     if record:
                         return record
         return None
 
-# parking system
-class ParkingSystem:
-    _instance = None
-    
-    def __new__(cls, *args, **kwargs):
-        if cls._instance is None:
-            cls._instance = super(ParkingSystem, cls).__new__(cls)
-        return cls._instance
+# free-spot index for one level - a min-heap of free spots ordered by rank.
+# order is a precomputed list of spot ids (best first, None = by spot id); the heap
+# holds positions in that order, so pushes and pops are O(log n). Spots that get
+# parked outside the index (e.g. by another strategy) stay in the heap and are
+# dropped lazily on pop.
+class LevelSpotIndex(SpotObserver):
+    def __init__(self, level: Level, order: Optional[List[int]] = None):
+        self.level = level
+        count = level.get_spot_count()
+        self.count = count
+        self.order = self.position = None
+        if order is not None:
+            self.order = array('i', order)
+            self.position = array('i', bytes(4 * count))
+            for pos, spot_id in enumerate(order):
+                self.position[spot_id] = pos
+
+        # positions are generated in increasing order, so the list is already a heap
+        self.heap = [pos for pos in range(count) if level.is_spot_free(self.spot_at(pos))]
+        self.in_heap = bytearray(count)
+        for pos in self.heap:
+            self.in_heap[self.spot_at(pos)] = 1
+        self.free_count = len(self.heap)
+        self.examined = 0
+
+    def spot_at(self, pos: int) -> int:
+        return self.order[pos] if self.order is not None else pos
+
+    def position_of(self, spot_id: int) -> int:
+        return self.position[spot_id] if self.position is not None else spot_id
+
+    def get_free_count(self):
+        return self.free_count
+
+    def get_occupied_count(self):
+        return self.count - self.free_count
+
+    # best free spot without removing it, None if the level is full
+    def peek(self) -> Optional[ParkingSpot]:
+        while self.heap:
+            spot_id = self.spot_at(self.heap[0])
+            self.examined += 1
+            if self.level.is_spot_free(spot_id):
+                return self.level.find_spot_by_id(spot_id)
+            heapq.heappop(self.heap)
+            self.in_heap[spot_id] = 0
+        return None
+
+    def pop(self) -> Optional[ParkingSpot]:
+        spot = self.peek()
+        if spot is not None:
+            heapq.heappop(self.heap)
+            self.in_heap[spot.id] = 0
+        return spot
+
+    # put a free spot (back) into the heap
+    def push(self, spot_id: int):
+        if not self.in_heap[spot_id]:
+            heapq.heappush(self.heap, self.position_of(spot_id))
+            self.in_heap[spot_id] = 1
+
+    def on_spot_parked(self, spot: ParkingSpot):
+        self.free_count -= 1
+
+    def on_spot_unparked(self, spot: ParkingSpot):
+        self.free_count += 1
+        self.push(spot.id)
+
+# Base for strategies backed by per-level free-spot indexes instead of a scan.
+# Levels added to the system later are picked up on the next park call.
+# Each index is only touched under its level's lock, and levels are chosen from
+# their free counters without locking, so gates on different levels don't block each other.
+class StrategyParkIndexed(StrategyPark):
+    def __init__(self):
+        self.indexes: List[LevelSpotIndex] = []
+        self.sync_lock = threading.Lock()
+
+    @property
+    def spots_examined(self):
+        return sum(index.examined for index in self.indexes)
+
+    # spot ids of a level, best first - override to change the order inside a level
+    def spot_order(self, level: Level) -> Optional[List[int]]:
+        return None
+
+    # pick the level index to allocate from, None if everything is full.
+    # Indexes in exclude had no usable spot on this park call.
+    @abstractmethod
+    def choose_index(self, exclude=()) -> Optional[LevelSpotIndex]:
+        pass
+
+    def sync_levels(self, levels: List[Level]):
+        if len(self.indexes) == len(levels):
+            return
+        with self.sync_lock:
+            for level in levels[len(self.indexes):]:
+                with level.lock:
+                    index = LevelSpotIndex(level, self.spot_order(level))
+                    level.add_observer(index)
+                self.indexes.append(index)
+
+    # stop listening to the levels, e.g. when the system switches strategy
+    def detach(self):
+        for index in self.indexes:
+            index.level.remove_observer(index)
+        self.indexes = []
+
+    def park(self, vehicle, levels: List[Level]):
+        self.sync_levels(levels)
+        exhausted = set()
+        while True:
+            index = self.choose_index(exhausted)
+            if index is None:
+                return None
+            with index.level.lock:
+                spot = self.pop_accepted(index, vehicle)
+                if spot is not None:
+                    return spot.park(vehicle)
+            # another gate took the last free spot of that level, or the filter
+            # rejected all of them - choose again
+            exhausted.add(index)
+
+    # best free spot the filter accepts; rejected spots go back into the heap
+    def pop_accepted(self, index: LevelSpotIndex, vehicle) -> Optional[ParkingSpot]:
+        spot = index.pop()
+        if self.spot_filter is None:
+            return spot
+        rejected = []
+        while spot is not None and not self.spot_filter(spot, vehicle):
+            rejected.append(spot.id)
+            spot = index.pop()
+        for spot_id in rejected:
+            index.push(spot_id)
+        return spot
+
+# Same allocation as StrategyParkFirst (lowest level, lowest spot id) without the scan
+class StrategyParkFirstFit(StrategyParkIndexed):
+    def choose_index(self, exclude=()) -> Optional[LevelSpotIndex]:
+        for index in self.indexes:
+            if index.get_free_count() > 0 and index not in exclude:
+                return index
+        return None
+
+# Park at the free spot closest to the entrance. distance(level_id, spot_id) is
+# evaluated once per spot when a level is indexed; by default every level up
+# costs level_distance and spots are numbered outwards from the ramp.
+class StrategyParkNearest(StrategyParkIndexed):
+    def __init__(self, distance: Callable[[int, int], float] = None, level_distance: float = 100.0):
+        super().__init__()
+        self.distance = distance if distance else (lambda level_id, spot_id: level_id * level_distance + spot_id)
+
+    def spot_order(self, level: Level) -> Optional[List[int]]:
+        return sorted(range(level.get_spot_count()), key=lambda spot_id: self.distance(level.id, spot_id))
+
+    def choose_index(self, exclude=()) -> Optional[LevelSpotIndex]:
+        best, best_distance = None, None
+        for index in self.indexes:
+            if index in exclude:
+                continue
+            with index.level.lock:  # peek drops stale heap entries, so it is a write
+                spot = index.peek()
+            if spot is None:
+                continue
+            spot_distance = self.distance(index.level.id, spot.id)
+            if best is None or spot_distance < best_distance:
+                best, best_distance = index, spot_distance
+        return best
+
+# Spread vehicles across levels - park on the level with the lowest occupancy ratio
+class StrategyParkBalanced(StrategyParkIndexed):
+    def choose_index(self, exclude=()) -> Optional[LevelSpotIndex]:
+        best, best_ratio = None, None
+        for index in self.indexes:
+            if index.get_free_count() == 0 or index in exclude:
+                continue
+            ratio = index.get_occupied_count() / index.level.get_spot_count()
+            if best is None or ratio < best_ratio:
+                best, best_ratio = index, ratio
+        return best
+
+# parking event observer - persistence, indexes and the like hear about every session change.
+# Park/unpark events fire under the spot's level lock, so they arrive in order per spot.
+class ParkingEventObserver:
+    def on_level_added(self, level: Level):
+        pass
+
+    def on_park(self, record: ParkingRecord):
+        pass
+
+    def on_unpark(self, record: ParkingRecord):
+        pass
+
+    def on_payment(self, record: ParkingRecord):
+        pass
+
+# Opens the system's session from inside every spot claim on its levels, i.e.
+# under the level lock that claims the spot - so an unpark of that spot can't
+# run before the session exists.
+class SessionOpener(SpotObserver):
+    def __init__(self, parking_system: 'ParkingLotSystem'):
+        self.parking_system = parking_system
 
+    def on_spot_parked(self, spot: ParkingSpot):
+        self.parking_system.open_session(spot.get_parking_record())
+
+    def on_spot_unparked(self, spot: ParkingSpot):
+        pass  # close_session drops the session under the same lock
+
+# parking lot system - one independent lot. ParkingSystem below is the process-wide
+# singleton; benchmarks and multi-lot setups create ParkingLotSystem directly.
+# Safe to drive from many gate threads: spot claims lock only the spot's level.
+class ParkingLotSystem:
     def __init__(self, 
                  strategy_to_park=None, 
-                 payment_strategy=None):
+                 payment_strategy=None,
+                 level_class=None):
         # Only initialize if not already initialized
         if not hasattr(self, 'initialized'):
             self.levels: List[Level] = []
-            self.strategy_to_park = strategy_to_park if strategy_to_park else StrategyParkFirst()
+            self.level_class = level_class if level_class else Level  # CompactLevel for huge lots
+            self.strategy_to_park = strategy_to_park if strategy_to_park else StrategyParkFirstFit()
             self.payment_strategy = payment_strategy if payment_strategy else StandardPaymentStrategy()
             self.parking_records: Dict[str, List[ParkingRecord]] = {}  # License -> records
+            # Open sessions only, so exits don't depend on how long a license's history is
+            self.active_records: Dict[str, List[ParkingRecord]] = {}  # License -> open records, oldest first
+            self.occupied_spots: Dict[Tuple[int, int], ParkingSpot] = {}  # (level, spot) -> spot
+            self.history_archive = None  # closed records move here on archive_closed_records()
+            self.permit_registry = None  # permit holders (parking_permits.py) park for free
+            self.records_lock = threading.Lock()  # guards the per-license history lists
+            self.levels_lock = threading.Lock()  # one add_level at a time, with its on_level_added events
+            # guards active_records/occupied_spots, which all levels share; taken inside a level lock
+            self.sessions_lock = threading.Lock()
+            self.session_opener = SessionOpener(self)
+            self.event_observers: List[ParkingEventObserver] = []
             self.initialized = True
     
     def add_level(self, num_of_spots):
-        self.levels.append(Level(len(self.levels), num_of_spots))
-        return len(self.levels) - 1  # Return the level ID
+        with self.levels_lock:
+            level = self.level_class(len(self.levels), num_of_spots)
+            level.add_observer(self.session_opener)
+            self.levels.append(level)
+            for observer in self.event_observers:
+                observer.on_level_added(level)
+            return level.id
+
+    def add_event_observer(self, observer: ParkingEventObserver):
+        self.event_observers.append(observer)
+
+    def remove_event_observer(self, observer: ParkingEventObserver):
+        self.event_observers.remove(observer)
+
+    def notify_payment(self, record: ParkingRecord):
+        for observer in self.event_observers:
+            observer.on_payment(record)
     
     def set_strategy_for_parking(self, strategy):
+        if isinstance(self.strategy_to_park, StrategyParkIndexed):
+            self.strategy_to_park.detach()
+        strategy.spot_filter = self.strategy_to_park.spot_filter
         self.strategy_to_park = strategy
+
+    # spot_filter(spot, vehicle) -> bool, consulted by walk-in park() only (not park_at)
+    def set_walk_in_filter(self, spot_filter):
+        self.strategy_to_park.spot_filter = spot_filter
     
     def set_payment_strategy(self, payment_strategy):
         self.payment_strategy = payment_strategy
+
+    # archive is a ParkingHistoryArchive (parking_history.py) or anything with the same methods
+    def set_history_archive(self, history_archive):
+        self.history_archive = history_archive
+
+    # registry is a PermitRegistry (parking_permits.py) or anything with is_permit_holder(license)
+    def set_permit_registry(self, permit_registry):
+        self.permit_registry = permit_registry
     
     def park(self, vehicle: Vehicle) -> Optional[ParkingRecord]:
-        # Attempt to park the vehicle
-        record = self.strategy_to_park.park(vehicle, self.levels)
-        
-        # If parked successfully, store the record
-        if record:
-            license = vehicle.get_license_number()
-            if license not in self.parking_records:
-                self.parking_records[license] = []
-            self.parking_records[license].append(record)
-            
-        return record
+        # Attempt to park the vehicle; the session is opened inside the claim (SessionOpener)
+        return self.strategy_to_park.park(vehicle, self.levels)
+
+    # Park in one specific spot, bypassing the strategy (restores, reserved spots)
+    def park_at(self, vehicle: Vehicle, level_id: int, spot_id: int) -> Optional[ParkingRecord]:
+        if not 0 <= level_id < len(self.levels):
+            return None
+        spot = self.levels[level_id].find_spot_by_id(spot_id)
+        return spot.park(vehicle) if spot is not None else None
+
+    # called by SessionOpener while the claiming thread holds the spot's level lock
+    def open_session(self, record: ParkingRecord):
+        license = record.vehicle.get_license_number()
+        with self.records_lock:
+            self.parking_records.setdefault(license, []).append(record)
+        with self.sessions_lock:
+            self.active_records.setdefault(license, []).append(record)
+            self.occupied_spots[(record.spot.level_id, record.spot.id)] = record.spot
+        for observer in self.event_observers:
+            observer.on_park(record)
     
     def unpark(self, level_id: int, spot_id: int) -> Optional[ParkingRecord]:
-        # Find the level
-        if level_id < 0 or level_id >= len(self.levels):
+        spot = self.occupied_spots.get((level_id, spot_id))
+        if spot is None:
             return None
-        
-        level = self.levels[level_id]
-        spot = level.find_spot_by_id(spot_id)
-        
-        if spot and not spot.get_availability():
-            return spot.unpark()
-        
-        return None
+        return self.close_session(spot)
     
+    # closes the license's oldest open session
     def unpark_by_license(self, license: str) -> Optional[ParkingRecord]:
-        # Find all records for this license
-        if license not in self.parking_records:
-            return None
-        
-        records = self.parking_records[license]
-        # Find the active record (without exit time)
-        active_records = [r for r in records if r.exit_time is None]
-        
-        if not active_records:
-            return None
-        
-        # Get the spot from the record and unpark
-        record = active_records[0]
-        return record.spot.unpark()
+        while True:
+            record = self.get_active_record(license)
+            if record is None:
+                return None
+            closed = self.close_session(record.spot, record)
+            if closed is not None:
+                return closed
+            # another gate closed that session first - try the next one
+
+    # Unpark the spot and drop its session from both active maps.
+    # With expected set, only unpark if the spot still holds that record.
+    def close_session(self, spot: ParkingSpot, expected: ParkingRecord = None) -> Optional[ParkingRecord]:
+        with spot.level.lock:
+            if expected is not None and spot.get_parking_record() is not expected:
+                return None
+            record = spot.unpark()
+            with self.sessions_lock:
+                self.occupied_spots.pop((spot.level_id, spot.id), None)
+                if record is not None:
+                    license = record.vehicle.get_license_number()
+                    records = self.active_records.get(license)
+                    if records is not None and record in records:
+                        records.remove(record)
+                        if not records:
+                            del self.active_records[license]
+            if record is not None:
+                for observer in self.event_observers:
+                    observer.on_unpark(record)
+        return record
+
+    # lock-free occupancy read, e.g. for signage
+    def get_free_spot_count(self) -> int:
+        return sum(level.get_free_count() for level in self.levels)
+
+    # per-level occupancy from the levels' counters - no spot is looked at
+    def availability_summary(self) -> List[Dict[str, object]]:
+        return [level.availability_summary() for level in self.levels]
+
+    # oldest open session of the license
+    def get_active_record(self, license: str) -> Optional[ParkingRecord]:
+        with self.sessions_lock:
+            records = self.active_records.get(license)
+            return records[0] if records else None
     
     def calculate_payment(self, record: ParkingRecord) -> float:
         if not record:
             return 0.0
+        if self.permit_registry is not None and self.permit_registry.is_permit_holder(record.vehicle.get_license_number()):
+            return 0.0
         
-        duration = record.get_duration_hours()
+        exit_time = record.exit_time if record.exit_time is not None else current_time()
         vehicle_type = record.vehicle.get_vehicle_type()
         
-        return self.payment_strategy.calculate_payment(vehicle_type, duration)
+        return self.payment_strategy.calculate_stay_payment(vehicle_type, record.entry_time, exit_time)
     
     def process_payment(self, record: ParkingRecord) -> Optional[Payment]:
         if not record:
@@ -287,11 +860,64 @@ class ParkingSystem:
         
         # Update record
         record.set_payment(payment)
+        self.notify_payment(record)
         
         return payment
         
-    def get_parking_history(self, license: str) -> List[ParkingRecord]:
-        return self.parking_records.get(license, [])
+    # Move exited and paid records out of parking_records into the history archive.
+    # Returns the number of records archived.
+    def archive_closed_records(self) -> int:
+        if self.history_archive is None:
+            return 0
+        closed = []
+        with self.records_lock:
+            for license in list(self.parking_records):
+                records = self.parking_records[license]
+                still_open = [r for r in records if r.exit_time is None or not r.is_payment_completed()]
+                if len(still_open) == len(records):
+                    continue
+                closed.extend(r for r in records if r.exit_time is not None and r.is_payment_completed())
+                if still_open:
+                    self.parking_records[license] = still_open
+                else:
+                    del self.parking_records[license]
+        if closed:
+            self.history_archive.add_records(closed)
+        return len(closed)
+
+    # History of a license, optionally only records that exited in [start, end].
+    # Open sessions are only included when no end is given.
+    def get_parking_history(self, license: str, start: datetime = None, end: datetime = None) -> List[ParkingRecord]:
+        records = self.parking_records.get(license, [])
+        if start is not None or end is not None:
+            records = [r for r in records if self.exited_between(r, start, end)]
+        if self.history_archive is None:
+            return records
+        return self.history_archive.get_parking_history(license, start, end) + records
+
+    # All records that exited in [start, end]
+    def get_exits_between(self, start: datetime = None, end: datetime = None) -> List[ParkingRecord]:
+        exits = [r for records in self.parking_records.values() for r in records
+                 if r.exit_time is not None and self.exited_between(r, start, end)]
+        exits.sort(key=lambda r: r.exit_time)
+        if self.history_archive is None:
+            return exits
+        return self.history_archive.get_exits_between(start, end) + exits
+
+    @staticmethod
+    def exited_between(record: ParkingRecord, start: Optional[datetime], end: Optional[datetime]) -> bool:
+        if record.exit_time is None:
+            return end is None
+        return (start is None or record.exit_time >= start) and (end is None or record.exit_time <= end)
+
+# parking system - process-wide singleton
+class ParkingSystem(ParkingLotSystem):
+    _instance = None
+    
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(ParkingSystem, cls).__new__(cls)
+        return cls._instance
 
 # Parking system Demo:
 class ParkingSystemDemo:
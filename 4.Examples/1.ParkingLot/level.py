@@ -1,26 +1,58 @@
-from typing import List
+import heapq
+from typing import List, Dict, Optional
 from parking_spot import ParkingSpot
+from spot_size import SpotSize
 from vehicle import Vehicle
+from vehicle_type import VehicleType
 class Level():
-    def __init__(self, floor : int, num_spots : int):
+    # spot_sizes gives the size of every spot; without it the level has num_spots medium (car) spots
+    def __init__(self, floor : int, num_spots : int = 0, spot_sizes : Optional[List[SpotSize]] = None):
         self.floor = floor
-        self.parking_spots : List[ParkingSpot] = [ParkingSpot(i) for i in range(num_spots)]
+        if spot_sizes is None:
+            spot_sizes = [SpotSize.MEDIUM] * num_spots
+        self.parking_spots : List[ParkingSpot] = [ParkingSpot(i, size) for i, size in enumerate(spot_sizes)]
+        # free spot numbers per size (min-heaps), so best-fit allocation is O(log n)
+        self.free_spots : Dict[SpotSize, List[int]] = {size : [] for size in SpotSize}
+        for parking_spot in self.parking_spots:
+            self.free_spots[parking_spot.get_size()].append(parking_spot.get_spot_number())
+        # where each parked vehicle is, so unparking doesn't scan
+        self.vehicle_spots : Dict[Vehicle, ParkingSpot] = {}
 
+    # best fit: the smallest free spot the vehicle fits in
     def park_vehicle(self, vehicle : Vehicle) -> bool:
-        for parking_spot in self.parking_spots:
-            if parking_spot.is_availabile() and parking_spot.get_vehicle_type() == vehicle.get_type():
-                parking_spot.park_vehicle(vehicle)
+        for size in SpotSize.compatible(vehicle.get_type()):
+            if self.park_vehicle_in_size(vehicle, size):
                 return True
         return False
+
+    def park_vehicle_in_size(self, vehicle : Vehicle, size : SpotSize) -> bool:
+        if not self.free_spots[size]:
+            return False
+        parking_spot = self.parking_spots[heapq.heappop(self.free_spots[size])]
+        parking_spot.park_vehicle(vehicle)
+        self.vehicle_spots[vehicle] = parking_spot
+        return True
     
     def unpark_vehicle(self, vehicle : Vehicle) -> bool:
-        for parking_spot in self.parking_spots:
-            if not parking_spot.is_availabile() and parking_spot.get_parked_vehicle() == vehicle:
-                parking_spot.unpark_vehicle(vehicle)
-                return True
-        return False
+        parking_spot = self.vehicle_spots.pop(vehicle, None)
+        if parking_spot is None:
+            return False
+        parking_spot.unpark_vehicle()
+        heapq.heappush(self.free_spots[parking_spot.get_size()], parking_spot.get_spot_number())
+        return True
+
+    def get_free_spots_of_size(self, size : SpotSize) -> int:
+        return len(self.free_spots[size])
+
+    # free spots a vehicle of this type fits in
+    def get_free_spots(self, vehicle_type : VehicleType) -> int:
+        return sum(len(self.free_spots[size]) for size in SpotSize.compatible(vehicle_type))
+
+    # O(1) - read from the free lists, e.g. for "spaces free" signage
+    def availability_summary(self) -> Dict[VehicleType, int]:
+        return {vehicle_type : self.get_free_spots(vehicle_type) for vehicle_type in VehicleType}
     
     def display_availability(self) -> None:
         print(f"Level : {self.floor} Availability:")
         for spot in self.parking_spots:
-            print(f"Spot {spot.get_spot_number()} : {'Available' if spot.is_availabile() else 'Occupied'}")
+            print(f"Spot {spot.get_spot_number()} ({spot.get_size().name}) : {'Available' if spot.is_availabile() else 'Occupied'}")
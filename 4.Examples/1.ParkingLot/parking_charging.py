@@ -0,0 +1,303 @@
+# EV charging - time-share a few chargers between the vehicles parked in EV bays.
+#
+# Some spots are EV bays. A vehicle parked in one plugs in with the energy it
+# wants and when it will leave; at most `chargers` vehicles charge at a time
+# (each at charger_kw) and the scheduler decides which, by
+#   EDF - earliest departure first
+#   LLF - least laxity first: laxity = time to departure - time still needed at full power
+#
+# Nothing is re-planned from scratch. Vehicles sit in two heaps - waiting (best
+# on top) and charging (worst on top) - plus a heap of charge-completion times.
+# Both priorities are kept as keys that don't change while a vehicle stays in
+# its heap: a departure time never changes, and a waiting vehicle's latest
+# start time (departure - time needed) is fixed while it waits. A charging
+# vehicle's latest start moves forward exactly as fast as the clock, so it is
+# stored relative to the time it started. A tick handles the completions since
+# the last tick, fills free chargers, and swaps while the best waiting vehicle
+# beats the worst charging one by more than min_swap_gain. That costs
+# O(log n) per change, not per vehicle.
+import heapq
+import itertools
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from all import (ParkingLotSystem, ParkingEventObserver, ParkingRecord, Vehicle, FactoryVehicle, VehicleType,
+                 Clock, VirtualClock, current_time)
+
+EDF, LLF = "edf", "llf"
+WAITING, CHARGING, DONE, GONE = "waiting", "charging", "done", "gone"
+
+
+def minutes(moment: datetime) -> float:
+    return moment.timestamp() / 60
+
+
+class ChargingSession:
+    __slots__ = ('license', 'level_id', 'spot_id', 'energy_kwh', 'delivered_kwh', 'deadline',
+                 'state', 'started', 'version')
+
+    def __init__(self, license: str, level_id: int, spot_id: int, energy_kwh: float, deadline: float):
+        self.license = license
+        self.level_id = level_id
+        self.spot_id = spot_id
+        self.energy_kwh = energy_kwh
+        self.delivered_kwh = 0.0
+        self.deadline = deadline  # departure, in minutes
+        self.state = WAITING
+        self.started = 0.0  # when the current charging stint began, in minutes
+        self.version = 0  # bumped on every state change; heap entries of older versions are stale
+
+    def remaining_kwh(self) -> float:
+        return max(0.0, self.energy_kwh - self.delivered_kwh)
+
+    def is_satisfied(self) -> bool:
+        return self.delivered_kwh >= self.energy_kwh - 1e-6
+
+
+class ChargingStats:
+    def __init__(self):
+        self.plugged_in = 0
+        self.departed = 0
+        self.satisfied = 0  # departed (or finished) with everything they asked for
+        self.delivered_kwh = 0.0
+        self.shortfall_kwh = 0.0
+        self.preemptions = 0
+        self.ticks = 0
+        self.tick_seconds = 0.0
+
+    def report(self) -> str:
+        done = max(1, self.departed)
+        return (f"{self.departed} departed, {self.satisfied / done:.1%} fully charged, "
+                f"{self.delivered_kwh:,.0f} kWh delivered, {self.shortfall_kwh:,.0f} kWh short, "
+                f"{self.preemptions} preemptions, {self.tick_seconds / max(1, self.ticks) * 1e6:.0f} us/tick")
+
+
+class ChargingScheduler(ParkingEventObserver):
+    def __init__(self, parking_system: ParkingLotSystem, bays: Iterable[Tuple[int, int]], chargers: int,
+                 charger_kw: float = 11.0, policy: str = EDF, min_swap_gain: timedelta = timedelta(minutes=5)):
+        if policy not in (EDF, LLF):
+            raise ValueError(f"unknown policy {policy!r}")
+        self.parking_system = parking_system
+        self.bays = set(bays)
+        self.free_bays = {bay for bay in self.bays if parking_system.levels[bay[0]].is_spot_free(bay[1])}
+        self.chargers = chargers
+        self.kw_per_minute = charger_kw / 60
+        self.policy = policy
+        self.min_swap_gain = min_swap_gain.total_seconds() / 60
+        self.sessions: Dict[str, ChargingSession] = {}  # license -> session while parked
+        self.waiting = []  # (key, seq, session, version), best first
+        self.charging = []  # (-key, seq, session, version), worst first
+        self.completions = []  # (finish minute, seq, session, version)
+        self.charging_count = 0
+        self.seq = itertools.count()
+        self.stats = ChargingStats()
+        self.lock = threading.RLock()
+        parking_system.add_event_observer(self)
+
+    # --- parking side ---
+
+    def on_park(self, record: ParkingRecord):
+        bay = (record.spot.level_id, record.spot.id)
+        if bay in self.bays:
+            with self.lock:
+                self.free_bays.discard(bay)
+
+    def on_unpark(self, record: ParkingRecord):
+        bay = (record.spot.level_id, record.spot.id)
+        if bay not in self.bays:
+            return
+        with self.lock:
+            self.free_bays.add(bay)
+            session = self.sessions.get(record.vehicle.get_license_number())
+            if session is not None and (session.level_id, session.spot_id) == bay:
+                self.unplug(session, minutes(record.exit_time or current_time()))
+
+    # Park an EV in any free bay and plug it in; None if every bay is taken.
+    def park_ev(self, vehicle: Vehicle, energy_kwh: float, departure: datetime) -> Optional[ParkingRecord]:
+        while True:
+            with self.lock:
+                if not self.free_bays:
+                    return None
+                level_id, spot_id = self.free_bays.pop()
+            record = self.parking_system.park_at(vehicle, level_id, spot_id)
+            if record is not None:
+                self.plug_in(record, energy_kwh, departure)
+                return record
+            # someone parked there outside park_ev - it is not free, try another bay
+
+    def plug_in(self, record: ParkingRecord, energy_kwh: float, departure: datetime) -> ChargingSession:
+        if (record.spot.level_id, record.spot.id) not in self.bays:
+            raise ValueError(f"spot {record.spot.level_id}/{record.spot.id} is not an EV bay")
+        license = record.vehicle.get_license_number()
+        session = ChargingSession(license, record.spot.level_id, record.spot.id, energy_kwh, minutes(departure))
+        with self.lock:
+            self.sessions[license] = session
+            self.stats.plugged_in += 1
+            self.push_waiting(session)
+            self.tick()
+        return session
+
+    # --- scheduling ---
+
+    def waiting_key(self, session: ChargingSession) -> float:
+        if self.policy == EDF:
+            return session.deadline
+        return session.deadline - session.remaining_kwh() / self.kw_per_minute  # latest start
+
+    # key of a charging session at minute now (fixed part + now for LLF)
+    def charging_key(self, fixed: float, now: float) -> float:
+        return fixed if self.policy == EDF else fixed + now
+
+    def push_waiting(self, session: ChargingSession):
+        session.state = WAITING
+        session.version += 1
+        heapq.heappush(self.waiting, (self.waiting_key(session), next(self.seq), session, session.version))
+
+    def start(self, session: ChargingSession, now: float):
+        session.state = CHARGING
+        session.started = now
+        session.version += 1
+        needed = session.remaining_kwh() / self.kw_per_minute
+        # LLF: latest start = deadline - needed is now + fixed from here on
+        fixed = session.deadline if self.policy == EDF else session.deadline - needed - now
+        heapq.heappush(self.charging, (-fixed, next(self.seq), session, session.version))
+        heapq.heappush(self.completions, (now + needed, next(self.seq), session, session.version))
+        self.charging_count += 1
+
+    # stop charging at minute now and book what was delivered
+    def stop(self, session: ChargingSession, now: float):
+        delivered = min(session.remaining_kwh(), (now - session.started) * self.kw_per_minute)
+        session.delivered_kwh += delivered
+        self.stats.delivered_kwh += delivered
+        session.version += 1
+        self.charging_count -= 1
+
+    def unplug(self, session: ChargingSession, now: float):
+        if session.state == CHARGING:
+            self.stop(session, now)
+        session.state = GONE
+        session.version += 1
+        del self.sessions[session.license]
+        self.stats.departed += 1
+        if session.is_satisfied():
+            self.stats.satisfied += 1
+        else:
+            self.stats.shortfall_kwh += session.remaining_kwh()
+        self.fill(now)
+
+    @staticmethod
+    def top(heap) -> Optional[tuple]:
+        while heap:
+            entry = heap[0]
+            if entry[2].version == entry[3]:
+                return entry
+            heapq.heappop(heap)  # stale
+        return None
+
+    def fill(self, now: float):
+        while self.charging_count < self.chargers:
+            entry = self.top(self.waiting)
+            if entry is None:
+                return
+            heapq.heappop(self.waiting)
+            self.start(entry[2], now)
+
+    # Bring the schedule up to date with the lot's clock. Call it every minute (or whenever).
+    def tick(self, now: datetime = None):
+        began = time.perf_counter()
+        with self.lock:
+            now_m = minutes(now or current_time())
+            # vehicles that finished since the last tick free their charger when they finished
+            while self.completions and self.completions[0][0] <= now_m:
+                finish, _, session, version = heapq.heappop(self.completions)
+                if session.version != version:
+                    continue
+                self.stop(session, finish)
+                session.state = DONE
+                self.fill(finish)
+            self.fill(now_m)
+            self.rebalance(now_m)
+        self.stats.ticks += 1
+        self.stats.tick_seconds += time.perf_counter() - began
+
+    # swap while the best waiting vehicle clearly beats the worst charging one
+    def rebalance(self, now: float):
+        while True:
+            best, worst = self.top(self.waiting), self.top(self.charging)
+            if best is None or worst is None:
+                return
+            if best[0] >= self.charging_key(-worst[0], now) - self.min_swap_gain:
+                return
+            heapq.heappop(self.waiting)
+            heapq.heappop(self.charging)
+            preempted = worst[2]
+            self.stop(preempted, now)
+            self.push_waiting(preempted)
+            self.start(best[2], now)
+            self.stats.preemptions += 1
+
+    # --- views ---
+
+    def charging_licenses(self) -> List[str]:
+        with self.lock:
+            return [s.license for s in self.sessions.values() if s.state == CHARGING]
+
+    def delivered_kwh(self, license: str, now: datetime = None) -> float:
+        with self.lock:
+            session = self.sessions.get(license)
+            if session is None:
+                return 0.0
+            if session.state != CHARGING:
+                return session.delivered_kwh
+            elapsed = minutes(now or current_time()) - session.started
+            return min(session.energy_kwh, session.delivered_kwh + elapsed * self.kw_per_minute)
+
+
+# Charging demo: 300 bays, 60 chargers, a day of EV traffic re-planned every minute
+class ChargingDemo:
+    @staticmethod
+    def simulate(policy: str) -> ChargingStats:
+        start = datetime(2024, 5, 6, 6)
+        clock = VirtualClock(start)
+        previous = Clock.get()
+        Clock.use(clock)
+        try:
+            ps = ParkingLotSystem()
+            ps.add_level(300)
+            scheduler = ChargingScheduler(ps, [(0, spot) for spot in range(300)], chargers=60,
+                                          charger_kw=11.0, policy=policy)
+            rng = random.Random(21)
+            departures = []  # (time, license)
+            next_arrival = start
+            for minute in range(18 * 60):
+                now = start + timedelta(minutes=minute)
+                clock.set(now)
+                while departures and departures[0][0] <= now:
+                    _, license = heapq.heappop(departures)
+                    ps.unpark_by_license(license)
+                while next_arrival <= now:
+                    license = f"EV{next_arrival:%H%M%S}{rng.randint(0, 999):03d}"
+                    departure = now + timedelta(hours=rng.uniform(1.5, 9))
+                    energy = rng.uniform(8, 55)
+                    if scheduler.park_ev(FactoryVehicle.create_vehicle(VehicleType.CAR, license), energy, departure):
+                        heapq.heappush(departures, (departure, license))
+                    next_arrival += timedelta(minutes=rng.expovariate(1 / 2.4))
+                scheduler.tick()
+            return scheduler.stats
+        finally:
+            Clock.use(previous)
+
+    @staticmethod
+    def run():
+        for policy in (EDF, LLF):
+            print(f"{policy.upper()}: {ChargingDemo.simulate(policy).report()}")
+
+
+if __name__ == "__main__":
+    ChargingDemo.run()
+
+
+# python3 4.Examples/1.ParkingLot/parking_charging.py
@@ -0,0 +1,97 @@
+# Contention benchmark - many gate threads parking and unparking at once.
+#
+# Every gate thread loops: park a vehicle, then unpark it (alternating by
+# license and by level/spot). Runs the same load against
+#   - ParkingLotSystem with its per-level locks
+#   - the same system behind one global lock (the naive alternative)
+# and checks afterwards that no spot was handed out twice.
+import sys
+import threading
+import time
+from typing import Optional
+
+from all import ParkingLotSystem, ParkingRecord, FactoryVehicle, VehicleType, StrategyParkBalanced
+
+
+# baseline: every call serialized through one lock
+class GlobalLockParkingSystem(ParkingLotSystem):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.global_lock = threading.Lock()
+
+    def park(self, vehicle) -> Optional[ParkingRecord]:
+        with self.global_lock:
+            return super().park(vehicle)
+
+    def unpark(self, level_id: int, spot_id: int) -> Optional[ParkingRecord]:
+        with self.global_lock:
+            return super().unpark(level_id, spot_id)
+
+    def unpark_by_license(self, license: str) -> Optional[ParkingRecord]:
+        with self.global_lock:
+            return super().unpark_by_license(license)
+
+
+class ParkingConcurrencyBenchmark:
+    def __init__(self, num_gates=16, num_levels=8, spots_per_level=500, ops_per_gate=5000):
+        self.num_gates = num_gates
+        self.num_levels = num_levels
+        self.spots_per_level = spots_per_level
+        self.ops_per_gate = ops_per_gate
+
+    def build(self, system_class) -> ParkingLotSystem:
+        # balanced spreads the gates over the levels, which is where per-level locks pay off
+        system = system_class(strategy_to_park=StrategyParkBalanced())
+        for _ in range(self.num_levels):
+            system.add_level(self.spots_per_level)
+        return system
+
+    def gate(self, system: ParkingLotSystem, gate_id: int, errors: list):
+        for i in range(self.ops_per_gate):
+            license = f"G{gate_id}-{i}"
+            record = system.park(FactoryVehicle.create_vehicle(VehicleType.CAR, license))
+            if record is None:
+                continue
+            if record.spot.vehicle is None or record.spot.vehicle.get_license_number() != license:
+                errors.append(f"spot {record.spot.level_id}/{record.spot.id} handed out twice")
+            if i % 2:
+                closed = system.unpark_by_license(license)
+            else:
+                closed = system.unpark(record.spot.level_id, record.spot.id)
+            if closed is not record:
+                errors.append(f"{license} unparked the wrong session")
+
+    def run_once(self, system_class):
+        system = self.build(system_class)
+        errors = []
+        threads = [threading.Thread(target=self.gate, args=(system, g, errors)) for g in range(self.num_gates)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        if system.get_free_spot_count() != self.num_levels * self.spots_per_level:
+            errors.append("free counters out of sync after all vehicles left")
+        if system.active_records or system.occupied_spots:
+            errors.append("active session maps not empty after all vehicles left")
+        ops = 2 * self.num_gates * self.ops_per_gate
+        return ops / elapsed, errors
+
+    def run(self):
+        print(f"{self.num_gates} gates, {self.num_levels} levels x {self.spots_per_level} spots, "
+              f"{self.ops_per_gate} park+unpark per gate")
+        for name, system_class in [("per-level locks", ParkingLotSystem), ("global lock", GlobalLockParkingSystem)]:
+            throughput, errors = self.run_once(system_class)
+            print(f"{name:>16}: {throughput:,.0f} ops/s, {'OK' if not errors else errors[:3]}")
+
+
+if __name__ == "__main__":
+    # switch threads often to shake out races
+    sys.setswitchinterval(1e-5)
+    num_gates = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    ParkingConcurrencyBenchmark(num_gates=num_gates).run()
+
+
+# python3 4.Examples/1.ParkingLot/parking_concurrency_benchmark.py 32
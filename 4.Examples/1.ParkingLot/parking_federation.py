@@ -0,0 +1,435 @@
+# Parking federation - many independent lots, sharded across worker processes.
+#
+# ParkingSystem is one lot per process. A federation instead owns any number of
+# ParkingLotSystem instances, each living in exactly one worker process (shard),
+# so lots on different shards park and unpark on different cores and nothing is
+# shared between shards - no global lock.
+#
+# The federation process keeps a cached occupancy summary per lot (free/total
+# spots and its location). Every worker reply carries the lot's current free
+# count, so the cache is refreshed as a side effect of normal traffic; arrivals
+# are routed from the cache without asking any shard. A stale cache only costs
+# a retry on the next best lot.
+#
+# Calls that touch many shards (batches, history queries, summaries) send to
+# every shard first and then collect the replies, so the shards work in
+# parallel. Records come back as plain dicts - ParkingRecord objects stay in
+# their worker.
+import math
+import multiprocessing
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from all import ParkingLotSystem, ParkingRecord, FactoryVehicle, VehicleType
+
+LEAST_FULL, NEAREST = "least-full", "nearest"
+
+
+def record_to_dict(lot_id: str, record: ParkingRecord) -> dict:
+    return {
+        "lot": lot_id,
+        "license": record.vehicle.get_license_number(),
+        "vehicle_type": record.vehicle.get_vehicle_type().name,
+        "level": record.spot.level_id,
+        "spot": record.spot.id,
+        "entry": record.entry_time,
+        "exit": record.exit_time,
+        "amount": record.payment.get_amount() if record.payment else None,
+    }
+
+
+# One shard: owns its lots and executes commands from the federation in order.
+class LotShard:
+    def __init__(self):
+        self.lots: Dict[str, ParkingLotSystem] = {}
+
+    def add_lot(self, lot_id: str, level_spots: List[int]) -> int:
+        lot = ParkingLotSystem()
+        for spots in level_spots:
+            lot.add_level(spots)
+        self.lots[lot_id] = lot
+        return lot.get_free_spot_count()
+
+    # (level, spot, free) on success, (None, None, free) when the lot is full
+    def park(self, lot_id: str, vehicle_type: str, license: str, entry_time: datetime = None):
+        lot = self.lots[lot_id]
+        record = lot.park(FactoryVehicle.create_vehicle(VehicleType[vehicle_type], license))
+        if record is None:
+            return None, None, lot.get_free_spot_count()
+        if entry_time is not None:
+            record.entry_time = entry_time
+        return record.spot.level_id, record.spot.id, lot.get_free_spot_count()
+
+    # (amount, free); amount is None when the license has no open session
+    def unpark(self, lot_id: str, license: str, exit_time: datetime = None):
+        lot = self.lots[lot_id]
+        record = lot.unpark_by_license(license)
+        if record is None:
+            return None, lot.get_free_spot_count()
+        if exit_time is not None:
+            record.exit_time = exit_time
+        payment = lot.process_payment(record)
+        return payment.get_amount(), lot.get_free_spot_count()
+
+    def summary(self) -> Dict[str, Tuple[int, int]]:
+        return {lot_id: (lot.get_free_spot_count(), sum(level.get_spot_count() for level in lot.levels))
+                for lot_id, lot in self.lots.items()}
+
+    def history(self, license: str, start: datetime = None, end: datetime = None) -> List[dict]:
+        return [record_to_dict(lot_id, r) for lot_id, lot in self.lots.items()
+                for r in lot.get_parking_history(license, start, end)]
+
+    def exits(self, start: datetime = None, end: datetime = None) -> List[dict]:
+        return [record_to_dict(lot_id, r) for lot_id, lot in self.lots.items()
+                for r in lot.get_exits_between(start, end)]
+
+    # A list of (command, args) run back to back - one pipe round trip for the lot.
+    # Every command runs and gets its own (ok, result or error), so one failure
+    # doesn't hide which of the others were applied.
+    def batch(self, commands: List[Tuple[str, tuple]]) -> List[Tuple[bool, object]]:
+        replies = []
+        for command, args in commands:
+            try:
+                replies.append((True, getattr(self, command)(*args)))
+            except Exception as e:
+                replies.append((False, repr(e)))
+        return replies
+
+
+def shard_main(connection):
+    shard = LotShard()
+    while True:
+        command, args = connection.recv()
+        if command == "stop":
+            break
+        try:
+            connection.send((True, getattr(shard, command)(*args)))
+        except Exception as e:  # report back instead of killing the shard
+            connection.send((False, repr(e)))
+    connection.close()
+
+
+# federation-side handle of one worker process
+class ShardClient:
+    def __init__(self, index: int, context):
+        self.index = index
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=shard_main, args=(child,), daemon=True, name=f"parking-shard-{index}")
+        self.process.start()
+        child.close()
+        # one request in flight per shard; callers on other shards never wait on it
+        self.lock = threading.Lock()
+
+    def send(self, command: str, *args):
+        self.connection.send((command, args))
+
+    # (ok, result or error) of the request in flight
+    def receive_reply(self) -> Tuple[bool, object]:
+        try:
+            return self.connection.recv()
+        except (EOFError, OSError) as e:  # the worker died
+            return False, repr(e)
+
+    def receive(self):
+        ok, result = self.receive_reply()
+        if not ok:
+            raise RuntimeError(f"shard {self.index}: {result}")
+        return result
+
+    def call(self, command: str, *args):
+        with self.lock:
+            self.send(command, *args)
+            return self.receive()
+
+    def stop(self):
+        with self.lock:
+            self.send("stop")
+        self.process.join()
+
+
+# Some commands of a park_many/unpark_many batch failed. The federation's
+# state already reflects every command that ran; results holds them (None for
+# the failed ones) and failures maps input index -> error.
+class BatchError(RuntimeError):
+    def __init__(self, results: list, failures: Dict[int, str]):
+        super().__init__(f"{len(failures)} of {len(results)} commands failed: "
+                         + "; ".join(f"#{i}: {error}" for i, error in sorted(failures.items())[:5]))
+        self.results = results
+        self.failures = failures
+
+
+# Replies of several shards that each have one request in flight. Every reply
+# is read before anything is raised, so no stale reply is left in a pipe for
+# the next call to pick up.
+def receive_all(shards: List[ShardClient]) -> list:
+    replies = [shard.receive_reply() for shard in shards]
+    errors = [f"shard {shard.index}: {result}" for shard, (ok, result) in zip(shards, replies) if not ok]
+    if errors:
+        raise RuntimeError("; ".join(errors))
+    return [result for _, result in replies]
+
+
+# cached view of one lot, updated from worker replies
+class LotSummary:
+    __slots__ = ("lot_id", "shard", "location", "free", "total")
+
+    def __init__(self, lot_id: str, shard: int, location: Tuple[float, float], free: int, total: int):
+        self.lot_id = lot_id
+        self.shard = shard
+        self.location = location
+        self.free = free
+        self.total = total
+
+    def fill_ratio(self) -> float:
+        return 1 - self.free / self.total if self.total else 1.0
+
+
+class ParkingFederation:
+    def __init__(self, num_shards: int = None, routing: str = LEAST_FULL):
+        context = multiprocessing.get_context()
+        self.shards = [ShardClient(i, context) for i in range(num_shards or multiprocessing.cpu_count())]
+        self.routing = routing
+        self.summaries: Dict[str, LotSummary] = {}
+        self.active_lots: Dict[str, str] = {}  # license -> lot it is parked in
+        self.state_lock = threading.Lock()  # guards summaries / active_lots, never held across a shard call
+
+    def close(self):
+        for shard in self.shards:
+            shard.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # lots are spread round-robin; a lot never moves between shards
+    def add_lot(self, lot_id: str, level_spots: List[int], location: Tuple[float, float] = (0.0, 0.0)):
+        if lot_id in self.summaries:
+            raise ValueError(f"lot {lot_id} already exists")
+        shard = len(self.summaries) % len(self.shards)
+        free = self.shards[shard].call("add_lot", lot_id, level_spots)
+        with self.state_lock:
+            self.summaries[lot_id] = LotSummary(lot_id, shard, location, free, free)
+
+    # poll every shard; normally the cache is kept fresh by park/unpark replies alone
+    def refresh_summaries(self):
+        for lots in self.broadcast("summary"):
+            with self.state_lock:
+                for lot_id, (free, total) in lots.items():
+                    summary = self.summaries[lot_id]
+                    summary.free, summary.total = free, total
+
+    def availability_summary(self) -> Dict[str, Dict[str, object]]:
+        with self.state_lock:
+            return {lot_id: {"shard": s.shard, "free": s.free, "spots": s.total, "location": s.location}
+                    for lot_id, s in self.summaries.items()}
+
+    # lots with free space, best first for the routing policy
+    def ranked_lots(self, near: Optional[Tuple[float, float]] = None) -> List[LotSummary]:
+        with self.state_lock:
+            candidates = [s for s in self.summaries.values() if s.free > 0]
+        if self.routing == NEAREST and near is not None:
+            candidates.sort(key=lambda s: (math.dist(near, s.location), s.fill_ratio()))
+        else:
+            candidates.sort(key=LotSummary.fill_ratio)
+        return candidates
+
+    def update_free(self, lot_id: str, free: int):
+        with self.state_lock:
+            self.summaries[lot_id].free = free
+
+    # Park in the best lot; returns (lot_id, level, spot) or None if every lot is full.
+    def park(self, vehicle_type: VehicleType, license: str, near: Optional[Tuple[float, float]] = None,
+             entry_time: datetime = None) -> Optional[Tuple[str, int, int]]:
+        for summary in self.ranked_lots(near):
+            level, spot, free = self.shards[summary.shard].call("park", summary.lot_id, vehicle_type.name, license, entry_time)
+            self.update_free(summary.lot_id, free)
+            if level is not None:
+                with self.state_lock:
+                    self.active_lots[license] = summary.lot_id
+                return summary.lot_id, level, spot
+        return None
+
+    # Unpark and pay; returns the amount, or None if the license isn't parked anywhere.
+    def unpark(self, license: str, exit_time: datetime = None) -> Optional[float]:
+        with self.state_lock:
+            lot_id = self.active_lots.pop(license, None)
+        if lot_id is None:
+            return None
+        try:
+            amount, free = self.shards[self.summaries[lot_id].shard].call("unpark", lot_id, license, exit_time)
+        except Exception:
+            with self.state_lock:  # the session may well still be open there, as in unpark_many
+                self.active_lots.setdefault(license, lot_id)
+            raise
+        self.update_free(lot_id, free)
+        return amount
+
+    # Park many arrivals with one round trip per shard. Arrivals are routed up front
+    # against the cached summaries (decrementing them as we go); the few that a
+    # shard rejects because the cache was stale fall back to park() one by one.
+    def park_many(self, arrivals: List[Tuple[VehicleType, str]], near: Optional[Tuple[float, float]] = None,
+                  entry_time: datetime = None) -> List[Optional[Tuple[str, int, int]]]:
+        results: List[Optional[Tuple[str, int, int]]] = [None] * len(arrivals)
+        planned: Dict[int, List[Tuple[int, str]]] = {}  # shard -> [(arrival index, lot_id)]
+        commands: Dict[int, List[Tuple[str, tuple]]] = {}
+        ranked = self.ranked_lots(near)
+        remaining = {s.lot_id: s.free for s in ranked}
+        for i, (vehicle_type, license) in enumerate(arrivals):
+            summary = self.pick_planned(ranked, remaining)
+            if summary is None:
+                break
+            remaining[summary.lot_id] -= 1
+            planned.setdefault(summary.shard, []).append((i, summary.lot_id))
+            commands.setdefault(summary.shard, []).append(("park", (summary.lot_id, vehicle_type.name, license, entry_time)))
+
+        retry, failures = [], {}
+        for shard, replies in self.scatter(commands).items():
+            for (i, lot_id), (ok, reply) in zip(planned[shard], replies):
+                if not ok:
+                    failures[i] = reply
+                    continue
+                level, spot, free = reply
+                self.update_free(lot_id, free)
+                if level is None:
+                    retry.append(i)
+                    continue
+                results[i] = (lot_id, level, spot)
+                with self.state_lock:
+                    self.active_lots[arrivals[i][1]] = lot_id
+        for i in retry:
+            results[i] = self.park(arrivals[i][0], arrivals[i][1], near, entry_time)
+        if failures:
+            raise BatchError(results, failures)
+        return results
+
+    def pick_planned(self, ranked: List[LotSummary], remaining: Dict[str, int]) -> Optional[LotSummary]:
+        if self.routing == NEAREST:
+            return next((s for s in ranked if remaining[s.lot_id] > 0), None)
+        best = None
+        for s in ranked:  # least full after the arrivals already planned
+            if remaining[s.lot_id] > 0:
+                ratio = 1 - remaining[s.lot_id] / s.total
+                if best is None or ratio < best[0]:
+                    best = (ratio, s)
+        return best[1] if best else None
+
+    # Unpark many licenses with one round trip per shard; amounts in input order.
+    def unpark_many(self, licenses: List[str], exit_time: datetime = None) -> List[Optional[float]]:
+        results: List[Optional[float]] = [None] * len(licenses)
+        planned: Dict[int, List[Tuple[int, str]]] = {}
+        commands: Dict[int, List[Tuple[str, tuple]]] = {}
+        with self.state_lock:
+            for i, license in enumerate(licenses):
+                lot_id = self.active_lots.pop(license, None)
+                if lot_id is None:
+                    continue
+                shard = self.summaries[lot_id].shard
+                planned.setdefault(shard, []).append((i, lot_id))
+                commands.setdefault(shard, []).append(("unpark", (lot_id, license, exit_time)))
+        failures = {}
+        for shard, replies in self.scatter(commands).items():
+            for (i, lot_id), (ok, reply) in zip(planned[shard], replies):
+                if not ok:
+                    failures[i] = reply
+                    with self.state_lock:  # the session may well still be open there
+                        self.active_lots.setdefault(licenses[i], lot_id)
+                    continue
+                amount, free = reply
+                self.update_free(lot_id, free)
+                results[i] = amount
+        if failures:
+            raise BatchError(results, failures)
+        return results
+
+    # history of a license across every lot, by entry time
+    def get_parking_history(self, license: str, start: datetime = None, end: datetime = None) -> List[dict]:
+        records = [r for shard_records in self.broadcast("history", license, start, end) for r in shard_records]
+        records.sort(key=lambda r: r["entry"])
+        return records
+
+    # every exit in [start, end] across all lots, by exit time
+    def get_exits_between(self, start: datetime = None, end: datetime = None) -> List[dict]:
+        records = [r for shard_records in self.broadcast("exits", start, end) for r in shard_records]
+        records.sort(key=lambda r: r["exit"])
+        return records
+
+    # same command on every shard, replies in shard order
+    def broadcast(self, command: str, *args) -> list:
+        for shard in self.shards:
+            shard.lock.acquire()
+        try:
+            sent = []
+            try:
+                for shard in self.shards:
+                    shard.send(command, *args)
+                    sent.append(shard)
+            finally:
+                replies = receive_all(sent)  # drain whatever was sent, even if a send failed
+            return replies
+        finally:
+            for shard in self.shards:
+                shard.lock.release()
+
+    # one batch per shard, all sent before any reply is read; replies are
+    # (ok, result or error) per command, see LotShard.batch
+    def scatter(self, commands: Dict[int, List[Tuple[str, tuple]]]) -> Dict[int, list]:
+        shards = sorted(commands)  # fixed lock order
+        for index in shards:
+            self.shards[index].lock.acquire()
+        try:
+            sent = []
+            try:
+                for index in shards:
+                    self.shards[index].send("batch", commands[index])
+                    sent.append(index)
+            finally:
+                replies = receive_all([self.shards[index] for index in sent])
+            return dict(zip(sent, replies))
+        finally:
+            for index in shards:
+                self.shards[index].lock.release()
+
+
+# Federation demo: a city of 24 garages on 4 shards
+class ParkingFederationDemo:
+    @staticmethod
+    def run():
+        with ParkingFederation(num_shards=4) as federation:
+            for i in range(24):
+                federation.add_lot(f"lot-{i}", [200, 200], location=(i % 6, i // 6))
+
+            start = datetime(2024, 1, 1, 8)
+            arrivals = [(VehicleType.CAR, f"CITY{i}") for i in range(8000)]
+            began = time.perf_counter()
+            placed = federation.park_many(arrivals, entry_time=start)
+            elapsed = time.perf_counter() - began
+            print(f"Parked {sum(p is not None for p in placed)} of {len(arrivals)} in {elapsed * 1000:.0f} ms "
+                  f"({len(arrivals) / elapsed:,.0f} arrivals/s, batched)")
+
+            began = time.perf_counter()
+            for i in range(500):
+                federation.unpark(f"CITY{i}", exit_time=start + timedelta(hours=2))
+                federation.park(VehicleType.CAR, f"CITY{i}", entry_time=start + timedelta(hours=3))
+            elapsed = time.perf_counter() - began
+            print(f"1000 single park/unpark calls: {1000 / elapsed:,.0f} ops/s")
+
+            amounts = federation.unpark_many([f"CITY{i}" for i in range(4000)], exit_time=start + timedelta(hours=5))
+            print(f"Settled {sum(a is not None for a in amounts)} exits, {sum(a for a in amounts if a):.2f} total")
+
+            fill = sorted(s["free"] for s in federation.availability_summary().values())
+            print(f"Free spots per lot: min {fill[0]}, max {fill[-1]}")
+            print("History of CITY7:", [(r["lot"], r["entry"].hour, r["exit"].hour) for r in federation.get_parking_history("CITY7")])
+
+            federation.routing = NEAREST
+            print("Nearest to (5, 3):", federation.park(VehicleType.CAR, "NEAR1", near=(5, 3)))
+
+
+if __name__ == "__main__":
+    ParkingFederationDemo.run()
+
+
+# python3 4.Examples/1.ParkingLot/parking_federation.py
@@ -0,0 +1,187 @@
+# Gate event server - asyncio front end for ParkingSystem.
+#
+# Gate and camera controllers connect over TCP or a Unix socket and send
+# newline-delimited JSON events:
+#   {"id": 1, "event": "entry", "license": "AB12CD", "vehicle_type": "CAR"}
+#   {"id": 2, "event": "exit", "license": "AB12CD"}
+#   {"id": 3, "event": "stats"}
+# Each event gets one JSON line back with the same id, the result and the
+# time the server spent on it (latency_us). Controllers may pipeline: every
+# read processes all complete lines it got and answers them in one write.
+# A line longer than MAX_LINE gets an error and the connection is dropped, so
+# a controller that never sends a newline can't grow the buffer without end.
+import asyncio
+import json
+import time
+from collections import deque
+from typing import List, Optional
+
+from all import ParkingSystem, ParkingLotSystem, FactoryVehicle, VehicleType
+
+READ_CHUNK = 64 * 1024
+MAX_LINE = 64 * 1024  # bytes of one event, newline excluded
+
+
+# bounded window of recent event latencies, in microseconds
+class LatencyRecorder:
+    def __init__(self, window: int = 100000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, latency_us: float):
+        self.samples.append(latency_us)
+        self.count += 1
+
+    def percentiles(self, points=(50, 90, 99, 99.9)) -> dict:
+        if not self.samples:
+            return {}
+        ordered = sorted(self.samples)
+        last = len(ordered) - 1
+        return {f"p{p}": round(ordered[min(last, int(last * p / 100))], 1) for p in points}
+
+
+class ParkingGateServer:
+    def __init__(self, parking_system: ParkingLotSystem = None):
+        self.parking_system = parking_system if parking_system else ParkingSystem()
+        self.latency = LatencyRecorder()
+        self.connections = 0
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server
+
+    async def start_unix(self, path: str):
+        self.server = await asyncio.start_unix_server(self.handle_connection, path)
+        return self.server
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        pending = b""
+        try:
+            while True:
+                chunk = await reader.read(READ_CHUNK)
+                if not chunk:
+                    break
+                received = time.perf_counter()
+                lines = (pending + chunk).split(b"\n")
+                pending = lines.pop()  # incomplete last line, if any
+                responses = self.handle_batch(lines, received)
+                if len(pending) > MAX_LINE:
+                    error = {"id": None, "ok": False, "error": f"line over {MAX_LINE} bytes, closing"}
+                    responses.append(json.dumps(error).encode() + b"\n")
+                if responses:
+                    writer.write(b"".join(responses))
+                    await writer.drain()
+                if len(pending) > MAX_LINE:
+                    break
+        except ConnectionResetError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+            await writer.wait_closed()
+
+    # handle every complete line of one read, in order
+    def handle_batch(self, lines: List[bytes], received: float) -> List[bytes]:
+        responses = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line)
+                response = self.handle_event(event)
+            except (ValueError, KeyError, TypeError) as e:
+                event, response = {}, {"ok": False, "error": f"bad event: {e}"}
+            response["id"] = event.get("id") if isinstance(event, dict) else None
+            latency_us = (time.perf_counter() - received) * 1e6
+            self.latency.record(latency_us)
+            response["latency_us"] = round(latency_us, 1)
+            responses.append(json.dumps(response).encode() + b"\n")
+        return responses
+
+    def handle_event(self, event: dict) -> dict:
+        kind = event["event"]
+        if kind == "entry":
+            return self.handle_entry(event)
+        if kind == "exit":
+            return self.handle_exit(event)
+        if kind == "stats":
+            return {"ok": True, "events": self.latency.count, "connections": self.connections,
+                    "free_spots": self.parking_system.get_free_spot_count(), **self.latency.percentiles()}
+        return {"ok": False, "error": f"unknown event: {kind}"}
+
+    def handle_entry(self, event: dict) -> dict:
+        vehicle = FactoryVehicle.create_vehicle(VehicleType[event["vehicle_type"]], event["license"])
+        record = self.parking_system.park(vehicle)
+        if record is None:
+            return {"ok": False, "error": "lot full"}
+        return {"ok": True, "level": record.spot.level_id, "spot": record.spot.id}
+
+    def handle_exit(self, event: dict) -> dict:
+        record = self.parking_system.unpark_by_license(event["license"])
+        if record is None:
+            return {"ok": False, "error": "no active session"}
+        payment = self.parking_system.process_payment(record)
+        return {"ok": True, "duration_hours": round(record.get_duration_hours(), 4),
+                "amount": round(payment.get_amount(), 2)}
+
+
+# Demo: one server, a few gate controllers pipelining their events
+class ParkingGateServerDemo:
+    @staticmethod
+    async def gate(port: int, gate_id: int, vehicles: int):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        events = []
+        for i in range(vehicles):
+            events.append({"id": i, "event": "entry", "license": f"G{gate_id}-{i}", "vehicle_type": "CAR"})
+        for i in range(vehicles):
+            events.append({"id": vehicles + i, "event": "exit", "license": f"G{gate_id}-{i}"})
+        # pipeline everything, then read the answers
+        writer.write(b"".join(json.dumps(e).encode() + b"\n" for e in events))
+        await writer.drain()
+        responses = [json.loads(await reader.readline()) for _ in events]
+        writer.close()
+        await writer.wait_closed()
+        return responses
+
+    @staticmethod
+    async def main():
+        ps = ParkingSystem()
+        ps.add_level(200)
+        ps.add_level(200)
+        server = ParkingGateServer(ps)
+        await server.start()
+        port = server.server.sockets[0].getsockname()[1]
+        print(f"Gate server listening on port {port}")
+
+        results = await asyncio.gather(*(ParkingGateServerDemo.gate(port, g, 50) for g in range(8)))
+        ok = sum(r["ok"] for responses in results for r in responses)
+        print(f"{ok} of {sum(len(r) for r in results)} events succeeded")
+        print("First entry:", results[0][0])
+        print("First exit:", results[0][50])
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b'{"id": "s", "event": "stats"}\n')
+        print("Stats:", json.loads(await reader.readline()))
+        writer.close()
+        await writer.wait_closed()
+        while server.connections:
+            await asyncio.sleep(0.01)
+        await server.stop()
+
+    @staticmethod
+    def run():
+        asyncio.run(ParkingGateServerDemo.main())
+
+
+if __name__ == "__main__":
+    ParkingGateServerDemo.run()
+
+
+# python3 4.Examples/1.ParkingLot/parking_gate_server.py
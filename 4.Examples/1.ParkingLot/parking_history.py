@@ -0,0 +1,226 @@
+# parking history archive - closed parking records in day partitions
+#
+# Closed records (exited and paid) are copied out of their ParkingRecord /
+# Vehicle / ParkingSpot / Payment objects into flat typed columns, one
+# partition per exit day, rows sorted by exit time. Range queries bisect the
+# sorted day keys and then the exit timestamps, so audits only touch the days
+# they ask for. Old partitions can be spilled to local files and are read
+# back on demand.
+import os
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, date
+from typing import List, Dict, Optional
+
+from all import VehicleType, Payment, ParkingRecord
+
+VEHICLE_TYPES = {vehicle_type.value: vehicle_type for vehicle_type in VehicleType}
+
+# column name -> array typecode, also the order columns are written to disk
+COLUMNS = [
+    ("exit_ts", "d"),
+    ("entry_ts", "d"),
+    ("amount", "d"),
+    ("license_id", "q"),
+    ("level_id", "q"),
+    ("spot_id", "q"),
+    ("vehicle_type", "b"),
+]
+
+
+# lightweight read-only view of an archived record, shaped like ParkingRecord
+class ArchivedParkingRecord:
+    __slots__ = ("license", "vehicle_type", "level_id", "spot_id", "entry_time", "exit_time", "payment")
+
+    def __init__(self, license, vehicle_type, level_id, spot_id, entry_time, exit_time, payment):
+        self.license = license
+        self.vehicle_type = vehicle_type
+        self.level_id = level_id
+        self.spot_id = spot_id
+        self.entry_time = entry_time
+        self.exit_time = exit_time
+        self.payment = payment
+
+    def get_license_number(self):
+        return self.license
+
+    def get_duration_hours(self) -> float:
+        return (self.exit_time - self.entry_time).total_seconds() / 3600
+
+    def is_payment_completed(self) -> bool:
+        return self.payment is not None and self.payment.is_payment_completed()
+
+
+# one day of closed records, rows sorted by exit timestamp
+class DayPartition:
+    def __init__(self, day: int):
+        self.day = day
+        self.columns: Dict[str, array] = {name: array(code) for name, code in COLUMNS}
+        self.license_rows: Optional[Dict[int, array]] = None  # license id -> row numbers, built lazily
+
+    def __len__(self):
+        return len(self.columns["exit_ts"])
+
+    # rows is a list of column tuples in COLUMNS order, already sorted by exit_ts
+    def append_rows(self, rows):
+        exit_ts = self.columns["exit_ts"]
+        if len(exit_ts) and rows[0][0] < exit_ts[-1]:
+            # late arrivals for this day - merge and rewrite the partition
+            rows = sorted(list(self.iter_rows()) + rows, key=lambda row: row[0])
+            self.columns = {name: array(code) for name, code in COLUMNS}
+        for i, (name, _) in enumerate(COLUMNS):
+            self.columns[name].extend(row[i] for row in rows)
+        self.license_rows = None
+
+    def iter_rows(self):
+        return zip(*(self.columns[name] for name, _ in COLUMNS))
+
+    def get_license_rows(self, license_id: int) -> array:
+        if self.license_rows is None:
+            self.license_rows = {}
+            for row, owner in enumerate(self.columns["license_id"]):
+                self.license_rows.setdefault(owner, array("q")).append(row)
+        return self.license_rows.get(license_id, array("q"))
+
+    # row range [lo, hi) with exit_ts in [start_ts, end_ts]
+    def row_range(self, start_ts: float, end_ts: float):
+        exit_ts = self.columns["exit_ts"]
+        return bisect_left(exit_ts, start_ts), bisect_right(exit_ts, end_ts)
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            array("q", [len(self)]).tofile(f)
+            for name, _ in COLUMNS:
+                self.columns[name].tofile(f)
+
+    @staticmethod
+    def load(day: int, path: str) -> 'DayPartition':
+        partition = DayPartition(day)
+        with open(path, "rb") as f:
+            header = array("q")
+            header.fromfile(f, 1)
+            for name, _ in COLUMNS:
+                partition.columns[name].fromfile(f, header[0])
+        return partition
+
+
+# Archive of closed parking records, partitioned by exit day.
+# With spill_directory set, only the newest max_resident_days partitions stay in memory.
+class ParkingHistoryArchive:
+    def __init__(self, spill_directory: str = None, max_resident_days: int = 7):
+        self.spill_directory = spill_directory
+        self.max_resident_days = max_resident_days
+        self.days: List[int] = []  # sorted day ordinals, resident or spilled
+        self.partitions: Dict[int, DayPartition] = {}  # resident partitions
+        self.licenses: List[str] = []  # license id -> license
+        self.license_ids: Dict[str, int] = {}
+        if spill_directory:
+            os.makedirs(spill_directory, exist_ok=True)
+
+    def get_license_id(self, license: str) -> int:
+        license_id = self.license_ids.get(license)
+        if license_id is None:
+            license_id = len(self.licenses)
+            self.license_ids[license] = license_id
+            self.licenses.append(license)
+        return license_id
+
+    # Move closed records into the archive. Records must have an exit time.
+    def add_records(self, records: List[ParkingRecord]):
+        by_day: Dict[int, list] = {}
+        for record in records:
+            payment = record.payment
+            row = (
+                record.exit_time.timestamp(),
+                record.entry_time.timestamp(),
+                payment.get_amount() if payment is not None else float("nan"),
+                self.get_license_id(record.vehicle.get_license_number()),
+                record.spot.level_id,
+                record.spot.id,
+                record.vehicle.get_vehicle_type().value,
+            )
+            by_day.setdefault(record.exit_time.date().toordinal(), []).append(row)
+
+        for day, rows in by_day.items():
+            rows.sort(key=lambda row: row[0])
+            self.get_partition(day, create=True).append_rows(rows)
+        self.spill()
+
+    def get_partition(self, day: int, create: bool = False) -> Optional[DayPartition]:
+        partition = self.partitions.get(day)
+        if partition is not None:
+            return partition
+        i = bisect_left(self.days, day)
+        if i < len(self.days) and self.days[i] == day:
+            partition = DayPartition.load(day, self.spill_path(day))
+            if create:
+                # appending to a spilled day - bring it back until the next spill
+                self.partitions[day] = partition
+            return partition
+        if not create:
+            return None
+        self.days.insert(i, day)
+        partition = self.partitions[day] = DayPartition(day)
+        return partition
+
+    def spill_path(self, day: int) -> str:
+        return os.path.join(self.spill_directory, f"{date.fromordinal(day).isoformat()}.bin")
+
+    # write the oldest resident partitions to disk until max_resident_days are left
+    def spill(self):
+        if not self.spill_directory or len(self.partitions) <= self.max_resident_days:
+            return
+        for day in sorted(self.partitions)[:len(self.partitions) - self.max_resident_days]:
+            self.partitions.pop(day).save(self.spill_path(day))
+
+    def iter_partitions(self, start: Optional[datetime], end: Optional[datetime]):
+        lo = bisect_left(self.days, start.date().toordinal()) if start else 0
+        hi = bisect_right(self.days, end.date().toordinal()) if end else len(self.days)
+        for day in self.days[lo:hi]:
+            yield self.get_partition(day)
+
+    def materialize(self, partition: DayPartition, row: int) -> ArchivedParkingRecord:
+        columns = partition.columns
+        amount = columns["amount"][row]
+        payment = None
+        if amount == amount:  # not NaN
+            payment = Payment(amount, datetime.fromtimestamp(columns["exit_ts"][row]))
+            payment.complete_payment()
+        return ArchivedParkingRecord(
+            self.licenses[columns["license_id"][row]],
+            VEHICLE_TYPES[columns["vehicle_type"][row]],
+            columns["level_id"][row],
+            columns["spot_id"][row],
+            datetime.fromtimestamp(columns["entry_ts"][row]),
+            datetime.fromtimestamp(columns["exit_ts"][row]),
+            payment,
+        )
+
+    # All records that exited in [start, end], in exit order
+    def get_exits_between(self, start: datetime = None, end: datetime = None) -> List[ArchivedParkingRecord]:
+        start_ts = start.timestamp() if start else float("-inf")
+        end_ts = end.timestamp() if end else float("inf")
+        result = []
+        for partition in self.iter_partitions(start, end):
+            lo, hi = partition.row_range(start_ts, end_ts)
+            result.extend(self.materialize(partition, row) for row in range(lo, hi))
+        return result
+
+    # Records of one license that exited in [start, end], in exit order
+    def get_parking_history(self, license: str, start: datetime = None, end: datetime = None) -> List[ArchivedParkingRecord]:
+        license_id = self.license_ids.get(license)
+        if license_id is None:
+            return []
+        start_ts = start.timestamp() if start else float("-inf")
+        end_ts = end.timestamp() if end else float("inf")
+        result = []
+        for partition in self.iter_partitions(start, end):
+            rows = partition.get_license_rows(license_id)
+            exit_ts = partition.columns["exit_ts"]
+            lo = bisect_left(rows, start_ts, key=lambda row: exit_ts[row])
+            hi = bisect_right(rows, end_ts, key=lambda row: exit_ts[row])
+            result.extend(self.materialize(partition, row) for row in rows[lo:hi])
+        return result
+
+    def get_record_count(self) -> int:
+        return sum(len(self.get_partition(day)) for day in self.days)
@@ -1,6 +1,9 @@
-from typing import List
+import heapq
+from typing import List, Dict
 from level import Level
+from spot_size import SpotSize
 from vehicle import Vehicle
+from vehicle_type import VehicleType
 
 class ParkingLot():
     _instance = None
@@ -11,6 +14,11 @@ class ParkingLot():
         else:
             ParkingLot._instance = self
             self.levels : List[Level] = []
+            # per size, a min-heap of level indexes that may have a free spot of that size.
+            # Full levels are dropped lazily and pushed back when a spot frees up.
+            self.levels_with_space : Dict[SpotSize, List[int]] = {size : [] for size in SpotSize}
+            self.in_heap : Dict[SpotSize, set] = {size : set() for size in SpotSize}
+            self.vehicle_levels : Dict[Vehicle, int] = {}
 
     @staticmethod
     def get_instance():
@@ -20,19 +28,46 @@ class ParkingLot():
 
     def add_level(self, level : Level) -> None:
         self.levels.append(level)
+        for size in SpotSize:
+            self.mark_space(size, len(self.levels) - 1)
+
+    def mark_space(self, size : SpotSize, index : int) -> None:
+        if index not in self.in_heap[size] and self.levels[index].get_free_spots_of_size(size) > 0:
+            heapq.heappush(self.levels_with_space[size], index)
+            self.in_heap[size].add(index)
+
+    # lowest level with a free spot of this size, or None
+    def level_with_space(self, size : SpotSize):
+        heap = self.levels_with_space[size]
+        while heap:
+            if self.levels[heap[0]].get_free_spots_of_size(size) > 0:
+                return heap[0]
+            self.in_heap[size].discard(heapq.heappop(heap))
+        return None
     
+    # best fit across the lot: smallest compatible size first, then the lowest level that has one
     def park_vehicle(self, vehicle : Vehicle) -> bool:
-        for level in self.levels:
-            if level.park_vehicle(vehicle):
+        for size in SpotSize.compatible(vehicle.get_type()):
+            index = self.level_with_space(size)
+            if index is not None and self.levels[index].park_vehicle_in_size(vehicle, size):
+                self.vehicle_levels[vehicle] = index
                 return True
         return False
     
     def unpark_vehicle(self, vehicle : Vehicle) -> bool:
-        for level in self.levels:
-            if level.unpark_vehicle(vehicle):
-                return True
-        return False
+        index = self.vehicle_levels.pop(vehicle, None)
+        if index is None:
+            return False
+        level = self.levels[index]
+        size = level.vehicle_spots[vehicle].get_size()
+        level.unpark_vehicle(vehicle)
+        self.mark_space(size, index)
+        return True
     
+    # free spots per type for every floor, without scanning spots
+    def availability_summary(self) -> Dict[int, Dict[VehicleType, int]]:
+        return {level.floor : level.availability_summary() for level in self.levels}
+
     def display_availability(self) -> None:
         for level in self.levels:
-            level.display_availability()
\ No newline at end of file
+            level.display_availability()
@@ -5,13 +5,14 @@ from vehicle_type import VehicleType
 # from truck import Truck
 # from motorcycle import Motorcycle
 from level import Level
+from spot_size import SpotSize
 from vehicle_factory import Vehiclefactory
 
 class ParkingLotDemo:
     def run():
         parking_lot = ParkingLot.get_instance()
-        parking_lot.add_level(Level(1,3))
-        parking_lot.add_level(Level(2,3))
+        parking_lot.add_level(Level(1, spot_sizes=[SpotSize.SMALL, SpotSize.MEDIUM, SpotSize.MEDIUM]))
+        parking_lot.add_level(Level(2, spot_sizes=[SpotSize.MEDIUM, SpotSize.LARGE, SpotSize.LARGE]))
 
 
         # before the factory design pattern
@@ -38,6 +39,9 @@ class ParkingLotDemo:
 
         # Display updated availability
         parking_lot.display_availability()
+
+        # Free spots per floor and type, from the counters
+        print(parking_lot.availability_summary())
 if __name__ == "__main__":
     ParkingLotDemo.run()
 
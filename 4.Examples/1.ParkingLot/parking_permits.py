@@ -0,0 +1,269 @@
+# Permit registry - monthly permit holders exit without paying.
+#
+# Gate check: a Bloom filter (one bytearray, k bit probes from a single
+# blake2b digest) answers the common "not a permit holder" case; only keys it
+# lets through are confirmed in an exact set. The exact set is every license
+# sorted into one bytes blob, found by a bisect over every 64th key and a
+# blob.find in that block - no dict or set of Python strings, ~(license length
+# + 1) bytes per permit. It can be saved to a file and opened with mmap.
+#
+# Reload builds a complete new snapshot (filter + exact set) off to the side
+# and then swaps one reference, so gate checks never wait on a reload and never
+# see a half-built list.
+#
+# ParkingLotSystem.set_permit_registry(registry) makes calculate_payment charge
+# 0 for permit holders.
+import hashlib
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from typing import Iterable, Iterator, List
+
+MAGIC = b"PRMT2\n"
+HEADER = struct.Struct("<QQ")  # number of licenses, number of block starts
+BLOCK = 64
+
+
+def permit_key(license: str) -> bytes:
+    return license.strip().upper().encode()
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))  # bits
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    # probes are h1, h1 + h2, h1 + 2*h2, ... (mod size) from one 128-bit digest
+    @staticmethod
+    def digest(key: bytes):
+        value = int.from_bytes(hashlib.blake2b(key, digest_size=16).digest(), "little")
+        return value & 0xFFFFFFFFFFFFFFFF, (value >> 64) | 1
+
+    def add(self, key: bytes):
+        bits, size = self.bits, self.size
+        position, step = self.digest(key)
+        for _ in range(self.hashes):
+            position %= size
+            bits[position >> 3] |= 1 << (position & 7)
+            position += step
+
+    # stops at the first clear bit - most absent keys cost one or two probes
+    def __contains__(self, key: bytes) -> bool:
+        bits, size = self.bits, self.size
+        position, step = self.digest(key)
+        for _ in range(self.hashes):
+            position %= size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+            position += step
+        return True
+
+
+# Sorted, deduplicated keys in one newline-separated blob (b"\nk1\nk2\n...\n").
+# fences holds the first key of every BLOCK keys and starts the position of the
+# newline in front of it, so a lookup is a bisect over the fences and one
+# blob.find inside a block - both in C. Takes ~(key length + 1) bytes per key.
+class CompactKeySet:
+    def __init__(self, blob, starts: array, fences: List[bytes], count: int, backing=None):
+        self.blob = blob  # bytes, or an mmap of a saved file
+        self.starts = starts  # block i spans blob[starts[i]:starts[i + 1] + 1]
+        self.fences = fences
+        self.count = count
+        self.backing = backing  # open file when loaded from disk
+
+    @staticmethod
+    def build(keys: Iterable[bytes]) -> 'CompactKeySet':
+        ordered = sorted({key for key in keys if key})
+        starts, fences = array('Q'), []
+        position = 0
+        for i, key in enumerate(ordered):
+            if i % BLOCK == 0:
+                starts.append(position)
+                fences.append(key)
+            position += 1 + len(key)
+        starts.append(position)
+        return CompactKeySet(b"\n" + b"".join(key + b"\n" for key in ordered), starts, fences, len(ordered))
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key: bytes) -> bool:
+        i = bisect_right(self.fences, key) - 1
+        if i < 0:
+            return False
+        return self.blob.find(b"\n" + key + b"\n", self.starts[i], self.starts[i + 1] + 1) >= 0
+
+    def __iter__(self) -> Iterator[bytes]:
+        for i in range(len(self.fences)):
+            yield from bytes(self.blob[self.starts[i] + 1:self.starts[i + 1]]).split(b"\n")
+
+    def size_bytes(self) -> int:
+        return len(self.blob) + self.starts.itemsize * len(self.starts)
+
+    def save(self, path: str):
+        base = self.starts[0] if self.starts else 0
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            f.write(HEADER.pack(self.count, len(self.starts)))
+            f.write(array('Q', (start - base for start in self.starts)).tobytes())
+            f.write(self.blob[base:self.starts[-1] + 1])
+        os.replace(tmp, path)  # readers never see a partial file
+
+    # map the file; only the fences are read up front, blocks are paged in on lookup
+    @staticmethod
+    def open(path: str) -> 'CompactKeySet':
+        f = open(path, "rb")
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapped[:len(MAGIC)] != MAGIC:
+            mapped.close()
+            f.close()
+            raise ValueError(f"{path} is not a permit file")
+        count, blocks = HEADER.unpack_from(mapped, len(MAGIC))
+        table = len(MAGIC) + HEADER.size
+        base = table + blocks * 8
+        starts = array('Q', mapped[table:base])
+        for i in range(len(starts)):
+            starts[i] += base
+        fences = [mapped[start + 1:mapped.find(b"\n", start + 1)] for start in starts[:-1]]
+        return CompactKeySet(mapped, starts, fences, count, backing=f)
+
+    def close(self):
+        if self.backing is not None:
+            self.blob.close()
+            self.backing.close()
+            self.backing = None
+
+
+class PermitSnapshot:
+    def __init__(self, exact: CompactKeySet, error_rate: float):
+        self.exact = exact
+        self.bloom = BloomFilter(len(exact), error_rate)
+        for key in exact:
+            self.bloom.add(key)
+
+
+class PermitRegistry:
+    def __init__(self, licenses: Iterable[str] = (), error_rate: float = 0.01):
+        self.error_rate = error_rate
+        self.snapshot = PermitSnapshot(CompactKeySet.build(permit_key(l) for l in licenses), error_rate)
+        self.reload_lock = threading.Lock()  # one reload at a time; checks never take it
+        # counters for tuning error_rate; plain increments, approximate under threads
+        self.checks = 0
+        self.bloom_passes = 0
+        self.false_positives = 0
+
+    def __len__(self):
+        return len(self.snapshot.exact)
+
+    def is_permit_holder(self, license: str) -> bool:
+        snapshot = self.snapshot  # one read - a concurrent reload can't split the check
+        key = permit_key(license)
+        self.checks += 1
+        if key not in snapshot.bloom:
+            return False
+        self.bloom_passes += 1
+        if key in snapshot.exact:
+            return True
+        self.false_positives += 1
+        return False
+
+    # Replace the whole permit list. Gate checks keep using the old snapshot until the swap.
+    def reload(self, licenses: Iterable[str]):
+        exact = CompactKeySet.build(permit_key(l) for l in licenses)
+        self.install(exact)
+
+    # reload from a saved CompactKeySet file (mmap'd, not read into memory)
+    def reload_from_file(self, path: str):
+        self.install(CompactKeySet.open(path))
+
+    # reload from a text file with one license per line
+    def reload_from_text(self, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            self.reload(line for line in f if line.strip())
+
+    def install(self, exact: CompactKeySet):
+        with self.reload_lock:
+            snapshot = PermitSnapshot(exact, self.error_rate)
+            self.snapshot = snapshot
+        # an old mmap'd set is not closed here: a check that read the old snapshot may still be using it
+
+    def reload_in_background(self, licenses: Iterable[str]) -> threading.Thread:
+        thread = threading.Thread(target=self.reload, args=(licenses,), daemon=True, name="permit-reload")
+        thread.start()
+        return thread
+
+    def save(self, path: str):
+        self.snapshot.exact.save(path)
+
+
+# Permit demo: 1M permits, a stream of mostly non-permit exits, reload while checking
+class PermitDemo:
+    @staticmethod
+    def run():
+        import random
+        import string
+        from all import ParkingLotSystem, FactoryVehicle, VehicleType
+
+        rng = random.Random(8)
+        alphabet = string.ascii_uppercase + string.digits
+
+        def plates(n):
+            return ["".join(rng.choices(alphabet, k=7)) for _ in range(n)]
+
+        permits = plates(1_000_000)
+        began = time.perf_counter()
+        registry = PermitRegistry(permits)
+        snapshot = registry.snapshot
+        print(f"Loaded {len(registry):,} permits in {time.perf_counter() - began:.1f}s: "
+              f"bloom {len(snapshot.bloom.bits) / 1e6:.1f} MB ({snapshot.bloom.hashes} probes), "
+              f"exact set {snapshot.exact.size_bytes() / 1e6:.1f} MB")
+
+        visitors, holders = plates(200_000), rng.sample(permits, 20_000)
+        for label, licenses in (("visitor", visitors), ("permit holder", holders)):
+            began = time.perf_counter()
+            found = sum(registry.is_permit_holder(p) for p in licenses)
+            elapsed = time.perf_counter() - began
+            print(f"{len(licenses):,} {label} exits: {elapsed / len(licenses) * 1e6:.2f} us/check, {found:,} with permits")
+        print(f"{registry.false_positives} bloom false positives ({registry.false_positives / len(visitors):.2%})")
+        exits = visitors + holders
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "permits.bin")
+            CompactKeySet.build(permit_key(p) for p in permits[:500_000]).save(path)
+            thread = threading.Thread(target=registry.reload_from_file, args=(path,))
+            thread.start()
+            checked = 0
+            while thread.is_alive():  # gates keep checking during the reload
+                registry.is_permit_holder(exits[checked % len(exits)])
+                checked += 1
+            thread.join()
+            print(f"Reloaded {len(registry):,} permits from an mmap'd file; {checked:,} checks ran meanwhile")
+            print(f"{permits[0]} still a permit: {registry.is_permit_holder(permits[0])}, "
+                  f"{permits[-1]}: {registry.is_permit_holder(permits[-1])}")
+
+            ps = ParkingLotSystem()
+            ps.add_level(10)
+            ps.set_permit_registry(registry)
+            for license in (permits[0], "NOPERMIT1"):
+                from datetime import timedelta
+                record = ps.park(FactoryVehicle.create_vehicle(VehicleType.CAR, license))
+                record.entry_time -= timedelta(hours=3)
+                ps.unpark_by_license(license)
+                print(f"{license} pays {ps.process_payment(record).get_amount():.2f}")
+            registry.snapshot.exact.close()
+
+
+if __name__ == "__main__":
+    PermitDemo.run()
+
+
+# python3 4.Examples/1.ParkingLot/parking_permits.py
@@ -0,0 +1,334 @@
+# Persistence for ParkingSystem - write-ahead log plus periodic snapshots.
+#
+# Every level/park/unpark/payment event is appended to a WAL as one JSON line.
+# Appends only go to an in-memory buffer; a background thread writes the
+# buffer and fsyncs once per commit interval (group commit), so the gate path
+# never waits on the disk. Callers that need durability for one event can
+# wait_durable(lsn).
+#
+# A snapshot is a compact JSON dump of the lot (levels, open sessions and the
+# in-memory history). Taking one cuts the WAL at the current LSN while the
+# levels lock and every level lock are held - level, park and unpark events
+# fire under those locks, so the cut and the captured state agree - and
+# recovery loads the newest snapshot and replays only the WAL segments written
+# after it. Replaying an event the snapshot already has changes nothing.
+# Records already moved to a history archive are not part of the snapshot -
+# the archive keeps its own files.
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from all import (ParkingLotSystem, ParkingEventObserver, ParkingRecord, Payment, Level,
+                 FactoryVehicle, VehicleType)
+
+SNAPSHOT_FILE = "snapshot.json"
+
+
+class WriteAheadLog:
+    def __init__(self, directory: str, commit_interval: float = 0.005, next_lsn: int = 1):
+        self.directory = directory
+        self.commit_interval = commit_interval
+        self.next_lsn = next_lsn
+        self.durable_lsn = next_lsn - 1
+        self.buffer: List[str] = []
+        self.lock = threading.Lock()  # guards buffer and next_lsn - held only for an append
+        self.file_lock = threading.Lock()  # one writer at a time, and segment switches
+        self.durable = threading.Condition()
+        # a segment that already starts at next_lsn holds no complete entry (at most a torn one)
+        self.file = open(self.segment_path(next_lsn), "w", encoding="utf-8")
+        self.closed = False
+        self.flusher = threading.Thread(target=self.run_flusher, daemon=True)
+        self.flusher.start()
+
+    def segment_path(self, start_lsn: int) -> str:
+        return os.path.join(self.directory, f"wal-{start_lsn:012d}.log")
+
+    @staticmethod
+    def segments(directory: str) -> List[str]:
+        return sorted(name for name in os.listdir(directory) if name.startswith("wal-") and name.endswith(".log"))
+
+    # buffer one event, returns its LSN; never touches the disk
+    def append(self, entry: dict) -> int:
+        payload = json.dumps(entry, separators=(",", ":"))
+        with self.lock:
+            lsn = self.next_lsn
+            self.next_lsn += 1
+            self.buffer.append(f"{lsn}\t{payload}\n")
+        return lsn
+
+    def run_flusher(self):
+        while not self.closed:
+            time.sleep(self.commit_interval)
+            self.flush()
+
+    # group commit: write everything buffered so far, one fsync for the whole batch
+    def flush(self):
+        with self.file_lock:
+            with self.lock:
+                pending, self.buffer = self.buffer, []
+                last_lsn = self.next_lsn - 1
+            self.write_batch(pending, last_lsn)
+
+    def write_batch(self, pending: List[str], last_lsn: int):
+        if pending:
+            self.file.write("".join(pending))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        with self.durable:
+            self.durable_lsn = last_lsn
+            self.durable.notify_all()
+
+    def wait_durable(self, lsn: int, timeout: float = None) -> bool:
+        with self.durable:
+            return self.durable.wait_for(lambda: self.durable_lsn >= lsn, timeout)
+
+    # Close the current segment at the current LSN and start a new one.
+    # Returns the last LSN in the closed segment.
+    def roll(self) -> int:
+        with self.file_lock:
+            with self.lock:
+                pending, self.buffer = self.buffer, []
+                cut = self.next_lsn - 1
+            self.write_batch(pending, cut)
+            self.file.close()
+            self.file = open(self.segment_path(cut + 1), "w", encoding="utf-8")
+        return cut
+
+    # drop segments that only hold events up to lsn
+    def delete_segments_through(self, lsn: int):
+        names = self.segments(self.directory)
+        for name, next_name in zip(names, names[1:]):
+            if int(next_name[4:-4]) - 1 <= lsn:
+                os.remove(os.path.join(self.directory, name))
+
+    def close(self):
+        self.closed = True
+        self.flusher.join()
+        self.flush()
+        self.file.close()
+
+    # (lsn, entry) for every logged event after after_lsn; a torn line can only be the
+    # last one of a segment (a crash mid-write), so the rest of that segment is skipped
+    @staticmethod
+    def read_entries(directory: str, after_lsn: int = 0):
+        for name in WriteAheadLog.segments(directory):
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        lsn, payload = line.split("\t", 1)
+                        lsn, entry = int(lsn), json.loads(payload)
+                    except ValueError:
+                        break
+                    if lsn > after_lsn:
+                        yield lsn, entry
+
+
+class ParkingPersistence(ParkingEventObserver):
+    def __init__(self, parking_system: ParkingLotSystem, directory: str,
+                 commit_interval: float = 0.005, snapshot_every: int = 100000):
+        self.parking_system = parking_system
+        self.directory = directory
+        self.commit_interval = commit_interval
+        self.snapshot_every = snapshot_every
+        self.events_since_snapshot = 0
+        self.events_lock = threading.Lock()  # events are logged from every gate thread
+        self.wal: Optional[WriteAheadLog] = None
+        self.snapshot_lock = threading.Lock()
+        self.snapshotter: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+
+    # Load the snapshot, replay the WAL tail, then start logging new events.
+    # Call on an empty system, before it takes traffic. Returns the number of events replayed.
+    def start(self) -> int:
+        snapshot_lsn = self.load_snapshot()
+        last_lsn, replayed = snapshot_lsn, 0
+        for lsn, entry in WriteAheadLog.read_entries(self.directory, snapshot_lsn):
+            self.replay(entry)
+            last_lsn, replayed = lsn, replayed + 1
+        self.wal = WriteAheadLog(self.directory, self.commit_interval, last_lsn + 1)
+        self.parking_system.add_event_observer(self)
+        self.snapshotter = threading.Thread(target=self.run_snapshotter, daemon=True)
+        self.snapshotter.start()
+        return replayed
+
+    def stop(self):
+        self.stopped.set()
+        self.parking_system.remove_event_observer(self)
+        self.snapshotter.join()
+        self.wal.close()
+
+    # ---- logging ----
+
+    def log(self, entry: dict) -> int:
+        with self.events_lock:
+            self.events_since_snapshot += 1
+        return self.wal.append(entry)
+
+    def on_level_added(self, level: Level):
+        self.log({"op": "level", "level": level.id, "spots": level.get_spot_count()})
+
+    def on_park(self, record: ParkingRecord):
+        self.log({"op": "park", "level": record.spot.level_id, "spot": record.spot.id,
+                  "license": record.vehicle.get_license_number(), "type": record.vehicle.get_vehicle_type().name,
+                  "entry": record.entry_time.isoformat()})
+
+    def on_unpark(self, record: ParkingRecord):
+        self.log({"op": "unpark", "level": record.spot.level_id, "spot": record.spot.id,
+                  "license": record.vehicle.get_license_number(), "exit": record.exit_time.isoformat()})
+
+    def on_payment(self, record: ParkingRecord):
+        self.log({"op": "pay", "license": record.vehicle.get_license_number(),
+                  "entry": record.entry_time.isoformat(), "amount": record.payment.get_amount(),
+                  "date": record.payment.payment_date.isoformat()})
+
+    # ---- snapshots ----
+
+    def run_snapshotter(self):
+        while not self.stopped.wait(1.0):
+            if self.events_since_snapshot >= self.snapshot_every:
+                self.snapshot()
+
+    # Write a snapshot and drop the WAL segments it covers. Safe while traffic is running:
+    # the level list, the roll and the list of records are taken under the levels lock
+    # and every level lock, so a level or session added after the cut is in the WAL
+    # tail and not in the snapshot.
+    # Records are encoded after the locks are released; a later exit or payment
+    # showing up in them is also in the tail and replays as a no-op.
+    def snapshot(self):
+        with self.snapshot_lock:
+            ps = self.parking_system
+            with ps.levels_lock:  # no level is added between the list and the cut
+                levels = list(ps.levels)
+                for level in levels:  # in id order, the only place more than one is held
+                    level.lock.acquire()
+                try:
+                    cut = self.wal.roll()
+                    with ps.records_lock:
+                        records = [r for history in ps.parking_records.values() for r in history]
+                finally:
+                    for level in reversed(levels):
+                        level.lock.release()
+            with self.events_lock:
+                self.events_since_snapshot = 0
+            state = {
+                "lsn": cut,
+                "levels": [level.get_spot_count() for level in levels],
+                "records": [self.encode_record(r) for r in records],
+            }
+            path = os.path.join(self.directory, SNAPSHOT_FILE)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(state, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + ".tmp", path)
+            self.wal.delete_segments_through(cut)
+
+    @staticmethod
+    def encode_record(record: ParkingRecord) -> list:
+        payment = record.payment if record.is_payment_completed() else None
+        return [record.spot.level_id, record.spot.id, record.vehicle.get_license_number(),
+                record.vehicle.get_vehicle_type().name, record.entry_time.isoformat(),
+                record.exit_time.isoformat() if record.exit_time else None,
+                payment.get_amount() if payment else None,
+                payment.payment_date.isoformat() if payment else None]
+
+    def load_snapshot(self) -> int:
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if not os.path.exists(path):
+            return 0
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+        ps = self.parking_system
+        for spots in state["levels"]:
+            ps.add_level(spots)
+        for level_id, spot_id, license, type_name, entry, exit, amount, paid_at in state["records"]:
+            vehicle = FactoryVehicle.create_vehicle(VehicleType[type_name], license)
+            if exit is None:
+                record = ps.park_at(vehicle, level_id, spot_id)
+            else:
+                record = ParkingRecord(vehicle, ps.levels[level_id].find_spot_by_id(spot_id))
+                record.exit_time = datetime.fromisoformat(exit)
+                ps.parking_records.setdefault(license, []).append(record)
+            record.entry_time = datetime.fromisoformat(entry)
+            if amount is not None:
+                self.restore_payment(record, amount, paid_at)
+        return state["lsn"]
+
+    # ---- replay ----
+
+    def replay(self, entry: dict):
+        ps = self.parking_system
+        op = entry["op"]
+        if op == "level":
+            if entry["level"] >= len(ps.levels):
+                ps.add_level(entry["spots"])
+        elif op == "park":
+            entry_time = datetime.fromisoformat(entry["entry"])
+            if any(r.entry_time == entry_time for r in ps.parking_records.get(entry["license"], ())):
+                return  # already in the snapshot, open or closed
+            vehicle = FactoryVehicle.create_vehicle(VehicleType[entry["type"]], entry["license"])
+            record = ps.park_at(vehicle, entry["level"], entry["spot"])
+            if record is not None:
+                record.entry_time = entry_time
+        elif op == "unpark":
+            for record in list(ps.active_records.get(entry["license"], ())):
+                if (record.spot.level_id, record.spot.id) == (entry["level"], entry["spot"]):
+                    ps.close_session(record.spot, record)
+                    record.exit_time = datetime.fromisoformat(entry["exit"])
+                    break
+        elif op == "pay":
+            entry_time = datetime.fromisoformat(entry["entry"])
+            for record in reversed(ps.parking_records.get(entry["license"], [])):
+                if record.entry_time == entry_time:
+                    if not record.is_payment_completed():
+                        self.restore_payment(record, entry["amount"], entry["date"])
+                    break
+
+    @staticmethod
+    def restore_payment(record: ParkingRecord, amount: float, paid_at: str):
+        payment = Payment(amount, datetime.fromisoformat(paid_at))
+        payment.complete_payment()
+        record.set_payment(payment)
+
+
+# Persistence demo: run, "crash", recover
+class ParkingPersistenceDemo:
+    @staticmethod
+    def run():
+        import tempfile
+        directory = tempfile.mkdtemp(prefix="parking-wal-")
+
+        ps = ParkingLotSystem()
+        persistence = ParkingPersistence(ps, directory)
+        persistence.start()
+        ps.add_level(30000)
+        ps.add_level(30000)
+        for i in range(50000):
+            ps.park(FactoryVehicle.create_vehicle(VehicleType.CAR, f"PLATE{i}"))
+        persistence.snapshot()
+        for i in range(1000):
+            record = ps.unpark_by_license(f"PLATE{i}")
+            ps.process_payment(record)
+        print(f"Before restart: {len(ps.occupied_spots)} active sessions, {ps.get_free_spot_count()} free spots")
+        # stop flushes the last group commit, like a clean shutdown
+        persistence.stop()
+
+        start = time.perf_counter()
+        recovered = ParkingLotSystem()
+        replay = ParkingPersistence(recovered, directory)
+        replayed = replay.start()
+        elapsed = time.perf_counter() - start
+        print(f"After restart: {len(recovered.occupied_spots)} active sessions, {recovered.get_free_spot_count()} free spots")
+        print(f"Recovered in {elapsed:.2f}s, replayed {replayed} WAL events after the snapshot")
+        replay.stop()
+
+
+if __name__ == "__main__":
+    ParkingPersistenceDemo.run()
+
+
+# python3 4.Examples/1.ParkingLot/parking_persistence.py
@@ -0,0 +1,308 @@
+# Gate log replay - stream recorded gate events through a parking system.
+#
+# Every stage is a generator, so only the current chunk and the current event
+# are in memory whatever the log size:
+#   read_lines      fixed-size chunks of the file -> lines (plain or .gz)
+#   parse_csv/jsonl lines -> GateEvent
+#   GateLogReplay   GateEvent -> FactoryVehicle.create_vehicle -> park / unpark_by_license
+#                   (+ process_payment), with the lot on a VirtualClock that
+#                   follows the log timestamps
+#
+# Log columns / keys: timestamp (ISO 8601 or epoch seconds), license,
+# vehicle_type (CAR / BIKE / TRUCK or 1 / 2 / 3), gate, direction (in / out).
+#
+# The lot itself keeps every closed record, so for month-long logs give it a
+# history archive (ParkingHistoryArchive with a spill directory, or
+# DiscardedHistory to drop them) - replay archives closed records every
+# archive_every events.
+import csv
+import gzip
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from all import ParkingLotSystem, FactoryVehicle, VehicleType, Clock, VirtualClock
+
+CHUNK_SIZE = 1 << 20
+ENTRY_DIRECTIONS = {"in", "entry", "enter"}
+EXIT_DIRECTIONS = {"out", "exit", "leave"}
+FIELDS = ["timestamp", "license", "vehicle_type", "gate", "direction"]
+MAX_ERROR_SAMPLES = 10
+
+
+class GateEvent:
+    __slots__ = ('timestamp', 'license', 'vehicle_type', 'gate', 'direction')
+
+    def __init__(self, timestamp: datetime, license: str, vehicle_type: VehicleType, gate: str, direction: str):
+        self.timestamp = timestamp
+        self.license = license
+        self.vehicle_type = vehicle_type
+        self.gate = gate
+        self.direction = direction
+
+    @staticmethod
+    def from_fields(fields: Dict[str, str]) -> 'GateEvent':
+        direction = str(fields["direction"]).strip().lower()
+        if direction not in ENTRY_DIRECTIONS and direction not in EXIT_DIRECTIONS:
+            raise ValueError(f"unknown direction {fields['direction']!r}")
+        return GateEvent(parse_timestamp(fields["timestamp"]), str(fields["license"]).strip(),
+                         parse_vehicle_type(fields.get("vehicle_type")), str(fields.get("gate", "")), direction)
+
+    def is_entry(self) -> bool:
+        return self.direction in ENTRY_DIRECTIONS
+
+
+def parse_timestamp(value) -> datetime:
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value)
+    value = value.strip()
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return datetime.fromtimestamp(float(value))
+
+
+def parse_vehicle_type(value) -> Optional[VehicleType]:
+    if value is None or value == "":
+        return None  # exits don't need it
+    if isinstance(value, int) or str(value).strip().isdigit():
+        return VehicleType(int(value))
+    return VehicleType[str(value).strip().upper()]
+
+
+def open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, "r", encoding="utf-8", newline="")
+
+
+# lines of a file, read chunk_size characters at a time
+def read_lines(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    with open_text(path) as f:
+        pending = ""
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            lines = (pending + chunk).split("\n")
+            pending = lines.pop()  # incomplete last line, if any
+            yield from lines
+        if pending:
+            yield pending
+
+
+# CSV with a header row naming the columns
+def parse_csv(lines: Iterable[str], errors: 'ReplayErrors') -> Iterator[GateEvent]:
+    for row in csv.DictReader(line for line in lines if line.strip()):
+        try:
+            yield GateEvent.from_fields(row)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            errors.add(row, e)
+
+
+def parse_jsonl(lines: Iterable[str], errors: 'ReplayErrors') -> Iterator[GateEvent]:
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield GateEvent.from_fields(json.loads(line))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            errors.add(line, e)
+
+
+def read_events(path: str, errors: 'ReplayErrors', chunk_size: int = CHUNK_SIZE) -> Iterator[GateEvent]:
+    name = path[:-3] if path.endswith(".gz") else path
+    parse = parse_jsonl if name.endswith((".jsonl", ".ndjson", ".json")) else parse_csv
+    return parse(read_lines(path, chunk_size), errors)
+
+
+# malformed lines are counted and a few kept for the report - one bad line
+# shouldn't abort a month of replay
+class ReplayErrors:
+    def __init__(self):
+        self.count = 0
+        self.samples: List[str] = []
+
+    def add(self, source, error: Exception):
+        self.count += 1
+        if len(self.samples) < MAX_ERROR_SAMPLES:
+            self.samples.append(f"{error!r}: {str(source)[:120]}")
+
+
+# history archive that drops closed records - for replays that only need the totals
+class DiscardedHistory:
+    def __init__(self):
+        self.discarded = 0
+
+    def add_records(self, records):
+        self.discarded += len(records)
+
+    def get_parking_history(self, license: str, start: datetime = None, end: datetime = None):
+        return []
+
+    def get_exits_between(self, start: datetime = None, end: datetime = None):
+        return []
+
+
+class ReplayStats:
+    def __init__(self):
+        self.events = 0
+        self.parked = 0
+        self.exited = 0
+        self.rejected = 0  # entries with the lot full
+        self.duplicate_entries = 0  # entry for a license that is already inside
+        self.unknown_exits = 0  # exit without an open session
+        self.out_of_order = 0  # events stamped before the previous one; applied at the clock's time
+        self.revenue_by_type: Dict[VehicleType, float] = {}
+        self.first_timestamp: Optional[datetime] = None
+        self.last_timestamp: Optional[datetime] = None
+        self.wall_seconds = 0.0
+        self.errors = ReplayErrors()
+
+    def events_per_second(self) -> float:
+        return self.events / self.wall_seconds if self.wall_seconds else 0.0
+
+    def report(self) -> str:
+        span = (self.last_timestamp - self.first_timestamp) if self.first_timestamp else timedelta(0)
+        revenue = ", ".join(f"{t.name} {amount:,.2f}" for t, amount in self.revenue_by_type.items())
+        lines = [
+            f"{self.events:,} events ({span} of log) in {self.wall_seconds:.2f}s: {self.events_per_second():,.0f} events/s",
+            f"parked {self.parked:,}, exited {self.exited:,}, rejected {self.rejected:,}, "
+            f"duplicate entries {self.duplicate_entries:,}, unknown exits {self.unknown_exits:,}, "
+            f"out of order {self.out_of_order:,}, malformed {self.errors.count:,}",
+            f"revenue: {revenue or '-'}",
+        ]
+        lines.extend(f"  malformed: {sample}" for sample in self.errors.samples)
+        return "\n".join(lines)
+
+
+class GateLogReplay:
+    def __init__(self, parking_system: ParkingLotSystem, archive_every: int = 10000,
+                 progress: Callable[[ReplayStats], None] = None, progress_every: int = 100000):
+        self.parking_system = parking_system
+        self.archive_every = archive_every
+        self.progress = progress
+        self.progress_every = progress_every
+
+    def replay_file(self, path: str, chunk_size: int = CHUNK_SIZE) -> ReplayStats:
+        stats = ReplayStats()
+        return self.replay(read_events(path, stats.errors, chunk_size), stats)
+
+    def replay(self, events: Iterable[GateEvent], stats: ReplayStats = None) -> ReplayStats:
+        stats = stats if stats else ReplayStats()
+        ps = self.parking_system
+        clock = VirtualClock()
+        previous_clock = Clock.get()
+        Clock.use(clock)
+        perf_counter = time.perf_counter
+        started = perf_counter()
+        try:
+            for event in events:
+                if stats.last_timestamp is None or event.timestamp >= stats.last_timestamp:
+                    clock.set(event.timestamp)
+                    stats.last_timestamp = event.timestamp
+                    if stats.first_timestamp is None:
+                        stats.first_timestamp = event.timestamp
+                else:
+                    stats.out_of_order += 1
+                self.apply(event, stats)
+                stats.events += 1
+                if self.archive_every and stats.events % self.archive_every == 0:
+                    ps.archive_closed_records()
+                if self.progress and stats.events % self.progress_every == 0:
+                    stats.wall_seconds = perf_counter() - started
+                    self.progress(stats)
+            ps.archive_closed_records()
+        finally:
+            Clock.use(previous_clock)
+            stats.wall_seconds = perf_counter() - started
+        return stats
+
+    def apply(self, event: GateEvent, stats: ReplayStats):
+        ps = self.parking_system
+        if event.is_entry():
+            if event.license in ps.active_records:
+                stats.duplicate_entries += 1
+                return
+            if event.vehicle_type is None:
+                stats.errors.add(event.license, ValueError("entry without vehicle_type"))
+                return
+            record = ps.park(FactoryVehicle.create_vehicle(event.vehicle_type, event.license))
+            if record is None:
+                stats.rejected += 1
+            else:
+                stats.parked += 1
+            return
+        record = ps.unpark_by_license(event.license)
+        if record is None:
+            stats.unknown_exits += 1
+            return
+        payment = ps.process_payment(record)
+        vehicle_type = record.vehicle.get_vehicle_type()
+        stats.revenue_by_type[vehicle_type] = stats.revenue_by_type.get(vehicle_type, 0.0) + payment.get_amount()
+        stats.exited += 1
+
+
+# Replay demo: write a synthetic week of gate traffic, then stream it back as CSV and JSONL
+class GateLogReplayDemo:
+    @staticmethod
+    def synthetic_events(days: int, cars_per_hour: int, seed: int = 11) -> Iterator[dict]:
+        import heapq
+        import random
+
+        rng = random.Random(seed)
+        start = datetime(2024, 3, 1)
+        pending = []  # (exit time, license) of vehicles still inside
+        types = [VehicleType.CAR] * 8 + [VehicleType.BIKE] + [VehicleType.TRUCK]
+        t, serial = start, 0
+        while t < start + timedelta(days=days):
+            t += timedelta(hours=rng.expovariate(cars_per_hour))
+            while pending and pending[0][0] <= t:
+                exit_time, license = heapq.heappop(pending)
+                yield {"timestamp": exit_time.isoformat(), "license": license, "vehicle_type": "",
+                       "gate": "B", "direction": "out"}
+            serial += 1
+            license = f"R{serial:07d}"
+            yield {"timestamp": t.isoformat(), "license": license, "vehicle_type": rng.choice(types).name,
+                   "gate": "A", "direction": "in"}
+            heapq.heappush(pending, (t + timedelta(hours=rng.lognormvariate(0.8, 0.7)), license))
+
+    @staticmethod
+    def run():
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, "gates.csv")
+            jsonl_path = os.path.join(directory, "gates.jsonl.gz")
+            with open(csv_path, "w", newline="") as csv_file, gzip.open(jsonl_path, "wt") as jsonl_file:
+                writer = csv.DictWriter(csv_file, fieldnames=FIELDS)
+                writer.writeheader()
+                for event in GateLogReplayDemo.synthetic_events(days=7, cars_per_hour=1200):
+                    writer.writerow(event)
+                    jsonl_file.write(json.dumps(event) + "\n")
+                csv_file.write("not,a,valid,row,in\n")
+            print(f"Wrote {os.path.getsize(csv_path) / 1e6:.1f} MB of CSV")
+
+            # the gzipped JSONL pass runs under tracemalloc to show memory stays flat;
+            # tracing slows it down, so compare throughput on the CSV pass
+            for path, traced in ((csv_path, False), (jsonl_path, True)):
+                ps = ParkingLotSystem()
+                for _ in range(4):
+                    ps.add_level(1000)
+                ps.set_history_archive(DiscardedHistory())
+                if traced:
+                    tracemalloc.start()
+                stats = GateLogReplay(ps).replay_file(path)
+                print(f"{os.path.basename(path)}:")
+                if traced:
+                    print(f"peak {tracemalloc.get_traced_memory()[1] / 1e6:.1f} MB traced (throughput slowed by tracing)")
+                    tracemalloc.stop()
+                print(stats.report())
+
+if __name__ == "__main__":
+    GateLogReplayDemo.run()
+
+
+# python3 4.Examples/1.ParkingLot/parking_replay.py
@@ -0,0 +1,428 @@
+# Advance spot reservations.
+#
+# Bookings are indexed by the free gaps they leave:
+#   - per spot, the gaps between its bookings as sorted lists, so "is spot S free
+#     from 14:00 to 18:00" is one bisect: O(log m) for m bookings on the spot
+#   - per level, every spot's gaps in an interval treap (randomized BST keyed by
+#     gap start, each node also storing the latest gap end below it), so "any spot
+#     on level L free from 14:00 to 18:00" - a gap starting by 14:00 and ending at
+#     18:00 or later - is one descent: O(log n), however many bookings exist.
+# Booking splits a gap in two, cancelling or expiring joins it back.
+#
+# Walk-ins: the book installs a walk-in filter on the parking system, so park()
+# skips any free spot with a booking starting within hold_ahead. Arriving
+# reservation holders check in with check_in(), which parks through park_at.
+#
+# Spots in all.py are not typed, so any spot fits any vehicle; pass spot_accepts
+# (level_id, spot_id, vehicle_type) -> bool to restrict spots to vehicle types.
+import bisect
+import heapq
+import itertools
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from all import ParkingLotSystem, ParkingRecord, ParkingSpot, Vehicle, FactoryVehicle, VehicleType, current_time
+
+BOOKED, CHECKED_IN, CANCELLED, EXPIRED = "booked", "checked-in", "cancelled", "expired"
+FOREVER_AGO, FOREVER = datetime.min, datetime.max  # bounds of a spot's first and last free gap
+
+
+class Reservation:
+    __slots__ = ('id', 'license', 'vehicle_type', 'level_id', 'spot_id', 'start', 'end', 'status')
+
+    def __init__(self, reservation_id: int, license: str, vehicle_type: VehicleType,
+                 level_id: int, spot_id: int, start: datetime, end: datetime):
+        self.id = reservation_id
+        self.license = license
+        self.vehicle_type = vehicle_type
+        self.level_id = level_id
+        self.spot_id = spot_id
+        self.start = start
+        self.end = end
+        self.status = BOOKED
+
+    def __repr__(self):
+        return (f"Reservation({self.id}, {self.license}, level {self.level_id} spot {self.spot_id}, "
+                f"{self.start:%Y-%m-%d %H:%M}-{self.end:%H:%M}, {self.status})")
+
+
+class IntervalNode:
+    __slots__ = ('start', 'key', 'end', 'max_end', 'priority', 'left', 'right', 'value')
+
+    def __init__(self, start, key, end, value):
+        self.start = start
+        self.key = key  # tie-break, so equal starts are distinct nodes
+        self.end = end
+        self.max_end = end
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.value = value
+
+    def update(self):
+        self.max_end = self.end
+        if self.left is not None and self.left.max_end > self.max_end:
+            self.max_end = self.left.max_end
+        if self.right is not None and self.right.max_end > self.max_end:
+            self.max_end = self.right.max_end
+
+
+# intervals in a treap ordered by (start, key), each node augmented with the max end below it
+class IntervalTreap:
+    def __init__(self):
+        self.root: Optional[IntervalNode] = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def insert(self, start, end, key, value):
+        self.root = self.insert_node(self.root, IntervalNode(start, key, end, value))
+        self.size += 1
+
+    def insert_node(self, node, new):
+        if node is None:
+            return new
+        if (new.start, new.key) < (node.start, node.key):
+            node.left = self.insert_node(node.left, new)
+            if node.left.priority > node.priority:
+                node = self.rotate_right(node)
+        else:
+            node.right = self.insert_node(node.right, new)
+            if node.right.priority > node.priority:
+                node = self.rotate_left(node)
+        node.update()
+        return node
+
+    def remove(self, start, key) -> bool:
+        size = self.size
+        self.root = self.remove_node(self.root, start, key)
+        return self.size < size
+
+    def remove_node(self, node, start, key):
+        if node is None:
+            return None
+        if (start, key) < (node.start, node.key):
+            node.left = self.remove_node(node.left, start, key)
+        elif (start, key) > (node.start, node.key):
+            node.right = self.remove_node(node.right, start, key)
+        else:
+            self.size -= 1
+            return self.merge(node.left, node.right)
+        node.update()
+        return node
+
+    # join two treaps where every key of left < every key of right
+    def merge(self, left, right):
+        if left is None:
+            return right
+        if right is None:
+            return left
+        if left.priority > right.priority:
+            left.right = self.merge(left.right, right)
+            left.update()
+            return left
+        right.left = self.merge(left, right.left)
+        right.update()
+        return right
+
+    @staticmethod
+    def rotate_right(node):
+        top = node.left
+        node.left = top.right
+        top.right = node
+        node.update()
+        top.update()
+        return top
+
+    @staticmethod
+    def rotate_left(node):
+        top = node.right
+        node.right = top.left
+        top.left = node
+        node.update()
+        top.update()
+        return top
+
+    # values of the intervals that contain [start, end): walk the search path for
+    # `start`; every left subtree hanging off it lies wholly at or before `start`,
+    # so it is only entered where its max end reaches `end`. The first match costs
+    # O(log n) and a query with no match as well.
+    def containing(self, start, end) -> Iterator[object]:
+        node = self.root
+        while node is not None:
+            if node.start <= start:
+                if node.end >= end:
+                    yield node.value
+                yield from self.ending_at_or_after(node.left, end)
+                node = node.right
+            else:
+                node = node.left
+
+    @staticmethod
+    def ending_at_or_after(node, end) -> Iterator[object]:
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node is None or node.max_end < end:
+                continue
+            if node.end >= end:
+                yield node.value
+            stack.append(node.right)
+            stack.append(node.left)
+
+
+# free gaps of one spot between its bookings, as parallel sorted lists
+class SpotGaps:
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self):
+        self.starts = [FOREVER_AGO]
+        self.ends = [FOREVER]
+
+    # index of the gap holding all of [start, end), or -1 if a booking is in the way
+    def gap_for(self, start: datetime, end: datetime) -> int:
+        i = bisect.bisect_right(self.starts, start) - 1
+        return i if i >= 0 and self.ends[i] >= end else -1
+
+    # start of the first booking after moment (FOREVER if none) - moment must be in a gap
+    def next_booking_after(self, moment: datetime) -> datetime:
+        i = bisect.bisect_right(self.starts, moment) - 1
+        return self.ends[i] if i >= 0 and self.ends[i] > moment else moment
+
+
+class ReservationBook:
+    def __init__(self, parking_system: ParkingLotSystem, hold_ahead: timedelta = timedelta(minutes=30),
+                 spot_accepts: Callable[[int, int, VehicleType], bool] = None):
+        self.parking_system = parking_system
+        self.hold_ahead = hold_ahead
+        self.spot_accepts = spot_accepts
+        self.spot_gaps: Dict[Tuple[int, int], SpotGaps] = {}  # only spots that have bookings
+        self.level_gaps: List[IntervalTreap] = []  # every free gap of every spot, per level
+        self.reservations: Dict[int, Reservation] = {}
+        self.by_end: List[Tuple[datetime, int]] = []  # (end, id) heap for expire()
+        self.ids = itertools.count(1)
+        # guards the indexes; taken after a level lock (walk-in filter), never before one
+        self.lock = threading.Lock()
+        parking_system.set_walk_in_filter(self.walk_in_allowed)
+
+    def __len__(self):
+        return len(self.reservations)
+
+    # levels added to the parking system since the last call get a gap index
+    def sync_levels(self):
+        for level in self.parking_system.levels[len(self.level_gaps):]:
+            gaps = IntervalTreap()
+            for spot_id in range(level.get_spot_count()):
+                gaps.insert(FOREVER_AGO, FOREVER, spot_id, spot_id)
+            self.level_gaps.append(gaps)
+
+    # walk-in filter: keep spots that have no booking starting within hold_ahead
+    def walk_in_allowed(self, spot: ParkingSpot, vehicle: Vehicle) -> bool:
+        gaps = self.spot_gaps.get((spot.level_id, spot.id))
+        if gaps is None:
+            return True
+        now = current_time()
+        with self.lock:
+            return gaps.next_booking_after(now) > now + self.hold_ahead
+
+    def is_available(self, level_id: int, spot_id: int, start: datetime, end: datetime) -> bool:
+        with self.lock:
+            return self.spot_free(level_id, spot_id, start, end)
+
+    # caller holds self.lock
+    def spot_free(self, level_id: int, spot_id: int, start: datetime, end: datetime,
+                  vehicle_type: VehicleType = None) -> bool:
+        if vehicle_type is not None and self.spot_accepts is not None and not self.spot_accepts(level_id, spot_id, vehicle_type):
+            return False
+        # a window that is about to start also needs the spot empty right now
+        if start <= current_time() + self.hold_ahead and not self.parking_system.levels[level_id].is_spot_free(spot_id):
+            return False
+        gaps = self.spot_gaps.get((level_id, spot_id))
+        return gaps is None or gaps.gap_for(start, end) >= 0
+
+    # a spot free for the whole window (lowest level first), or None
+    def find_free_spot(self, start: datetime, end: datetime, level_id: int = None,
+                       vehicle_type: VehicleType = None) -> Optional[Tuple[int, int]]:
+        with self.lock:
+            return self.find_free_spot_locked(start, end, level_id, vehicle_type)
+
+    def find_free_spot_locked(self, start, end, level_id, vehicle_type) -> Optional[Tuple[int, int]]:
+        self.sync_levels()
+        for level_id in ([level_id] if level_id is not None else range(len(self.level_gaps))):
+            # every spot the gap index yields is free of bookings; only vehicle type and
+            # current occupancy (for imminent windows) can still rule it out
+            for spot_id in self.level_gaps[level_id].containing(start, end):
+                if self.spot_free(level_id, spot_id, start, end, vehicle_type):
+                    return level_id, spot_id
+        return None
+
+    # Book a spot for [start, end). Without spot_id any free spot (on level_id, if given) is picked.
+    # Returns None when nothing is free for the window.
+    def reserve(self, license: str, vehicle_type: VehicleType, start: datetime, end: datetime,
+                level_id: int = None, spot_id: int = None) -> Optional[Reservation]:
+        if end <= start:
+            raise ValueError("reservation must end after it starts")
+        with self.lock:
+            if spot_id is not None:
+                if level_id is None:
+                    raise ValueError("spot_id needs a level_id")
+                self.sync_levels()
+                levels = self.parking_system.levels
+                if not 0 <= level_id < len(levels) or spot_id not in range(levels[level_id].get_spot_count()):
+                    raise ValueError(f"no spot {spot_id} on level {level_id}")
+                if not self.spot_free(level_id, spot_id, start, end, vehicle_type):
+                    return None
+                found = (level_id, spot_id)
+            else:
+                found = self.find_free_spot_locked(start, end, level_id, vehicle_type)
+                if found is None:
+                    return None
+            reservation = Reservation(next(self.ids), license, vehicle_type, found[0], found[1], start, end)
+            self.add(reservation)
+        return reservation
+
+    # split the gap the booking falls in: [a, b) -> [a, start) + [end, b)
+    def add(self, reservation: Reservation):
+        level_id, spot_id, start, end = reservation.level_id, reservation.spot_id, reservation.start, reservation.end
+        gaps = self.spot_gaps.get((level_id, spot_id))
+        if gaps is None:
+            gaps = self.spot_gaps[(level_id, spot_id)] = SpotGaps()
+        i = gaps.gap_for(start, end)
+        gap_start, gap_end = gaps.starts[i], gaps.ends[i]
+        level_gaps = self.level_gaps[level_id]
+        level_gaps.remove(gap_start, spot_id)
+        del gaps.starts[i], gaps.ends[i]
+        if end < gap_end:
+            gaps.starts.insert(i, end)
+            gaps.ends.insert(i, gap_end)
+            level_gaps.insert(end, gap_end, spot_id, spot_id)
+        if gap_start < start:
+            gaps.starts.insert(i, gap_start)
+            gaps.ends.insert(i, start)
+            level_gaps.insert(gap_start, start, spot_id, spot_id)
+        self.reservations[reservation.id] = reservation
+        heapq.heappush(self.by_end, (end, reservation.id))
+
+    # give the booking's window back, joining it with the gaps either side
+    def drop(self, reservation: Reservation, status: str):
+        level_id, spot_id, start, end = reservation.level_id, reservation.spot_id, reservation.start, reservation.end
+        gaps = self.spot_gaps[(level_id, spot_id)]
+        level_gaps = self.level_gaps[level_id]
+        i = bisect.bisect_right(gaps.starts, start)  # first gap after the booking
+        if i < len(gaps.starts) and gaps.starts[i] == end:
+            level_gaps.remove(end, spot_id)
+            end = gaps.ends[i]
+            del gaps.starts[i], gaps.ends[i]
+        if i > 0 and gaps.ends[i - 1] == start:
+            i -= 1
+            level_gaps.remove(gaps.starts[i], spot_id)
+            start = gaps.starts[i]
+            del gaps.starts[i], gaps.ends[i]
+        gaps.starts.insert(i, start)
+        gaps.ends.insert(i, end)
+        level_gaps.insert(start, end, spot_id, spot_id)
+        if start == FOREVER_AGO and end == FOREVER:
+            del self.spot_gaps[(level_id, spot_id)]
+        del self.reservations[reservation.id]
+        reservation.status = status
+
+    def cancel(self, reservation: Reservation) -> bool:
+        with self.lock:
+            if self.reservations.get(reservation.id) is not reservation:
+                return False
+            self.drop(reservation, CANCELLED)
+        return True
+
+    # Park the holder in the reserved spot. If it is still taken (an overstaying
+    # vehicle), the reservation moves to another spot free for the rest of the window.
+    def check_in(self, reservation: Reservation, vehicle: Vehicle) -> Optional[ParkingRecord]:
+        if reservation.status != BOOKED:
+            return None
+        record = self.parking_system.park_at(vehicle, reservation.level_id, reservation.spot_id)
+        if record is None:
+            with self.lock:
+                if self.reservations.get(reservation.id) is not reservation:
+                    return None
+                self.drop(reservation, BOOKED)
+                found = self.find_free_spot_locked(current_time(), reservation.end, None, reservation.vehicle_type)
+                if found is not None:
+                    reservation.level_id, reservation.spot_id = found
+                self.add(reservation)
+            if found is None:
+                return None
+            record = self.parking_system.park_at(vehicle, reservation.level_id, reservation.spot_id)
+        if record is not None:
+            reservation.status = CHECKED_IN
+        return record
+
+    # drop every booking that ended before `before`; returns how many were dropped
+    def expire(self, before: datetime = None) -> int:
+        before = before or current_time()
+        dropped = 0
+        with self.lock:
+            while self.by_end and self.by_end[0][0] <= before:
+                _, reservation_id = heapq.heappop(self.by_end)
+                reservation = self.reservations.get(reservation_id)
+                if reservation is not None:
+                    self.drop(reservation, EXPIRED if reservation.status == BOOKED else reservation.status)
+                    dropped += 1
+        return dropped
+
+
+# Reservation demo: an event pre-books most of a level, walk-ins keep working around it
+class ReservationDemo:
+    @staticmethod
+    def run():
+        from all import Clock, VirtualClock
+
+        clock = VirtualClock(datetime(2024, 6, 1, 8))
+        previous = Clock.get()
+        Clock.use(clock)
+        try:
+            ps = ParkingLotSystem()
+            for _ in range(4):
+                ps.add_level(2500)
+            book = ReservationBook(ps)
+
+            rng = random.Random(5)
+            event_day = datetime(2024, 6, 1)
+            began = time.perf_counter()
+            made = 0
+            for i in range(40000):
+                start = event_day + timedelta(hours=rng.randint(9, 20), minutes=rng.choice((0, 30)))
+                if book.reserve(f"EVT{i}", VehicleType.CAR, start, start + timedelta(hours=rng.randint(1, 4))):
+                    made += 1
+            elapsed = time.perf_counter() - began
+            print(f"{made} reservations booked in {elapsed:.2f}s ({elapsed / 40000 * 1e6:.0f} us per booking)")
+
+            windows = [("14:00-18:00", event_day.replace(hour=14), event_day.replace(hour=18)),
+                       ("next day 07:00-09:00", event_day + timedelta(hours=31), event_day + timedelta(hours=33))]
+            for label, start, end in windows:
+                began = time.perf_counter()
+                for _ in range(1000):
+                    found = book.find_free_spot(start, end, level_id=2)
+                print(f"Free spot on level 2, {label}: {found} ({(time.perf_counter() - began):.3f} ms/query)")
+
+            first = min(book.reservations.values(), key=lambda r: (r.start, r.id))
+            clock.set(first.start - timedelta(minutes=10))
+            walk_in = ps.park(FactoryVehicle.create_vehicle(VehicleType.CAR, "WALKIN1"))
+            print(f"Walk-in at {clock.now():%H:%M} parked at level {walk_in.spot.level_id} spot {walk_in.spot.id} "
+                  f"(spots booked from {first.start:%H:%M} are held)")
+            record = book.check_in(first, FactoryVehicle.create_vehicle(VehicleType.CAR, first.license))
+            print(f"Checked in at level {record.spot.level_id} spot {record.spot.id}: {first.status}")
+
+            clock.set(event_day + timedelta(hours=13))
+            print(f"Expired {book.expire()} bookings that ended by 13:00, {len(book)} left")
+        finally:
+            Clock.use(previous)
+
+
+if __name__ == "__main__":
+    ReservationDemo.run()
+
+
+# python3 4.Examples/1.ParkingLot/parking_reservations.py
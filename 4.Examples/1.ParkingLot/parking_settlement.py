@@ -0,0 +1,140 @@
+# End-of-day settlement - price and pay thousands of closed parking records at once.
+#
+# Instead of one process_payment call per record, the records are gathered
+# into NumPy arrays once (vehicle type code, level, entry/exit timestamps),
+# fees are computed elementwise from a vehicle-type rate vector, totals are
+# grouped with bincount, and the Payments are created and completed in a
+# single pass at the end.
+#
+# Needs NumPy. Only flat hourly strategies (anything with get_hourly_rate,
+# e.g. StandardPaymentStrategy) are vectorized; other strategies are priced
+# record by record through calculate_stay_payment. Permit holders pay nothing,
+# as at the gate (ParkingLotSystem.calculate_payment).
+from datetime import datetime
+from typing import List, Dict
+
+import numpy as np
+
+from all import ParkingLotSystem, ParkingRecord, Payment, PaymentStrategy, StandardPaymentStrategy, VehicleType, current_time
+
+VEHICLE_TYPES = {vehicle_type.value: vehicle_type for vehicle_type in VehicleType}
+
+
+class SettlementReport:
+    def __init__(self, settled: int, total: float, by_vehicle_type: Dict[VehicleType, float], by_level: Dict[int, float]):
+        self.settled = settled
+        self.total = total
+        self.by_vehicle_type = by_vehicle_type
+        self.by_level = by_level
+
+    def __repr__(self):
+        return (f"SettlementReport(settled={self.settled}, total={self.total:.2f}, "
+                f"by_vehicle_type={self.by_vehicle_type}, by_level={self.by_level})")
+
+
+class ParkingSettlement:
+    # without a payment strategy, settle_lot prices with the lot's own and settle with StandardPaymentStrategy
+    def __init__(self, payment_strategy: PaymentStrategy = None):
+        self.payment_strategy = payment_strategy
+
+    # closed (exited) records of a lot that have no completed payment yet
+    @staticmethod
+    def unsettled_records(parking_system: ParkingLotSystem) -> List[ParkingRecord]:
+        return [r for records in parking_system.parking_records.values() for r in records
+                if r.exit_time is not None and not r.is_payment_completed()]
+
+    # rate per vehicle type code, indexed by VehicleType.value
+    @staticmethod
+    def rate_vector(payment_strategy: PaymentStrategy) -> np.ndarray:
+        rates = np.zeros(max(VEHICLE_TYPES) + 1)
+        for code, vehicle_type in VEHICLE_TYPES.items():
+            rates[code] = payment_strategy.get_hourly_rate(vehicle_type)
+        return rates
+
+    # fee per record; records of permit holders (permit_registry, if given) are free
+    def compute_fees(self, records: List[ParkingRecord], type_codes: np.ndarray,
+                     payment_strategy: PaymentStrategy = None, permit_registry=None) -> np.ndarray:
+        payment_strategy = payment_strategy or self.payment_strategy or StandardPaymentStrategy()
+        count = len(records)
+        if not hasattr(payment_strategy, "get_hourly_rate"):
+            fees = np.fromiter((payment_strategy.calculate_stay_payment(r.vehicle.get_vehicle_type(), r.entry_time, r.exit_time)
+                                for r in records), dtype=np.float64, count=count)
+        else:
+            entry = np.fromiter((r.entry_time.timestamp() for r in records), dtype=np.float64, count=count)
+            exit = np.fromiter((r.exit_time.timestamp() for r in records), dtype=np.float64, count=count)
+            hours = (exit - entry) / 3600.0
+            fees = self.rate_vector(payment_strategy)[type_codes] * hours
+        if permit_registry is not None:
+            is_permit_holder = permit_registry.is_permit_holder
+            waived = np.fromiter((is_permit_holder(r.vehicle.get_license_number()) for r in records), dtype=bool, count=count)
+            fees[waived] = 0.0
+        return fees
+
+    # Price and complete payment for every closed, unpaid record in records.
+    def settle(self, records: List[ParkingRecord], settled_at: datetime = None,
+               payment_strategy: PaymentStrategy = None, permit_registry=None) -> SettlementReport:
+        records = [r for r in records if r.exit_time is not None and not r.is_payment_completed()]
+        if not records:
+            return SettlementReport(0, 0.0, {}, {})
+        count = len(records)
+        type_codes = np.fromiter((r.vehicle.get_vehicle_type().value for r in records), dtype=np.int64, count=count)
+        level_ids = np.fromiter((r.spot.level_id for r in records), dtype=np.int64, count=count)
+        fees = self.compute_fees(records, type_codes, payment_strategy, permit_registry)
+
+        type_totals = np.bincount(type_codes, weights=fees)
+        level_totals = np.bincount(level_ids, weights=fees)
+        by_vehicle_type = {VEHICLE_TYPES[code]: float(total) for code, total in enumerate(type_totals)
+                           if code in VEHICLE_TYPES and total}
+        by_level = {level: float(total) for level, total in enumerate(level_totals) if total}
+
+        settled_at = settled_at or current_time()
+        for record, amount in zip(records, fees.tolist()):
+            payment = Payment(amount, settled_at)
+            payment.complete_payment()
+            record.set_payment(payment)
+
+        return SettlementReport(count, float(fees.sum()), by_vehicle_type, by_level)
+
+    def settle_lot(self, parking_system: ParkingLotSystem, settled_at: datetime = None) -> SettlementReport:
+        records = self.unsettled_records(parking_system)
+        payment_strategy = self.payment_strategy or parking_system.payment_strategy
+        report = self.settle(records, settled_at, payment_strategy, parking_system.permit_registry)
+        if parking_system.event_observers:
+            for record in records:
+                parking_system.notify_payment(record)
+        return report
+
+
+# Settlement demo: a day of closed records settled in bulk; every fee must be
+# what the gate (calculate_payment) would have charged, permit holders included
+class ParkingSettlementDemo:
+    @staticmethod
+    def run():
+        from datetime import timedelta
+        from all import FactoryVehicle
+        from parking_permits import PermitRegistry
+
+        ps = ParkingLotSystem()
+        ps.set_permit_registry(PermitRegistry(f"PLATE{i}" for i in range(0, 1000, 10)))
+        ps.add_level(500)
+        ps.add_level(500)
+        start = datetime.now() - timedelta(days=1)
+        types = [VehicleType.CAR, VehicleType.BIKE, VehicleType.TRUCK]
+        for i in range(1000):
+            record = ps.park(FactoryVehicle.create_vehicle(types[i % 3], f"PLATE{i}"))
+            record.entry_time = start + timedelta(minutes=i)
+        for i in range(1000):
+            ps.unpark_by_license(f"PLATE{i}")
+
+        gate_fees = {id(r): ps.calculate_payment(r) for records in ps.parking_records.values() for r in records}
+        report = ParkingSettlement().settle_lot(ps)
+        print(report)
+        differ = sum(abs(r.payment.amount - gate_fees[id(r)]) > 1e-9 for records in ps.parking_records.values() for r in records)
+        print(f"{differ} of {report.settled} settled fees differ from calculate_payment (100 permit holders paid nothing)")
+
+
+if __name__ == "__main__":
+    ParkingSettlementDemo.run()
+
+
+# python3 4.Examples/1.ParkingLot/parking_settlement.py
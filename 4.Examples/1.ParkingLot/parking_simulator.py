@@ -0,0 +1,172 @@
+# Traffic simulator - synthetic arrivals and departures against a parking lot on a virtual clock.
+#
+# Arrivals per vehicle type are Poisson processes (exponential gaps) and dwell
+# times are log-normal, both configurable per VehicleType. Events run in
+# virtual-time order through park / unpark_by_license / process_payment while
+# the lot's Clock is a VirtualClock, so a simulated day takes seconds.
+#
+# Reported per strategy:
+#   - park / unpark wall-clock latency percentiles and event throughput
+#   - rejected arrivals (lot full)
+#   - spots examined per park (scan cost of the strategy)
+#   - mean level imbalance (max - min level occupancy ratio, sampled at arrivals)
+import heapq
+import math
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+from all import (ParkingLotSystem, StrategyPark, StrategyParkFirst, StrategyParkFirstFit, StrategyParkNearest,
+                 StrategyParkBalanced, FactoryVehicle, VehicleType, Clock, VirtualClock)
+
+ARRIVAL, DEPARTURE = 0, 1
+
+
+# arrival rate and dwell-time distribution for one vehicle type
+class TrafficProfile:
+    def __init__(self, arrivals_per_hour: float, mean_dwell_hours: float, dwell_sigma: float = 0.8):
+        self.arrivals_per_hour = arrivals_per_hour
+        self.dwell_sigma = dwell_sigma
+        # log-normal with the requested mean: mean = exp(mu + sigma^2 / 2)
+        self.dwell_mu = math.log(mean_dwell_hours) - dwell_sigma ** 2 / 2
+
+    def next_gap_hours(self, rng: random.Random) -> float:
+        return rng.expovariate(self.arrivals_per_hour)
+
+    def dwell_hours(self, rng: random.Random) -> float:
+        return rng.lognormvariate(self.dwell_mu, self.dwell_sigma)
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int((len(ordered) - 1) * p / 100))]
+
+
+class SimulationResult:
+    def __init__(self, name: str):
+        self.name = name
+        self.park_latencies: List[float] = []
+        self.unpark_latencies: List[float] = []
+        self.rejected = 0
+        self.spots_examined = 0
+        self.imbalance_total = 0.0
+        self.wall_seconds = 0.0
+
+    def report(self) -> str:
+        park = sorted(self.park_latencies)
+        unpark = sorted(self.unpark_latencies)
+        events = len(park) + len(unpark) + self.rejected
+        arrivals = len(park) + self.rejected
+        return (f"{self.name:>12}: {events / self.wall_seconds:>9,.0f} events/s | "
+                f"park p50 {percentile(park, 50):5.1f}us p99 {percentile(park, 99):6.1f}us | "
+                f"unpark p50 {percentile(unpark, 50):5.1f}us p99 {percentile(unpark, 99):6.1f}us | "
+                f"rejected {self.rejected:>5} | "
+                f"examined/park {self.spots_examined / max(1, len(park)):7.1f} | "
+                f"imbalance {self.imbalance_total / max(1, arrivals):.3f}")
+
+
+class ParkingSimulator:
+    def __init__(self, level_spots: List[int], profiles: Dict[VehicleType, TrafficProfile],
+                 hours: float = 24.0, seed: int = 7, start: datetime = None):
+        self.level_spots = level_spots
+        self.profiles = profiles
+        self.hours = hours
+        self.seed = seed
+        self.start = start if start else datetime(2024, 1, 1, 6)
+
+    # the whole day's arrivals up front - the same stream for every strategy
+    def generate_arrivals(self, rng: random.Random):
+        arrivals = []
+        for vehicle_type, profile in self.profiles.items():
+            t = profile.next_gap_hours(rng)
+            while t < self.hours:
+                arrivals.append((t, vehicle_type, profile.dwell_hours(rng)))
+                t += profile.next_gap_hours(rng)
+        arrivals.sort(key=lambda arrival: arrival[0])
+        return arrivals
+
+    def run(self, name: str, strategy: StrategyPark) -> SimulationResult:
+        rng = random.Random(self.seed)
+        ps = ParkingLotSystem(strategy_to_park=strategy)
+        for spots in self.level_spots:
+            ps.add_level(spots)
+        clock = VirtualClock(self.start)
+        previous_clock = Clock.get()
+        Clock.use(clock)
+
+        events = []  # (hour, seq, kind, payload)
+        for seq, (t, vehicle_type, dwell) in enumerate(self.generate_arrivals(rng)):
+            events.append((t, seq, ARRIVAL, (vehicle_type, dwell)))
+        heapq.heapify(events)
+        seq = len(events)
+        result = SimulationResult(name)
+        perf_counter = time.perf_counter
+        wall_start = perf_counter()
+        try:
+            while events:
+                t, _, kind, payload = heapq.heappop(events)
+                clock.set(self.start + timedelta(hours=t))
+                if kind == ARRIVAL:
+                    vehicle_type, dwell = payload
+                    license = f"SIM{seq}"
+                    vehicle = FactoryVehicle.create_vehicle(vehicle_type, license)
+                    result.imbalance_total += self.level_imbalance(ps)
+                    begin = perf_counter()
+                    record = ps.park(vehicle)
+                    elapsed_us = (perf_counter() - begin) * 1e6
+                    if record is None:
+                        result.rejected += 1
+                    else:
+                        result.park_latencies.append(elapsed_us)
+                        heapq.heappush(events, (t + dwell, seq, DEPARTURE, license))
+                    seq += 1
+                else:
+                    begin = perf_counter()
+                    record = ps.unpark_by_license(payload)
+                    ps.process_payment(record)
+                    result.unpark_latencies.append((perf_counter() - begin) * 1e6)
+        finally:
+            Clock.use(previous_clock)
+        result.wall_seconds = perf_counter() - wall_start
+        result.spots_examined = strategy.spots_examined
+        return result
+
+    @staticmethod
+    def level_imbalance(ps: ParkingLotSystem) -> float:
+        ratios = [1 - level.get_free_count() / level.get_spot_count() for level in ps.levels]
+        return max(ratios) - min(ratios)
+
+    def compare(self, strategies: Dict[str, Callable[[], StrategyPark]]) -> List[SimulationResult]:
+        return [self.run(name, factory()) for name, factory in strategies.items()]
+
+
+# Simulator demo: a busy day in a 4-level garage that runs close to full at peak
+class ParkingSimulatorDemo:
+    @staticmethod
+    def run():
+        simulator = ParkingSimulator(
+            level_spots=[600, 600, 600, 600],
+            profiles={
+                VehicleType.CAR: TrafficProfile(arrivals_per_hour=500, mean_dwell_hours=4.0),
+                VehicleType.BIKE: TrafficProfile(arrivals_per_hour=60, mean_dwell_hours=2.0),
+                VehicleType.TRUCK: TrafficProfile(arrivals_per_hour=20, mean_dwell_hours=1.0, dwell_sigma=0.5),
+            },
+            hours=24,
+        )
+        results = simulator.compare({
+            "scan-first": StrategyParkFirst,
+            "first-fit": StrategyParkFirstFit,
+            "nearest": StrategyParkNearest,
+            "balanced": StrategyParkBalanced,
+        })
+        for result in results:
+            print(result.report())
+
+
+if __name__ == "__main__":
+    ParkingSimulatorDemo.run()
+
+
+# python3 4.Examples/1.ParkingLot/parking_simulator.py
@@ -1,16 +1,17 @@
 from vehicle_type import VehicleType
 from vehicle import Vehicle
+from spot_size import SpotSize
 class ParkingSpot():
-    def __init__(self, spot_number : int):
+    def __init__(self, spot_number : int, size : SpotSize = SpotSize.MEDIUM):
         self.spot_number = spot_number
         self.parked_vehicle = None
-        self.vehicle_type = VehicleType.CAR
+        self.size = size
 
     def is_availabile(self) -> bool:
         return self.parked_vehicle is None
     
     def park_vehicle(self,vehicle : Vehicle) -> None:
-        if self.is_availabile() and vehicle.get_type() == self.vehicle_type:
+        if self.is_availabile() and self.size.fits(vehicle.get_type()):
             self.parked_vehicle = vehicle
         else:
             raise ValueError("Invalid vehicle type or spot already occupied.")
@@ -20,9 +21,13 @@ class ParkingSpot():
     
     def get_spot_number(self) -> int:
         return self.spot_number
+
+    def get_size(self) -> SpotSize:
+        return self.size
     
+    # the vehicle type this spot is sized for
     def get_vehicle_type(self) -> VehicleType:
-        return self.vehicle_type
+        return next(vehicle_type for vehicle_type in VehicleType if SpotSize.for_vehicle(vehicle_type) == self.size)
 
     def get_parked_vehicle(self) -> Vehicle:
-        return self.parked_vehicle
\ No newline at end of file
+        return self.parked_vehicle
@@ -0,0 +1,275 @@
+# Fuzzy license-plate lookup for misread plates.
+#
+# ANPR cameras confuse look-alike characters (0/O, 8/B, 5/S...). Matches are
+# ranked by a weighted edit distance in which those confusions are cheap: a
+# look-alike substitution costs half an edit, any other substitution,
+# insertion or deletion costs one.
+#
+# PlateIndex avoids comparing a read against every plate. Each plate is keyed
+# by its look-alike-folded form (every confusable character mapped to one
+# representative, so 0/O/D/Q all read the same), plus every form with up to
+# max_edits characters deleted (symmetric-delete). A read generates the same
+# keys; any plate within max_edits real edits of it shares a key. Lookup costs
+# O(len(plate) ** max_edits) dict probes, independent of how many plates are
+# indexed, and the few candidates are then checked with the exact distance.
+#
+# ParkingPlateLookup keeps the index in sync with a parking system: plates are
+# added on park and kept for recent_window after they leave, so a misread exit
+# can still be matched to its session. The index holds normalized plates;
+# parked_licenses maps each back to the licenses actually parked under it,
+# which is what the parking system's maps are keyed by.
+import random
+import string
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+from itertools import combinations
+from typing import Dict, List, Optional, Set, Tuple
+
+from all import ParkingLotSystem, ParkingEventObserver, ParkingRecord, current_time
+
+EDIT_COST = 2  # distances are kept in half-edits so look-alike substitutions stay integral
+DEFAULT_CONFUSIONS = ["0O", "0D", "OD", "OQ", "1I", "1L", "IL", "8B", "5S", "2Z", "6G", "UV", "7T"]
+
+
+def normalize_plate(plate: str) -> str:
+    return "".join(ch for ch in plate.upper() if ch.isalnum())
+
+
+class PlateDistance:
+    def __init__(self, confusions: List[str] = None):
+        self.cheap = set()
+        for a, b in (confusions if confusions is not None else DEFAULT_CONFUSIONS):
+            self.cheap.add((a, b))
+            self.cheap.add((b, a))
+
+    def substitution(self, a: str, b: str) -> int:
+        if a == b:
+            return 0
+        return 1 if (a, b) in self.cheap else EDIT_COST
+
+    # weighted Levenshtein in half-edits; stops early once every path exceeds limit
+    def distance(self, a: str, b: str, limit: int = None) -> int:
+        if len(a) < len(b):
+            a, b = b, a
+        previous = list(range(0, (len(b) + 1) * EDIT_COST, EDIT_COST))
+        for i, ca in enumerate(a, 1):
+            current = [i * EDIT_COST]
+            for j, cb in enumerate(b, 1):
+                current.append(min(previous[j] + EDIT_COST,
+                                   current[j - 1] + EDIT_COST,
+                                   previous[j - 1] + self.substitution(ca, cb)))
+            if limit is not None and min(current) > limit:
+                return limit + 1
+            previous = current
+        return previous[-1]
+
+    # character -> representative of its look-alike group (groups are closed transitively)
+    def folding_table(self) -> Dict[int, str]:
+        parent = {}
+
+        def find(ch):
+            while parent.get(ch, ch) != ch:
+                ch = parent[ch]
+            return ch
+
+        for a, b in self.cheap:
+            ra, rb = find(a), find(b)
+            if ra != rb:
+                parent[max(ra, rb)] = min(ra, rb)
+        return str.maketrans({ch: find(ch) for ch in parent})
+
+
+# Symmetric-delete index over look-alike-folded plates.
+class PlateIndex:
+    def __init__(self, confusions: List[str] = None, max_edits: int = 1):
+        self.metric = PlateDistance(confusions)
+        self.folding = self.metric.folding_table()
+        self.max_edits = max_edits
+        # key -> plate, or set of plates when several share the key (the common case is one)
+        self.keys: Dict[str, object] = {}
+        self.live = set()
+
+    def __len__(self):
+        return len(self.live)
+
+    def __contains__(self, plate: str):
+        return normalize_plate(plate) in self.live
+
+    def keys_for(self, plate: str) -> set:
+        folded = plate.translate(self.folding)
+        keys = {folded}
+        for deletions in range(1, min(self.max_edits, len(folded)) + 1):
+            for positions in combinations(range(len(folded)), deletions):
+                keys.add("".join(ch for i, ch in enumerate(folded) if i not in positions))
+        return keys
+
+    def add(self, plate: str):
+        plate = normalize_plate(plate)
+        if plate in self.live:
+            return
+        self.live.add(plate)
+        for key in self.keys_for(plate):
+            current = self.keys.get(key)
+            if current is None:
+                self.keys[key] = plate
+            elif isinstance(current, set):
+                current.add(plate)
+            else:
+                self.keys[key] = {current, plate}
+
+    def remove(self, plate: str):
+        plate = normalize_plate(plate)
+        if plate not in self.live:
+            return
+        self.live.discard(plate)
+        for key in self.keys_for(plate):
+            current = self.keys.get(key)
+            if isinstance(current, set):
+                current.discard(plate)
+                if len(current) == 1:
+                    self.keys[key] = current.pop()
+            elif current == plate:
+                del self.keys[key]
+
+    # plates within k edits (look-alike substitutions count half), closest first
+    def search(self, plate: str, k: float = 1) -> List[Tuple[str, float]]:
+        if k > self.max_edits:
+            raise ValueError(f"k={k} is above the index's max_edits={self.max_edits}")
+        plate = normalize_plate(plate)
+        candidates = set()
+        for key in self.keys_for(plate):
+            current = self.keys.get(key)
+            if isinstance(current, set):
+                candidates |= current
+            elif current is not None:
+                candidates.add(current)
+        radius = int(k * EDIT_COST)
+        matches = []
+        for candidate in candidates:
+            d = self.metric.distance(plate, candidate, limit=radius)
+            if d <= radius:
+                matches.append((candidate, d / EDIT_COST))
+        matches.sort(key=lambda match: (match[1], match[0]))
+        return matches
+
+
+class ParkingPlateLookup(ParkingEventObserver):
+    def __init__(self, parking_system: ParkingLotSystem, recent_window: timedelta = timedelta(hours=24),
+                 confusions: List[str] = None):
+        self.parking_system = parking_system
+        self.recent_window = recent_window
+        self.index = PlateIndex(confusions)
+        self.departures = deque()  # (expires_at, plate) in exit order
+        self.last_exit: Dict[str, object] = {}
+        self.parked_licenses: Dict[str, Set[str]] = {}  # normalized plate -> licenses parked under it
+        # guards everything above; events from different levels arrive concurrently.
+        # Taken inside level locks, so never held while calling into the parking system.
+        self.lock = threading.Lock()
+        with self.lock:
+            for license in list(parking_system.active_records):
+                self.track(license)
+        parking_system.add_event_observer(self)
+
+    # caller holds self.lock
+    def track(self, license: str):
+        self.index.add(license)
+        self.parked_licenses.setdefault(normalize_plate(license), set()).add(license)
+
+    def on_park(self, record: ParkingRecord):
+        with self.lock:
+            self.track(record.vehicle.get_license_number())
+            self.expire()
+
+    def on_unpark(self, record: ParkingRecord):
+        license = record.vehicle.get_license_number()
+        plate = normalize_plate(license)
+        expires_at = record.exit_time + self.recent_window
+        with self.lock:
+            parked = self.parked_licenses.get(plate)
+            if parked is not None:
+                parked.discard(license)
+                if not parked:
+                    del self.parked_licenses[plate]
+            self.last_exit[plate] = expires_at
+            self.departures.append((expires_at, plate))
+            self.expire()
+
+    # forget plates that left more than recent_window ago and haven't come back;
+    # caller holds self.lock
+    def expire(self):
+        now = current_time()
+        while self.departures and self.departures[0][0] <= now:
+            expires_at, plate = self.departures.popleft()
+            if self.last_exit.get(plate) == expires_at:
+                del self.last_exit[plate]
+                if plate not in self.parked_licenses:
+                    self.index.remove(plate)
+
+    # candidate plates for a camera read, closest first
+    def candidates(self, plate_read: str, k: float = 1) -> List[Tuple[str, float]]:
+        with self.lock:
+            return self.index.search(plate_read, k)
+
+    # parked licenses a camera read could be, closest first
+    def parked_candidates(self, plate_read: str, k: float = 1) -> List[Tuple[str, float]]:
+        with self.lock:
+            return [(license, d) for plate, d in self.index.search(plate_read, k)
+                    for license in sorted(self.parked_licenses.get(plate, ()))]
+
+    # open sessions a camera read could belong to, closest first
+    def active_candidates(self, plate_read: str, k: float = 1) -> List[ParkingRecord]:
+        get_active_record = self.parking_system.get_active_record
+        records = (get_active_record(license) for license, _ in self.parked_candidates(plate_read, k))
+        return [record for record in records if record is not None]
+
+    # Unpark by a possibly misread plate: exact match, else the single closest open session.
+    # Returns None when the read is ambiguous (two equally close sessions) or matches nothing.
+    def unpark_by_plate_read(self, plate_read: str, k: float = 1) -> Optional[ParkingRecord]:
+        exact = self.parking_system.unpark_by_license(plate_read)
+        if exact is not None:
+            return exact
+        matches = self.parked_candidates(plate_read, k)
+        if not matches or (len(matches) > 1 and matches[0][1] == matches[1][1]):
+            return None
+        return self.parking_system.unpark_by_license(matches[0][0])
+
+
+# Plate index demo: 100k plates, misread lookups vs a linear scan
+class PlateIndexDemo:
+    @staticmethod
+    def run():
+        rng = random.Random(3)
+        alphabet = string.ascii_uppercase + string.digits
+        plates = list({"".join(rng.choice(alphabet) for _ in range(7)) for _ in range(100000)})
+        index = PlateIndex()
+        start = time.perf_counter()
+        for plate in plates:
+            index.add(plate)
+        print(f"Indexed {len(index)} plates in {time.perf_counter() - start:.2f}s")
+
+        swaps = {"0": "O", "O": "0", "8": "B", "B": "8", "5": "S", "S": "5", "1": "I", "I": "1"}
+        queries = []
+        for plate in rng.sample(plates, 200):
+            misread = "".join(swaps.get(ch, ch) if rng.random() < 0.5 else ch for ch in plate)
+            queries.append((plate, misread))
+
+        start = time.perf_counter()
+        found = sum(any(p == plate for p, _ in index.search(misread, k=1)) for plate, misread in queries)
+        index_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        metric = index.metric
+        start = time.perf_counter()
+        for plate, misread in queries[:20]:
+            [p for p in plates if metric.distance(misread, p, limit=2) <= 2]
+        scan_ms = (time.perf_counter() - start) * 1000 / 20
+        print(f"Index: {index_ms:.2f} ms/query, found the true plate for {found}/{len(queries)} misreads")
+        print(f"Linear scan: {scan_ms:.2f} ms/query")
+
+
+if __name__ == "__main__":
+    PlateIndexDemo.run()
+
+
+# python3 4.Examples/1.ParkingLot/plate_index.py
@@ -0,0 +1,31 @@
+from enum import Enum
+from typing import List
+from vehicle_type import VehicleType
+
+# Spot sizes, smallest first. A vehicle fits its own size and anything bigger:
+# motorcycles can take car spots, trucks need large ones.
+class SpotSize(Enum):
+    SMALL = 1
+    MEDIUM = 2
+    LARGE = 3
+
+    @staticmethod
+    def for_vehicle(vehicle_type : VehicleType) -> 'SpotSize':
+        return VEHICLE_SIZES[vehicle_type]
+
+    # compatible sizes for a vehicle type, best fit (smallest) first
+    @staticmethod
+    def compatible(vehicle_type : VehicleType) -> List['SpotSize']:
+        return COMPATIBLE_SIZES[vehicle_type]
+
+    def fits(self, vehicle_type : VehicleType) -> bool:
+        return self.value >= VEHICLE_SIZES[vehicle_type].value
+
+VEHICLE_SIZES = {
+    VehicleType.MOTORCYCLE : SpotSize.SMALL,
+    VehicleType.CAR : SpotSize.MEDIUM,
+    VehicleType.TRUCK : SpotSize.LARGE,
+}
+COMPATIBLE_SIZES = {
+    vehicle_type : [size for size in SpotSize if size.fits(vehicle_type)] for vehicle_type in VehicleType
+}
@@ -0,0 +1,162 @@
+import asyncio
+import heapq
+import itertools
+from collections import deque
+from time import monotonic
+from typing import Deque, Dict, List, Optional, Tuple
+
+from bucket_store import BucketStore
+
+# Async limiter - `await limiter.acquire(user_id, cost)` returns once the
+# user's bucket has `cost` tokens and takes them, instead of a yes/no the
+# caller has to retry.
+#
+# A request that can't go now joins its user's FIFO queue. Only the head of
+# each queue is timed: UserBucket.wait_time gives the exact moment its tokens
+# will be there, and that (moment, user) goes on one timer heap shared by all
+# users. The event loop holds a single call_at handle for the earliest entry;
+# when it fires, every due user serves its queue head-first as far as the
+# tokens go and, if someone is still waiting, is timed again for the new head.
+# So a thousand waiters are one timer and a heap, not a thousand sleeping tasks,
+# and nobody wakes up early to find the tokens not there yet.
+#
+# monotonic() is the clock of both the buckets and asyncio's loop.time(), so
+# bucket times go to call_at as they are. Use the limiter from one event loop.
+class AsyncRateLimiter():
+    def __init__(self, idle_ttl=300.0, max_buckets=1_000_000):
+        self.user_buckets = BucketStore(idle_ttl, max_buckets)
+        self.waiters: Dict[str, Deque[Tuple[float, asyncio.Future]]] = {}  # user -> (cost, future), oldest first
+        self.timers: List[Tuple[float, int, str]] = []  # (due, seq, user) - heads of queues to serve at due
+        self.due: Dict[str, float] = {}  # user -> due of its live timer entry; other entries are stale
+        self.seq = itertools.count()
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.timer_due = float("inf")
+
+    def set_user_limit(self, user_id, max_limit, refill_rate):
+        self.user_buckets.set_policy(user_id, max_limit, refill_rate)
+
+    def set_default_limit(self, max_limit, refill_rate):
+        self.user_buckets.set_default_policy(max_limit, refill_rate)
+
+    # non-blocking; never jumps ahead of users already waiting
+    def allow_request(self, user_id, cost=1) -> bool:
+        now = monotonic()
+        bucket = self.user_buckets.get(user_id, now)
+        return bucket is not None and user_id not in self.waiters and bucket.consume_token(now, cost)
+
+    async def acquire(self, user_id, cost=1):
+        now = monotonic()
+        bucket = self.user_buckets.get(user_id, now)
+        if bucket is None:
+            raise ValueError(f"{user_id} is not configured")
+        if cost > bucket.max_limit:
+            raise ValueError(f"cost {cost} is over {user_id}'s limit of {bucket.max_limit}")
+        queue = self.waiters.get(user_id)
+        if queue is None:
+            if bucket.consume_token(now, cost):
+                return
+            queue = self.waiters[user_id] = deque()
+            self.schedule(user_id, now + bucket.wait_time(cost, now))
+        future = asyncio.get_running_loop().create_future()
+        queue.append((cost, future))
+        future.add_done_callback(lambda f: self.on_done(user_id, f))
+        await future
+
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self.waiters.values())
+
+    # --- timer heap ---
+
+    def schedule(self, user_id, due):
+        self.due[user_id] = due
+        heapq.heappush(self.timers, (due, next(self.seq), user_id))
+        if due < self.timer_due:
+            self.arm()
+
+    # one call_at for the earliest live entry
+    def arm(self):
+        timers = self.timers
+        while timers and self.due.get(timers[0][2]) != timers[0][0]:
+            heapq.heappop(timers)  # stale
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer, self.timer_due = None, float("inf")
+        if timers:
+            self.timer_due = timers[0][0]
+            self.timer = asyncio.get_running_loop().call_at(self.timer_due, self.wake)
+
+    def wake(self):
+        self.timer, self.timer_due = None, float("inf")
+        now = monotonic()
+        timers = self.timers
+        while timers and timers[0][0] <= now:
+            due, _, user_id = heapq.heappop(timers)
+            if self.due.get(user_id) == due:
+                del self.due[user_id]
+                self.serve(user_id, now)
+        self.arm()
+
+    # grant the user's waiters in order while the tokens last, then time the new head
+    def serve(self, user_id, now):
+        queue = self.waiters.get(user_id)
+        if queue is None:
+            return
+        bucket = self.user_buckets.get(user_id, now)
+        while queue:
+            cost, future = queue[0]
+            if future.done():  # cancelled while waiting
+                queue.popleft()
+                continue
+            if bucket is None:
+                future.set_exception(ValueError(f"{user_id} is no longer configured"))
+                queue.popleft()
+                continue
+            if not bucket.consume_token(now, cost):
+                self.due[user_id] = due = now + bucket.wait_time(cost, now)
+                heapq.heappush(self.timers, (due, next(self.seq), user_id))
+                return
+            queue.popleft()
+            future.set_result(None)
+        del self.waiters[user_id]
+
+    # a waiter that gave up may have been holding up cheaper ones behind it
+    def on_done(self, user_id, future: asyncio.Future):
+        if future.cancelled() and user_id in self.waiters:
+            self.schedule(user_id, monotonic())
+
+
+# Async demo: a batch job that awaits instead of polling, and many waiters on one timer
+class AsyncRateLimiterDemo():
+    @staticmethod
+    async def main():
+        limiter = AsyncRateLimiter()
+
+        # 5 requests per second: 5 go at once, then one every 0.2s - in order, mixed costs
+        limiter.set_user_limit("user123", 5, 1)
+        start = monotonic()
+        granted = []
+
+        async def request(i, cost):
+            await limiter.acquire("user123", cost)
+            granted.append(f"#{i}(cost {cost}) {monotonic() - start:.2f}s")
+
+        await asyncio.gather(*(request(i, cost) for i, cost in enumerate([1, 1, 1, 1, 1, 2, 1, 3, 1, 1])))
+        print("granted: " + ", ".join(granted))
+
+        # 2,000 waiters on 200 users, 10 requests/s each: all served after ~1s, one timer throughout
+        limiter.set_default_limit(10, 1)
+        start = monotonic()
+        await asyncio.gather(*(limiter.acquire(f"job{i % 200}") for i in range(4000)))
+        print(f"4,000 acquires on 200 users (2,000 had to wait) done in {monotonic() - start:.2f}s, "
+              f"{limiter.waiting()} waiting, {len(limiter.timers)} timer entries left")
+
+    @staticmethod
+    def run():
+        asyncio.run(AsyncRateLimiterDemo.main())
+
+
+if __name__ == "__main__":
+    AsyncRateLimiterDemo.run()
+
+
+# python3 4.Examples/7.RateLimiter/async_limiter.py
@@ -0,0 +1,100 @@
+import heapq
+import itertools
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from user_bucket import UserBucket
+
+# Buckets that are only kept while they carry state.
+#
+# A bucket that has refilled to max_limit is indistinguishable from a new one,
+# so it can be dropped and re-created from the user's policy on the next
+# request without changing any decision. Buckets are kept in LRU order; every
+# new bucket sweeps a couple of entries off the idle end, dropping those idle
+# for idle_ttl seconds that are full by now. An idle bucket that is still
+# refilling moves, in the same order, to `refilling` - still older than every
+# bucket in `buckets` - and is timed on a heap for the moment it is full, so
+# the LRU order is never reshuffled and nobody looks at it again until then.
+# max_buckets is a hard cap: past it the least recently used bucket goes even
+# if not full (that user starts over with a full bucket).
+#
+# Policies are (max_limit, refill_rate) tuples, shared between users with the
+# same limits. Users without their own policy get default_policy, if one is set.
+SWEEP_STEP = 2
+
+class BucketStore():
+    def __init__(self, idle_ttl=300.0, max_buckets=1_000_000):
+        self.idle_ttl = idle_ttl
+        self.max_buckets = max_buckets
+        self.buckets: "OrderedDict[str, UserBucket]" = OrderedDict()  # least recently used first
+        self.refilling: "OrderedDict[str, UserBucket]" = OrderedDict()  # idle, not full yet; older than buckets
+        self.refills: List[Tuple[float, int, str, UserBucket]] = []  # (full at, seq, user, bucket) heap
+        self.seq = itertools.count()
+        self.policies: Dict[str, Tuple[float, float]] = {}
+        self.shared_policies: Dict[Tuple[float, float], Tuple[float, float]] = {}
+        self.default_policy: Optional[Tuple[float, float]] = None
+        self.evicted = 0
+        self.forced_evictions = 0
+
+    def __len__(self):
+        return len(self.buckets) + len(self.refilling)
+
+    def policy(self, max_limit, refill_rate) -> Tuple[float, float]:
+        key = (max_limit, refill_rate)
+        return self.shared_policies.setdefault(key, key)
+
+    def set_policy(self, user_id, max_limit, refill_rate):
+        self.policies[user_id] = self.policy(max_limit, refill_rate)
+        self.buckets.pop(user_id, None)  # next request starts from the new policy
+        self.refilling.pop(user_id, None)
+
+    def set_default_policy(self, max_limit, refill_rate):
+        self.default_policy = self.policy(max_limit, refill_rate)
+
+    def is_configured(self, user_id) -> bool:
+        return user_id in self.policies or self.default_policy is not None
+
+    # the user's bucket, created from the policy if it was evicted; None if unconfigured
+    def get(self, user_id, now) -> Optional[UserBucket]:
+        buckets = self.buckets
+        bucket = buckets.get(user_id)
+        if bucket is not None:
+            buckets.move_to_end(user_id)
+            return bucket
+        bucket = self.refilling.pop(user_id, None)
+        if bucket is not None:  # back in use; its heap entry goes stale
+            buckets[user_id] = bucket
+            return bucket
+        policy = self.policies.get(user_id, self.default_policy)
+        if policy is None:
+            return None
+        bucket = UserBucket(policy[0], policy[1], now)
+        buckets[user_id] = bucket
+        self.sweep(now, SWEEP_STEP)
+        while len(self) > self.max_buckets:
+            (self.refilling or buckets).popitem(last=False)
+            self.forced_evictions += 1
+        return bucket
+
+    # Drop idle buckets that are full by now: first the refilling ones whose
+    # time has come, then from the LRU end of buckets. Looks at most `limit`
+    # buckets (all if None).
+    def sweep(self, now, limit=None):
+        buckets, refilling, refills = self.buckets, self.refilling, self.refills
+        steps = len(self) if limit is None else limit
+        while steps and refills and refills[0][0] <= now:
+            _, _, user_id, bucket = heapq.heappop(refills)
+            if refilling.get(user_id) is bucket:
+                del refilling[user_id]
+                self.evicted += 1
+                steps -= 1
+        while steps and buckets:
+            user_id, bucket = next(iter(buckets.items()))
+            if now - bucket.last_time_visited < self.idle_ttl:
+                return  # everything after it was used more recently
+            del buckets[user_id]
+            if bucket.is_full(now):
+                self.evicted += 1
+            else:
+                refilling[user_id] = bucket
+                heapq.heappush(refills, (now + bucket.wait_time(bucket.max_limit, now), next(self.seq), user_id, bucket))
+            steps -= 1
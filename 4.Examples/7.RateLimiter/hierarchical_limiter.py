@@ -0,0 +1,114 @@
+from threading import Lock
+from time import monotonic
+from typing import Dict, List, Tuple
+
+# Nested limits - a request passes only if the user's, the user's tenant's and
+# the global bucket all have the tokens, and then it is charged to all three.
+# A level that refuses charges nobody: the levels above it are never touched,
+# the ones below get their tokens back because nothing was taken yet.
+#
+# Every bucket is a node number; its state sits in parallel lists indexed by
+# node (tokens, last visit, max_limit, tokens per second), and every node
+# keeps its precomputed chain of ancestors, user first. Names are resolved to
+# nodes once at setup (node()), so allow() is a walk over a three-tuple of
+# ints - no string lookups, no objects. allow_request(user_id) is the
+# convenience form with one dict lookup in front.
+GLOBAL = 0
+
+
+class HierarchicalRateLimiter():
+    def __init__(self, global_limit, global_refill_rate):
+        self.tokens: List[float] = []
+        self.last_time_visited: List[float] = []
+        self.max_limit: List[float] = []
+        self.tokens_per_second: List[float] = []
+        self.chains: List[Tuple[int, ...]] = []  # node -> (node, parent, ..., GLOBAL)
+        self.tenants: Dict[str, int] = {}
+        self.users: Dict[str, int] = {}
+        self.lock = Lock()
+        self.add_node(None, global_limit, global_refill_rate)
+
+    def add_node(self, parent, max_limit, refill_rate) -> int:
+        node = len(self.tokens)
+        self.tokens.append(max_limit)
+        self.last_time_visited.append(monotonic())
+        self.max_limit.append(max_limit)
+        self.tokens_per_second.append(max_limit / refill_rate)
+        self.chains.append((node,) + (self.chains[parent] if parent is not None else ()))
+        return node
+
+    def add_tenant(self, tenant_id, max_limit, refill_rate) -> int:
+        with self.lock:
+            if tenant_id in self.tenants:
+                raise ValueError(f"tenant {tenant_id} already exists")
+            node = self.tenants[tenant_id] = self.add_node(GLOBAL, max_limit, refill_rate)
+            return node
+
+    def add_user(self, user_id, tenant_id, max_limit, refill_rate) -> int:
+        with self.lock:
+            if user_id in self.users:
+                raise ValueError(f"user {user_id} already exists")
+            if tenant_id not in self.tenants:
+                raise ValueError(f"unknown tenant {tenant_id}")
+            node = self.users[user_id] = self.add_node(self.tenants[tenant_id], max_limit, refill_rate)
+            return node
+
+    # the user's node, for callers that keep it instead of the name
+    def node(self, user_id) -> int:
+        return self.users[user_id]
+
+    # One pass up the chain: refill each level and stop at the first that
+    # can't pay; only if all can is the cost taken from every level.
+    def allow(self, node, cost=1) -> bool:
+        now = monotonic()
+        tokens, last_time_visited = self.tokens, self.last_time_visited
+        max_limit, tokens_per_second = self.max_limit, self.tokens_per_second
+        chain = self.chains[node]
+        self.lock.acquire()
+        try:
+            for level in chain:
+                current_token = tokens[level]
+                elapsed_time = now - last_time_visited[level]
+                if elapsed_time > 0:  # refilling is the same whatever the outcome
+                    current_token = min(max_limit[level], current_token + elapsed_time * tokens_per_second[level])
+                    tokens[level] = current_token
+                    last_time_visited[level] = now
+                if current_token < cost:
+                    return False
+            for level in chain:
+                tokens[level] -= cost
+            return True
+        finally:
+            self.lock.release()
+
+    def allow_request(self, user_id, cost=1) -> bool:
+        node = self.users.get(user_id)
+        return node is not None and self.allow(node, cost)
+
+
+# Hierarchy demo: one greedy user can't starve the tenant, and a refused
+# request is not charged to the tenant or the global cap
+class HierarchicalRateLimiterDemo():
+    @staticmethod
+    def run():
+        limiter = HierarchicalRateLimiter(global_limit=100, global_refill_rate=60)
+        limiter.add_tenant("acme", 30, 60)
+        limiter.add_tenant("globex", 30, 60)
+        for tenant in ("acme", "globex"):
+            for i in range(3):
+                limiter.add_user(f"{tenant}-{i}", tenant, 20, 60)
+
+        greedy = limiter.node("acme-0")
+        print(f"acme-0 alone: {sum(limiter.allow(greedy) for _ in range(50))}/50 allowed (user cap 20)")
+        print(f"acme-1 next: {sum(limiter.allow_request('acme-1') for _ in range(50))}/50 allowed (tenant cap 30 left 10)")
+        print(f"globex-0: {sum(limiter.allow_request('globex-0') for _ in range(50))}/50 allowed")
+        acme, everyone = limiter.tenants["acme"], GLOBAL
+        print(f"tokens left - acme {limiter.tokens[acme]:.0f}, global {limiter.tokens[everyone]:.0f} "
+              f"(100 - 30 - 20: the 70 refused requests cost nothing)")
+
+
+if __name__ == "__main__":
+    HierarchicalRateLimiterDemo.run()
+
+
+# python3 4.Examples/7.RateLimiter/hierarchical_limiter.py
@@ -0,0 +1,309 @@
+from abc import ABC, abstractmethod
+from array import array
+from typing import Dict, List
+
+# Rate-limiting algorithms with their per-key state in flat arrays.
+#
+# Every algorithm instance serves one policy ("limit requests per period
+# seconds") for any number of keys. A key is interned to a slot number once;
+# its state is then a few array cells at that slot instead of an object of
+# boxed floats:
+#
+#   token_bucket     tokens, last refill       2 doubles  16 bytes
+#   gcra             theoretical arrival time  1 double    8 bytes
+#   sliding_window   window number, counts     2 ints     16 bytes
+#                    (previous and current window packed in one)
+#   sliding_log      ring of the last `limit`  limit doubles + head
+#                    accepted timestamps
+#   leaky_bucket     level, last leak          2 doubles  16 bytes
+#
+# All of them take a monotonic() reading `now` and admit `limit` back-to-back
+# requests from a fresh key. A request may cost more than one (a weighted
+# call, or several requests admitted together); costs are whole numbers for
+# the two sliding-window algorithms. A key whose state is back to what a fresh
+# key would have (is_fresh) can be released and its slot reused without
+# changing any decision - sweep() does that for every key.
+NEVER = float("-inf")
+MAX_LOG_LIMIT = 10_000  # sliding_log keeps `limit` timestamps per key
+
+
+class LimitAlgorithm(ABC):
+    name = ""
+
+    def __init__(self, limit, period):
+        if limit <= 0 or period <= 0:
+            raise ValueError(f"limit and period must be positive, got {limit} per {period}s")
+        self.limit = limit
+        self.period = period
+        self.slots: Dict[str, int] = {}  # interned key -> slot
+        self.free: List[int] = []  # released slots, reused before the arrays grow
+        self.size = 0  # slots allocated
+
+    def __len__(self):
+        return len(self.slots)
+
+    # the key's slot, allocated with fresh state on first use
+    def slot(self, key) -> int:
+        slot = self.slots.get(key)
+        if slot is None:
+            if self.free:
+                slot = self.free.pop()
+                self.reset(slot)
+            else:
+                slot = self.size
+                self.size += 1
+                self.grow()
+            self.slots[key] = slot
+        return slot
+
+    def allow(self, key, now, cost=1) -> bool:
+        return self.allow_slot(self.slot(key), now, cost)
+
+    def release(self, key):
+        slot = self.slots.pop(key, None)
+        if slot is not None:
+            self.free.append(slot)
+
+    # release every key in fresh state; returns how many went
+    def sweep(self, now) -> int:
+        idle = [key for key, slot in self.slots.items() if self.is_fresh(slot, now)]
+        for key in idle:
+            self.release(key)
+        return len(idle)
+
+    def state_bytes(self) -> int:
+        return sum(a.itemsize * len(a) for a in self.arrays())
+
+    # --- per algorithm ---
+
+    @abstractmethod
+    def arrays(self) -> List[array]:
+        pass
+
+    @abstractmethod
+    def grow(self):  # append fresh state for slot self.size - 1
+        pass
+
+    @abstractmethod
+    def reset(self, slot):
+        pass
+
+    @abstractmethod
+    def allow_slot(self, slot, now, cost=1) -> bool:
+        pass
+
+    @abstractmethod
+    def is_fresh(self, slot, now) -> bool:
+        pass
+
+
+# The repo's UserBucket: limit tokens, refilled at limit/period per second.
+class TokenBucket(LimitAlgorithm):
+    name = "token_bucket"
+
+    def __init__(self, limit, period):
+        super().__init__(limit, period)
+        self.rate = limit / period
+        self.tokens = array('d')
+        self.last = array('d')
+
+    def arrays(self):
+        return [self.tokens, self.last]
+
+    def grow(self):
+        self.tokens.append(self.limit)
+        self.last.append(NEVER)
+
+    def reset(self, slot):
+        self.tokens[slot] = self.limit
+        self.last[slot] = NEVER
+
+    def allow_slot(self, slot, now, cost=1) -> bool:
+        tokens = self.tokens[slot]
+        elapsed = now - self.last[slot]
+        if elapsed > 0:
+            tokens = min(self.limit, tokens + elapsed * self.rate)
+            self.last[slot] = now
+        if tokens >= cost:
+            self.tokens[slot] = tokens - cost
+            return True
+        self.tokens[slot] = tokens
+        return False
+
+    def is_fresh(self, slot, now) -> bool:
+        return self.tokens[slot] + max(0.0, now - self.last[slot]) * self.rate >= self.limit
+
+
+# Generic cell rate algorithm: one timestamp per key. Requests are spaced
+# period/limit apart; tat is when the key would be back to spacing from
+# scratch, and a request passes while tat is at most one period ahead of now.
+class GCRA(LimitAlgorithm):
+    name = "gcra"
+
+    def __init__(self, limit, period):
+        super().__init__(limit, period)
+        self.interval = period / limit
+        self.tat = array('d')
+
+    def arrays(self):
+        return [self.tat]
+
+    def grow(self):
+        self.tat.append(NEVER)
+
+    def reset(self, slot):
+        self.tat[slot] = NEVER
+
+    def allow_slot(self, slot, now, cost=1) -> bool:
+        tat = max(self.tat[slot], now) + self.interval * cost
+        if tat - now > self.period:
+            return False
+        self.tat[slot] = tat
+        return True
+
+    def is_fresh(self, slot, now) -> bool:
+        return self.tat[slot] <= now
+
+
+# Sliding-window counter: counts for the current and the previous fixed
+# window; the previous one is weighted by how much of it the sliding window
+# still covers. Approximate, but two ints per key whatever the limit.
+class SlidingWindowCounter(LimitAlgorithm):
+    name = "sliding_window"
+    COUNT_BITS = 32
+    COUNT_MASK = (1 << COUNT_BITS) - 1
+    NO_WINDOW = -(1 << 62)
+
+    def __init__(self, limit, period):
+        if limit > SlidingWindowCounter.COUNT_MASK:
+            raise ValueError(f"sliding_window counts up to {SlidingWindowCounter.COUNT_MASK} per window")
+        super().__init__(limit, period)
+        self.window = array('q')  # number of the current window, now // period
+        self.counts = array('Q')  # previous window's count << 32 | current window's count
+
+    def arrays(self):
+        return [self.window, self.counts]
+
+    def grow(self):
+        self.window.append(self.NO_WINDOW)
+        self.counts.append(0)
+
+    def reset(self, slot):
+        self.window[slot] = self.NO_WINDOW
+        self.counts[slot] = 0
+
+    def allow_slot(self, slot, now, cost=1) -> bool:
+        window = int(now // self.period)
+        if window < self.window[slot]:  # a reading older than the last call's window counts in that window
+            window = self.window[slot]
+            now = window * self.period
+        counts = self.counts[slot]
+        current, previous = counts & self.COUNT_MASK, counts >> self.COUNT_BITS
+        behind = window - self.window[slot]
+        if behind:
+            previous = current if behind == 1 else 0
+            current = 0
+            self.window[slot] = window
+        covered = 1.0 - (now - window * self.period) / self.period
+        allowed = previous * covered + current + cost <= self.limit
+        if allowed:
+            current += int(cost)
+        self.counts[slot] = previous << self.COUNT_BITS | current
+        return allowed
+
+    def is_fresh(self, slot, now) -> bool:
+        return int(now // self.period) - self.window[slot] > 1
+
+
+# Sliding-window log: the last `limit` accepted timestamps in a ring (a
+# bounded deque laid out in one flat array). A request of cost c passes if the
+# c oldest of them have left the window. Exact, but limit doubles per key -
+# small limits only.
+class SlidingWindowLog(LimitAlgorithm):
+    name = "sliding_log"
+
+    def __init__(self, limit, period):
+        if limit > MAX_LOG_LIMIT:
+            raise ValueError(f"sliding_log keeps every timestamp; limit {limit} is over {MAX_LOG_LIMIT}")
+        super().__init__(limit, period)
+        self.limit = int(limit)
+        self.log = array('d')  # slot's ring is log[slot * limit:(slot + 1) * limit]
+        self.head = array('I')  # oldest entry of the ring, next one to overwrite
+
+    def arrays(self):
+        return [self.log, self.head]
+
+    def grow(self):
+        self.log.extend([NEVER] * self.limit)
+        self.head.append(0)
+
+    def reset(self, slot):
+        base = slot * self.limit
+        self.log[base:base + self.limit] = array('d', [NEVER] * self.limit)
+        self.head[slot] = 0
+
+    def allow_slot(self, slot, now, cost=1) -> bool:
+        limit, base, head = self.limit, slot * self.limit, self.head[slot]
+        cost = int(cost)
+        if cost > limit:
+            return False
+        # entries run oldest to newest from head, so the cost-th oldest decides
+        if now - self.log[base + (head + cost - 1) % limit] < self.period:
+            return False
+        for i in range(head, head + cost):
+            self.log[base + i % limit] = now
+        self.head[slot] = (head + cost) % limit
+        return True
+
+    def is_fresh(self, slot, now) -> bool:
+        head = self.head[slot]
+        newest = slot * self.limit + (head - 1 if head else self.limit - 1)
+        return now - self.log[newest] >= self.period
+
+
+# Leaky bucket (as a meter): every request pours one unit in, the bucket
+# leaks limit/period units per second, and a request that would overflow
+# `limit` is refused.
+class LeakyBucket(LimitAlgorithm):
+    name = "leaky_bucket"
+
+    def __init__(self, limit, period):
+        super().__init__(limit, period)
+        self.rate = limit / period
+        self.level = array('d')
+        self.last = array('d')
+
+    def arrays(self):
+        return [self.level, self.last]
+
+    def grow(self):
+        self.level.append(0.0)
+        self.last.append(NEVER)
+
+    def reset(self, slot):
+        self.level[slot] = 0.0
+        self.last[slot] = NEVER
+
+    def allow_slot(self, slot, now, cost=1) -> bool:
+        level = self.level[slot]
+        elapsed = now - self.last[slot]
+        if elapsed > 0:
+            level = max(0.0, level - elapsed * self.rate)
+            self.last[slot] = now
+        if level + cost <= self.limit:
+            self.level[slot] = level + cost
+            return True
+        self.level[slot] = level
+        return False
+
+    def is_fresh(self, slot, now) -> bool:
+        return self.level[slot] <= max(0.0, now - self.last[slot]) * self.rate
+
+
+ALGORITHMS = {cls.name: cls for cls in (TokenBucket, GCRA, SlidingWindowCounter, SlidingWindowLog, LeakyBucket)}
+
+
+def make_algorithm(name, limit, period) -> LimitAlgorithm:
+    if name not in ALGORITHMS:
+        raise ValueError(f"unknown algorithm {name!r}, expected one of {', '.join(ALGORITHMS)}")
+    return ALGORITHMS[name](limit, period)
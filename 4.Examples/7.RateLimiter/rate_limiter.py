@@ -1,26 +1,134 @@
-from user_bucket import UserBucket
-from typing import Dict
+from bucket_store import BucketStore
+from limit_algorithms import LimitAlgorithm, make_algorithm
+from typing import Dict, List, Optional, Tuple
+from threading import Lock
+from time import monotonic
 
 class RateLimiter():
     _instance = None
-    def __new__(cls):
+    def __new__(cls, *args, **kwargs):
         if cls._instance is None:
             cls._instance = super(RateLimiter, cls).__new__(cls)
         return cls._instance
     
-    def __init__(self):
+    def __init__(self, idle_ttl=300.0, max_buckets=1_000_000):
         if not hasattr(self, "initialised"):
             self.initialised = True
 
-            # contructor part
-            self.user_buckets : Dict[str, UserBucket] = {}
+            # contructor part - idle full buckets are evicted, see bucket_store.py
+            self.user_buckets = BucketStore(idle_ttl, max_buckets)
 
     def set_user_limit(self, user_id, max_limit, refill_rate):
-        self.user_buckets[user_id] = UserBucket(max_limit, refill_rate)
+        self.user_buckets.set_policy(user_id, max_limit, refill_rate)
+
+    # limit for every user without one of their own
+    def set_default_limit(self, max_limit, refill_rate):
+        self.user_buckets.set_default_policy(max_limit, refill_rate)
     
     def allow_request(self, user_id):
-        if user_id not in self.user_buckets:
+        now = monotonic()
+        bucket = self.user_buckets.get(user_id, now)
+        if bucket is None:
             print(f"{user_id} you are not configured with us !!")
-        if self.user_buckets[user_id].consume_token():
+            return False
+        if bucket.consume_token(now):
             return True
-        print(f"sorry {user_id} you need to waiter longer !!")
\ No newline at end of file
+        print(f"sorry {user_id} you need to waiter longer !!")
+        return False
+
+
+# Thread-safe limiter for serving traffic: buckets are spread over lock-striped
+# shards by user hash, so threads only contend when their users share a shard.
+# No prints on the hot path - unconfigured users are simply denied.
+class ShardedRateLimiter():
+    def __init__(self, shards=64, idle_ttl=300.0, max_buckets=1_000_000):
+        count = 1 << max(0, shards - 1).bit_length()  # power of two, so a mask picks the shard
+        self.mask = count - 1
+        per_shard = -(-max_buckets // count)
+        # (lock, buckets) per shard - one list index on the hot path
+        self.shards: List[Tuple[Lock, BucketStore]] = [(Lock(), BucketStore(idle_ttl, per_shard)) for _ in range(count)]
+
+    def set_user_limit(self, user_id, max_limit, refill_rate):
+        lock, store = self.shards[hash(user_id) & self.mask]
+        with lock:
+            store.set_policy(user_id, max_limit, refill_rate)
+
+    def set_default_limit(self, max_limit, refill_rate):
+        for lock, store in self.shards:
+            with lock:
+                store.set_default_policy(max_limit, refill_rate)
+
+    def allow_request(self, user_id) -> bool:
+        now = monotonic()  # the only clock read of the call
+        lock, store = self.shards[hash(user_id) & self.mask]
+        lock.acquire()  # acquire/release is about half the cost of `with` here
+        try:
+            bucket = store.get(user_id, now)
+            return bucket is not None and bucket.consume_token(now)
+        finally:
+            lock.release()
+
+    # full sweep of every shard, e.g. from a housekeeping thread
+    def sweep(self):
+        now = monotonic()
+        for lock, store in self.shards:
+            with lock:
+                store.sweep(now)
+
+    def bucket_count(self) -> int:
+        return sum(len(store) for _, store in self.shards)
+
+
+# Limiter with a choice of algorithm per policy - token_bucket, gcra,
+# sliding_window, sliding_log or leaky_bucket (see limit_algorithms.py).
+# Users on the same (algorithm, limit, period) share one algorithm instance and
+# its state arrays; a user is a slot in those arrays, not an object. One lock
+# for the whole limiter - ShardedRateLimiter is the one to use under heavy threading.
+class PolicyRateLimiter():
+    def __init__(self, algorithm="gcra"):
+        self.algorithm = algorithm  # for policies set without one
+        self.shared_policies: Dict[Tuple[str, float, float], LimitAlgorithm] = {}
+        self.policies: Dict[str, LimitAlgorithm] = {}
+        self.default_policy: Optional[LimitAlgorithm] = None
+        self.lock = Lock()
+
+    def policy(self, max_limit, refill_rate, algorithm=None) -> LimitAlgorithm:
+        key = (algorithm or self.algorithm, max_limit, refill_rate)
+        policy = self.shared_policies.get(key)
+        if policy is None:
+            policy = self.shared_policies[key] = make_algorithm(*key)
+        return policy
+
+    def set_user_limit(self, user_id, max_limit, refill_rate, algorithm=None):
+        with self.lock:
+            policy = self.policy(max_limit, refill_rate, algorithm)
+            previous = self.policies.get(user_id, self.default_policy)
+            if previous is not None and previous is not policy:
+                previous.release(user_id)  # next request starts from the new policy
+            self.policies[user_id] = policy
+
+    # limit for every user without one of their own
+    def set_default_limit(self, max_limit, refill_rate, algorithm=None):
+        with self.lock:
+            self.default_policy = self.policy(max_limit, refill_rate, algorithm)
+
+    def allow_request(self, user_id) -> bool:
+        now = monotonic()
+        self.lock.acquire()
+        try:
+            policy = self.policies.get(user_id, self.default_policy)
+            return policy is not None and policy.allow(user_id, now)
+        finally:
+            self.lock.release()
+
+    # release every user whose state is back to fresh, e.g. from a housekeeping thread
+    def sweep(self) -> int:
+        now = monotonic()
+        with self.lock:
+            return sum(policy.sweep(now) for policy in self.shared_policies.values())
+
+    def key_count(self) -> int:
+        return sum(len(policy) for policy in self.shared_policies.values())
+
+    def state_bytes(self) -> int:
+        return sum(policy.state_bytes() for policy in self.shared_policies.values())
@@ -0,0 +1,166 @@
+# Throughput benchmark - allow_request calls per second, single- and multi-threaded.
+#
+# Every thread loops over its own slice of a large user population. Users are
+# configured with a generous limit so the measurement is the limiter's own
+# cost, not the refill math of exhausted buckets. The singleton RateLimiter is
+# only measured on one thread (it has no locking) and with its prints on the
+# deny path never hit.
+#
+# CPython runs one thread at a time, so extra threads add no throughput here;
+# what the sharded limiter guarantees is correctness under threads at close to
+# single-threaded speed, and shard locks that stay uncontended on free-threaded
+# builds.
+#
+# memory() shows what idle eviction does to the bucket count for a stream of
+# one-off API keys; algorithms() compares per-key state and call cost of the
+# algorithms in limit_algorithms.py with a UserBucket per key; hierarchy()
+# compares the global/tenant/user limiter with three separate limiters.
+import sys
+import threading
+import time
+import tracemalloc
+
+from bucket_store import BucketStore
+from hierarchical_limiter import HierarchicalRateLimiter
+from limit_algorithms import ALGORITHMS, make_algorithm
+from rate_limiter import RateLimiter, ShardedRateLimiter
+
+
+class RateLimiterBenchmark():
+    def __init__(self, users=10000, calls_per_thread=500000):
+        self.users = [f"user{i}" for i in range(users)]
+        self.calls_per_thread = calls_per_thread
+
+    def configure(self, limiter):
+        for user in self.users:
+            limiter.set_user_limit(user, 10 ** 9, 1)
+
+    def worker(self, limiter, offset):
+        allow = limiter.allow_request
+        users = self.users
+        count = len(users)
+        for i in range(self.calls_per_thread):
+            allow(users[(offset + i) % count])
+
+    def measure(self, limiter, threads):
+        workers = [threading.Thread(target=self.worker, args=(limiter, t * 7919)) for t in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return threads * self.calls_per_thread / (time.perf_counter() - start)
+
+    def run(self):
+        gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+        print(f"Python {sys.version.split()[0]}, GIL {'on' if gil else 'off'}, {len(self.users)} users")
+
+        singleton = RateLimiter()
+        self.configure(singleton)
+        print(f"RateLimiter (singleton, 1 thread): {self.measure(singleton, 1):>12,.0f} calls/s")
+
+        sharded = ShardedRateLimiter(shards=64)
+        self.configure(sharded)
+        for threads in (1, 2, 4, 8):
+            print(f"ShardedRateLimiter, {threads} thread(s):  {self.measure(sharded, threads):>12,.0f} calls/s")
+
+    # Bucket memory for a stream of distinct API keys (1000 new keys/s on a
+    # simulated clock, default policy of 100 requests/minute), with and without
+    # idle eviction.
+    @staticmethod
+    def memory(keys=1_000_000):
+        for label, idle_ttl in (("no eviction", float("inf")), ("idle_ttl=60s", 60.0)):
+            store = BucketStore(idle_ttl=idle_ttl, max_buckets=10 ** 8)
+            store.set_default_policy(100, 60)
+            tracemalloc.start()
+            for i in range(keys):
+                now = i / 1000
+                store.get(f"key{i}", now).consume_token(now)
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{label:>12}: {len(store):>9,} buckets resident after {keys:,} keys, {current / 1e6:7.1f} MB")
+
+    # Bytes per key (state plus the key's dict entry, keys themselves not
+    # counted) and cost per call for keys on a 100 requests/minute policy.
+    @staticmethod
+    def algorithms(keys=100_000, calls=500_000):
+        names = [f"key{i}" for i in range(keys)]
+
+        def report(label, allow):
+            tracemalloc.start()
+            for i, name in enumerate(names):
+                allow(name, i * 1e-4)
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            start = time.perf_counter()
+            for i in range(calls):
+                allow(names[i % keys], 10 + i * 1e-5)
+            elapsed = time.perf_counter() - start
+            print(f"{label:>15}: {current / keys:6.0f} bytes/key, {elapsed / calls * 1e9:4.0f} ns/call")
+
+        store = BucketStore(idle_ttl=float("inf"), max_buckets=10 ** 8)
+        store.set_default_policy(100, 60)
+        report("UserBucket", lambda name, now: store.get(name, now).consume_token(now))
+        for name in ALGORITHMS:
+            report(name, make_algorithm(name, 100, 60).allow)
+
+    # Global, tenant and user caps: one HierarchicalRateLimiter pass against
+    # three ShardedRateLimiters called in turn (user, tenant, global). First
+    # with caps nobody reaches, for the cost of a call; then with tight
+    # tenant caps, where the separate limiters charge users for requests
+    # their tenant refused.
+    @staticmethod
+    def hierarchy(tenants=100, users_per_tenant=100, calls=500_000):
+        users = [f"tenant{t}-user{u}" for t in range(tenants) for u in range(users_per_tenant)]
+        tenant_of = {user: user.split("-")[0] for user in users}
+        order = [users[(i * 7919) % len(users)] for i in range(calls)]
+
+        def hierarchical(user_cap, tenant_cap):
+            limiter = HierarchicalRateLimiter(10 ** 9, 1)
+            for t in range(tenants):
+                limiter.add_tenant(f"tenant{t}", tenant_cap, 3600)
+            for user in users:
+                limiter.add_user(user, tenant_of[user], user_cap, 3600)
+            return limiter
+
+        def separate(user_cap, tenant_cap):
+            user_level, tenant_level, global_level = ShardedRateLimiter(), ShardedRateLimiter(), ShardedRateLimiter()
+            global_level.set_user_limit("global", 10 ** 9, 1)
+            for t in range(tenants):
+                tenant_level.set_user_limit(f"tenant{t}", tenant_cap, 3600)
+            for user in users:
+                user_level.set_user_limit(user, user_cap, 3600)
+            refused_above = [0]  # requests the user level paid for and a level above refused
+
+            def allow(user):
+                if not user_level.allow_request(user):
+                    return False
+                if tenant_level.allow_request(tenant_of[user]) and global_level.allow_request("global"):
+                    return True
+                refused_above[0] += 1
+                return False
+            return allow, refused_above
+
+        def timed(label, allow, keys, note=""):
+            start = time.perf_counter()
+            allowed = sum(map(allow, keys))
+            elapsed = time.perf_counter() - start
+            print(f"{label:>24}: {elapsed / calls * 1e9:5.0f} ns/call, {allowed:>7,} allowed{note}")
+
+        for user_cap, tenant_cap in ((10 ** 9, 10 ** 9), (100, 2000)):
+            print(f"user cap {user_cap:,}, tenant cap {tenant_cap:,}, {users_per_tenant} users per tenant:")
+            limiter = hierarchical(user_cap, tenant_cap)
+            timed("hierarchical, by node", limiter.allow, [limiter.node(user) for user in order])
+            timed("hierarchical, by name", hierarchical(user_cap, tenant_cap).allow_request, order)
+            allow, refused_above = separate(user_cap, tenant_cap)
+            timed("three separate limiters", allow, order)
+            print(f"{'':>24}  separate limiters charged users for {refused_above[0]:,} refused requests")
+
+if __name__ == "__main__":
+    RateLimiterBenchmark().run()
+    RateLimiterBenchmark.memory()
+    RateLimiterBenchmark.algorithms()
+    RateLimiterBenchmark.hierarchy()
+
+
+# python3 4.Examples/7.RateLimiter/rate_limiter_benchmark.py
@@ -0,0 +1,209 @@
+import hashlib
+import multiprocessing
+import os
+import struct
+from multiprocessing import shared_memory
+from time import monotonic
+from typing import List, Optional
+
+# Cross-process limiter - token buckets in a multiprocessing.shared_memory
+# segment, so every worker process on the host enforces the same limit.
+#
+# The segment is an open-addressing table of fixed-size slots, split into
+# `stripes` equal regions. A user's 64-bit key hash picks the region and the
+# home slot in it; lookups probe linearly inside the region only, so one lock
+# per region (a multiprocessing.Lock, shared by every process) covers all
+# reads and writes a call makes - the same lock striping as ShardedRateLimiter.
+#
+# Slot: key hash, flags, tokens, last visit, max_limit, tokens per second.
+# A user with set_user_limit has the policy in the slot (pinned); everyone
+# else gets the default policy kept in the header, which has a lock of its own
+# so no reader sees half of a new default. A key only ever sits in the
+# PROBE_WINDOW slots from its home, so a call looks at a few slots, never the
+# whole region. Slots are never emptied: a new user whose window is taken
+# reuses an unpinned slot in it whose bucket has refilled (nothing lost), or
+# else the one visited longest ago (that user starts over with a full bucket)
+# - size capacity so this stays rare.
+#
+# The buckets use time.monotonic(), which on Linux is one system-wide clock,
+# so processes agree on it. The locks can't be looked up by name: create the
+# limiter in the parent before forking the workers (gunicorn --preload,
+# multiprocessing.Process/Pool), or pass it to a spawned process as an argument.
+MAGIC = b"RLSHM01\n"
+HEADER = struct.Struct("<8sQQdd")  # magic, capacity, stripes, default max_limit, default tokens per second
+SLOT = struct.Struct("<QQdddd")  # key hash, flags, tokens, last, max_limit, tokens per second
+KEY = struct.Struct("<Q")
+PROBE_WINDOW = 16  # slots from the home slot a key may sit in
+EMPTY = 0
+PINNED = 1
+
+
+def key_hash(user_id) -> int:
+    value = int.from_bytes(hashlib.blake2b(str(user_id).encode(), digest_size=8).digest(), "little")
+    return value or 1  # 0 marks an empty slot
+
+
+class SharedRateLimiter():
+    def __init__(self, memory: shared_memory.SharedMemory, locks: List, header_lock, owner: bool):
+        self.memory = memory
+        self.buf = memory.buf
+        magic, self.capacity, self.stripes, _, _ = HEADER.unpack_from(self.buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"shared memory {memory.name} is not a rate limiter table")
+        self.per_stripe = self.capacity // self.stripes
+        self.window = min(PROBE_WINDOW, self.per_stripe)
+        self.locks = locks
+        self.header_lock = header_lock
+        # the creating process unlinks the segment - not its forked children, which inherit this object
+        self.owner_pid = os.getpid() if owner else None
+
+    @staticmethod
+    def create(capacity=1 << 20, stripes=64, name=None) -> 'SharedRateLimiter':
+        per_stripe = -(-capacity // stripes)
+        capacity = per_stripe * stripes
+        memory = shared_memory.SharedMemory(name=name, create=True, size=HEADER.size + capacity * SLOT.size)
+        HEADER.pack_into(memory.buf, 0, MAGIC, capacity, stripes, 0.0, 0.0)
+        # a new segment is zero-filled: every slot starts EMPTY
+        locks = [multiprocessing.Lock() for _ in range(stripes)]
+        return SharedRateLimiter(memory, locks, multiprocessing.Lock(), owner=True)
+
+    # pickled into a spawned worker: reattach to the segment by name, keep the locks
+    def __getstate__(self):
+        return {"name": self.memory.name, "locks": self.locks, "header_lock": self.header_lock}
+
+    def __setstate__(self, state):
+        memory = shared_memory.SharedMemory(name=state["name"])
+        self.__init__(memory, state["locks"], state["header_lock"], owner=False)
+
+    def set_user_limit(self, user_id, max_limit, refill_rate):
+        key = key_hash(user_id)
+        lock = self.locks[key % self.stripes]
+        with lock:
+            offset = self.find(key, insert=True, now=monotonic())
+            SLOT.pack_into(self.buf, offset, key, PINNED, max_limit, monotonic(), max_limit, max_limit / refill_rate)
+
+    # limit for every user without one of their own, in all processes
+    def set_default_limit(self, max_limit, refill_rate):
+        with self.header_lock:
+            HEADER.pack_into(self.buf, 0, MAGIC, self.capacity, self.stripes, max_limit, max_limit / refill_rate)
+
+    def allow_request(self, user_id, cost=1) -> bool:
+        key = key_hash(user_id)
+        now = monotonic()
+        lock = self.locks[key % self.stripes]
+        lock.acquire()
+        try:
+            buf = self.buf
+            offset = self.find(key, insert=True, now=now)
+            if KEY.unpack_from(buf, offset)[0] != key:  # new user: fresh bucket on the default policy
+                with self.header_lock:
+                    _, _, _, max_limit, tokens_per_second = HEADER.unpack_from(buf, 0)
+                if not max_limit:
+                    return False  # not configured
+                flags, current_token, last_time_visited = 0, max_limit, now
+            else:
+                _, flags, current_token, last_time_visited, max_limit, tokens_per_second = SLOT.unpack_from(buf, offset)
+            elapsed_time = now - last_time_visited
+            if elapsed_time > 0:
+                current_token = min(max_limit, current_token + elapsed_time * tokens_per_second)
+                last_time_visited = now
+            allowed = current_token >= cost
+            if allowed:
+                current_token -= cost
+            SLOT.pack_into(buf, offset, key, flags, current_token, last_time_visited, max_limit, tokens_per_second)
+            return allowed
+        finally:
+            lock.release()
+
+    # Offset of the key's slot in its window (hold the region's lock). Without
+    # insert, None if absent. With insert, a slot for a new key if absent: an
+    # empty one, else an unpinned one that is full at `now`, else the unpinned
+    # one visited longest ago.
+    def find(self, key, insert, now=0.0) -> Optional[int]:
+        buf, per_stripe = self.buf, self.per_stripe
+        base = HEADER.size + (key % self.stripes) * per_stripe * SLOT.size
+        home = (key // self.stripes) % per_stripe
+        victim, oldest = None, float("inf")
+        for probe in range(self.window):
+            offset = base + ((home + probe) % per_stripe) * SLOT.size
+            slot_key, flags, current_token, last_time_visited, max_limit, tokens_per_second = SLOT.unpack_from(buf, offset)
+            if slot_key == key:
+                return offset
+            if slot_key == EMPTY:  # keys are placed at the first empty slot, so none is past it
+                return offset if insert else None
+            if insert and not flags & PINNED and oldest > float("-inf"):
+                if current_token + max(0.0, now - last_time_visited) * tokens_per_second >= max_limit:
+                    victim, oldest = offset, float("-inf")  # refilled: same as a fresh bucket
+                elif last_time_visited < oldest:
+                    victim, oldest = offset, last_time_visited
+        if not insert:
+            return None
+        if victim is None:
+            raise MemoryError(f"all {self.window} slots around key {key:#x} hold pinned users; raise capacity")
+        return victim
+
+    def bucket_count(self) -> int:
+        buf = self.buf
+        return sum(KEY.unpack_from(buf, HEADER.size + i * SLOT.size)[0] != EMPTY for i in range(self.capacity))
+
+    def close(self):
+        self.buf = None
+        self.memory.close()
+        if self.owner_pid == os.getpid():
+            self.memory.unlink()
+
+
+# Shared-memory demo: 4 worker processes hammer the same users for a second;
+# together they get one limit's worth, not four
+class SharedRateLimiterDemo():
+    @staticmethod
+    def worker(limiter, users, seconds, results):
+        from time import perf_counter
+        allowed = calls = 0
+        start = perf_counter()
+        while perf_counter() - start < seconds:
+            for user in users:
+                allowed += limiter.allow_request(user)
+                calls += 1
+        results.put((allowed, calls))
+
+    @staticmethod
+    def run():
+        from rate_limiter import ShardedRateLimiter
+
+        users = [f"user{i}" for i in range(100)]
+        workers, seconds = 4, 1.0
+        limiter = SharedRateLimiter.create(capacity=1 << 16, stripes=64)
+        try:
+            limiter.set_default_limit(50, 60)  # 50 requests a minute
+            limiter.set_user_limit("user0", 500, 60)
+            results = multiprocessing.Queue()
+            processes = [multiprocessing.Process(target=SharedRateLimiterDemo.worker,
+                                                 args=(limiter, users, seconds, results)) for _ in range(workers)]
+            for process in processes:
+                process.start()
+            totals = [results.get() for _ in processes]
+            for process in processes:
+                process.join()
+            allowed, calls = sum(t[0] for t in totals), sum(t[1] for t in totals)
+            print(f"shared memory: {workers} processes, {calls:,} calls, {allowed:,} allowed "
+                  f"(limit: 99 users x 50 + 500 = 5,450, plus refill); "
+                  f"{seconds * 1e6 / (calls / workers):.2f} us/call per process")
+            print(f"{limiter.bucket_count()} buckets in the table")
+        finally:
+            limiter.close()
+
+        # what each process enforcing its own limit would have let through
+        local = ShardedRateLimiter()
+        for user in users:
+            local.set_user_limit(user, 500 if user == "user0" else 50, 60)
+        allowed = sum(local.allow_request(user) for _ in range(60) for user in users[1:2])
+        print(f"per-process limiter: {allowed} allowed for user1 in one process - "
+              f"x{workers} processes = {allowed * workers} against a limit of 50")
+
+
+if __name__ == "__main__":
+    SharedRateLimiterDemo.run()
+
+
+# python3 4.Examples/7.RateLimiter/shared_limiter.py
@@ -1,23 +1,55 @@
-from time import time
+from time import monotonic
+
 class UserBucket():
-    def __init__(self, max_limit, refill_rate_token):
+    __slots__ = ('max_limit', 'refill_rate_token', 'tokens_per_second', 'current_token', 'last_time_visited')
+
+    def __init__(self, max_limit, refill_rate_token, now=None):
         self.max_limit = max_limit
         self.refill_rate_token = refill_rate_token
+        # max_limit tokens come back over refill_rate_token seconds
+        self.tokens_per_second = max_limit / refill_rate_token
         self.current_token = max_limit
-        self.last_time_visited = time()
+        self.last_time_visited = monotonic() if now is None else now
 
-    def consume_token(self) -> bool:
-        self.refill_token()
+    # refill and take `cost` tokens (one by default) as one step; now is a
+    # monotonic() reading, so callers that already read the clock don't read it again
+    def consume_token(self, now=None, cost=1) -> bool:
+        if now is None:
+            now = monotonic()
+        current_token = self.current_token
+        elapsed_time = now - self.last_time_visited
+        # a reading older than the last visit (taken before another thread's call) adds nothing
+        if elapsed_time > 0:
+            current_token = min(self.max_limit, current_token + elapsed_time * self.tokens_per_second)
+            self.last_time_visited = now
 
-        if self.current_token >= 1:
-            self.current_token = self.current_token - 1
+        if current_token >= cost:
+            self.current_token = current_token - cost
             return True
+        self.current_token = current_token
         return False
-    
 
+    def refill_token(self, now=None):
+        if now is None:
+            now = monotonic()
+        elapsed_time = now - self.last_time_visited
+        if elapsed_time > 0:
+            cal_token_needed_to_be_added = elapsed_time * self.tokens_per_second
+            self.current_token = min(self.max_limit, self.current_token + cal_token_needed_to_be_added)
+            self.last_time_visited = now
+
+    # refilled to max_limit by now - no state a fresh bucket wouldn't have
+    def is_full(self, now) -> bool:
+        elapsed_time = max(0.0, now - self.last_time_visited)
+        return self.current_token + elapsed_time * self.tokens_per_second >= self.max_limit
 
-    def refill_token(self):
-        elapsed_time = time() - self.last_time_visited
-        cal_token_needed_to_be_added = elapsed_time * (self.max_limit/self.refill_rate_token)
-        self.current_token = min(self.current_token, self.current_token + cal_token_needed_to_be_added)
-        self.last_time_visited = time()
+    # seconds from now until `cost` tokens are there (0 if they are already);
+    # cost over max_limit never fits
+    def wait_time(self, cost=1, now=None) -> float:
+        if now is None:
+            now = monotonic()
+        if cost > self.max_limit:
+            return float("inf")
+        elapsed_time = max(0.0, now - self.last_time_visited)
+        current_token = min(self.max_limit, self.current_token + elapsed_time * self.tokens_per_second)
+        return max(0.0, (cost - current_token) / self.tokens_per_second)